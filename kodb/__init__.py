@@ -4,8 +4,32 @@ import zipfile
 import warnings
 import yaml
 import uuid
+import pickle
 import os
+import sys
 import glob
+import heapq
+import itertools
+import gc
+import hashlib
+import collections
+import collections.abc
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import queue
+import functools
+import marshal
+import mmap
+import shutil
+import struct
+import threading
+import time
+import datetime
+import zlib
+import base64
+import weakref
 
 try:
     import ujson as json
@@ -14,440 +38,5174 @@ except:
     import json
     pass
 
+try:
+    import msgpack
+except:
+    msgpack = None
+
+try:
+    import bz2
+except:
+    bz2 = None
+
+try:
+    import lzma
+except:
+    lzma = None
+
+try:
+    import numpy
+except:
+    numpy = None
+
 KEYS = []
 KEYS.extend(range(48, 57))
 KEYS.extend(range(65, 90))
 KEYS.extend(range(97, 122))
 
 
-class KoDB():
+class Ko_Codec(object):
+    """KoDB's Document Codec
+
+        Serializes documents into archive members, every member is
+            tagged with the name of the codec that wrote it. With
+            buffers set, loads() is given memoryviews of the mapped
+            archive instead of bytes."""
+    name = None
+    buffers = False
+
+    def dumps(self, data):
+        raise NotImplementedError
+
+
+    def loads(self, raw, load_type):
+        raise NotImplementedError
+
+
+
+class Ko_YAMLCodec(Ko_Codec):
+    name = "yaml"
+    buffers = True
+    # libyaml's emitter writes the same text about 3x faster, when
+    #   PyYAML was built with it
+    dumper = getattr(yaml, "CDumper", yaml.Dumper)
+
+    def dumps(self, data):
+        return yaml.dump(dict(data), Dumper=self.dumper).encode("utf-8")
+
+
+    def loads(self, raw, load_type):
+        # The reader decodes bytes itself, a str is parsed as is
+        raw = str(raw, "utf-8")
+        if load_type == "load":
+            return yaml.load(raw, Loader=yaml.Loader)
+        return getattr(yaml, load_type)(raw)
+
+
+
+class Ko_JSONCodec(Ko_Codec):
+    name = "json"
+    buffers = True
+
+    def dumps(self, data):
+        return json.dumps(dict(data)).encode("utf-8")
+
+
+    def loads(self, raw, load_type):
+        return json.loads(str(raw, "utf-8"))
+
+
+
+class Ko_MsgpackCodec(Ko_Codec):
+    name = "msgpack"
+    buffers = True
+
+    def dumps(self, data):
+        if msgpack is None:
+            raise ImportError("The msgpack codec requires the msgpack package.")
+        return msgpack.packb(dict(data), use_bin_type=True)
+
+
+    def loads(self, raw, load_type):
+        if msgpack is None:
+            raise ImportError("The msgpack codec requires the msgpack package.")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+
+class Ko_PickleCodec(Ko_Codec):
+    name = "pickle"
+    buffers = True
+
+    def dumps(self, data):
+        return pickle.dumps(dict(data), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+    def loads(self, raw, load_type):
+        # Unpickling runs arbitrary code, same rule as yaml object loading
+        if load_type == "safe_load":
+            raise ValueError("Pickled documents can't be safe loaded, use load_type='load'.")
+        return pickle.loads(raw)
+
+
+
+CODECS = {}
+
+def register_codec(codec):
+    """register_codec(Ko_Codec:codec)
+
+        Makes a codec available to the codec= options."""
+    CODECS[codec.name] = codec
+
+
+for codec in (Ko_YAMLCodec(), Ko_JSONCodec(), Ko_MsgpackCodec(), Ko_PickleCodec()):
+    register_codec(codec)
+
+
+COMPRESSION = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+# Documents a table collects before its compression dictionary is built
+COMPRESSION_DICT_SAMPLES = 64
+# zlib only looks back 32KB
+COMPRESSION_DICT_SIZE = 32768
+
+
+def ko_build_dict(payloads):
+    """INTERNAL FUNCTION
+
+        Builds a deflate preset dictionary out of sample documents,
+            zlib favours the end of the dictionary so it is filled
+            from the back."""
+    samples = []
+    size = 0
+    for payload in payloads:
+        sample = payload[:1024]
+        samples.append(sample)
+        size += len(sample)
+        if size >= COMPRESSION_DICT_SIZE:
+            break
+    return b"".join(reversed(samples))[-COMPRESSION_DICT_SIZE:]
+
+
+def ko_sizeof(data):
+    """ko_sizeof(Object:data)
+
+        Approximates the memory held by a decoded document."""
+    size = sys.getsizeof(data)
+    if isinstance(data, dict):
+        for k, v in data.items():
+            size += ko_sizeof(k) + ko_sizeof(v)
+    elif isinstance(data, (list, tuple, set)):
+        for v in data:
+            size += ko_sizeof(v)
+    return size
+
+
+
+class Ko_Cache(object):
+    """KoDB's Document Cache
+
+        A per table LRU of decoded documents bounded by entries and/or
+            approximate bytes, pinned tables are never evicted."""
+    def __init__(self, max_entries=None, max_bytes=None, pinned=()):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned)
+        self.tables = {}
+        self.sizes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, table, fid, count_miss=True):
+        with self.lock:
+            entries = self.tables.get(table)
+            if entries is None or fid not in entries:
+                if count_miss:
+                    self.misses += 1
+                return None
+
+            entries.move_to_end(fid)
+            self.hits += 1
+            return entries[fid][0]
+
+
+    def put(self, table, fid, data):
+        size = ko_sizeof(data) if self.max_bytes is not None else 0
+        with self.lock:
+            entries = self.tables.setdefault(table, collections.OrderedDict())
+            if fid in entries:
+                self.sizes[table] -= entries[fid][1]
+            entries[fid] = (data, size)
+            entries.move_to_end(fid)
+            self.sizes[table] = self.sizes.get(table, 0) + size
+
+            if table in self.pinned:
+                return
+
+            while entries and self.full(table, 0):
+                _, (_, evicted) = entries.popitem(last=False)
+                self.sizes[table] -= evicted
+                self.evictions += 1
+
+
+    def discard(self, table, fid):
+        with self.lock:
+            entries = self.tables.get(table)
+            if entries is not None and fid in entries:
+                self.sizes[table] -= entries.pop(fid)[1]
+
+
+    def drop(self, table):
+        with self.lock:
+            self.tables.pop(table, None)
+            self.sizes.pop(table, None)
+
+
+    def full(self, table, headroom=1):
+        """Returns True if adding headroom entries would go over budget."""
+        if table in self.pinned:
+            return False
+
+        entries = self.tables.get(table, ())
+        if self.max_entries is not None and len(entries) + headroom > self.max_entries:
+            return True
+        if self.max_bytes is not None and self.sizes.get(table, 0) > self.max_bytes:
+            return True
+        return False
+
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "tables": {table: {"entries": len(entries), "bytes": self.sizes.get(table, 0)}
+                       for table, entries in self.tables.items()},
+        }
+
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+
+# magic, format version, python version (marshal's format follows it),
+# archive size and mtime, meta chunk count, index section size, member count
+MANIFEST_HEADER = struct.Struct("<4sHBBQqIQQ")
+MANIFEST_VERSION = 5
+# member name hash, header offset, compressed size, compression, comment
+MANIFEST_MEMBER = struct.Struct("<16sQQHH")
+
+Ko_Member = collections.namedtuple("Ko_Member", ["header_offset", "compress_size", "compress_type", "comment"])
+
+
+def ko_member_key(name):
+    """INTERNAL FUNCTION"""
+    return hashlib.blake2b(name.encode("utf-8"), digest_size=16).digest()
+
+
+class Ko_Members(object):
+    """KoDB's Manifest Member Table
+
+        The archive member offsets of a manifest, kept as sorted fixed
+            width records in the mapped file and binary searched on
+            lookup instead of being decoded up front."""
+
+    def __init__(self, data, offset, count, comments):
+        self.data = data
+        self.offset = offset
+        self.count = count
+        self.comments = comments
+
+
+    def __getitem__(self, name):
+        key = ko_member_key(name)
+        target = int.from_bytes(key[:8], "big")
+        data, size = self.data, MANIFEST_MEMBER.size
+        # Every key in [low, high) starts between low_value and high_value
+        low, high = 0, self.count
+        low_value, high_value = 0, 1 << 64
+        while low < high:
+            # The keys are uniform hashes, interpolating finds a key in a
+            #   couple of probes where halving takes log2(count)
+            middle = low + (target - low_value) * (high - low) // (high_value - low_value)
+            middle = min(max(middle, low), high - 1)
+            position = self.offset + middle * size
+            probe = data[position:position + 16]
+            if probe < key:
+                low = middle + 1
+                low_value = int.from_bytes(probe[:8], "big")
+            elif probe > key:
+                high = middle
+                high_value = int.from_bytes(probe[:8], "big") + 1
+            else:
+                _, header_offset, compress_size, compress_type, comment = MANIFEST_MEMBER.unpack_from(data, position)
+                return Ko_Member(header_offset, compress_size, compress_type, self.comments[comment])
+        raise KeyError(name)
+
+
+    def close(self):
+        self.data.close()
+
+
+class Ko_MetaChunks(object):
+    """KoDB's Meta Chunk List
+
+        Stands in for the meta chunk list when the database is loaded
+            from its manifest, a chunk is read from disk the first
+            time it's accessed."""
+
+    def __init__(self, loader, count):
+        self.loader = loader
+        self.chunks = [None] * count
+
+
+    def __getitem__(self, meta_chunk):
+        if meta_chunk < 0:
+            meta_chunk += len(self.chunks)
+        chunk = self.chunks[meta_chunk]
+        if chunk is None:
+            chunk = self.chunks[meta_chunk] = self.loader(meta_chunk)
+        return chunk
+
+
+    def __len__(self):
+        return len(self.chunks)
+
+
+    def __iter__(self):
+        for meta_chunk in range(0, len(self.chunks)):
+            yield self[meta_chunk]
+
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+
+
+@contextlib.contextmanager
+def ko_gc_paused():
+    """INTERNAL FUNCTION
+
+        Holds off the cyclic garbage collector while a large, acyclic
+            structure is being built."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+@contextlib.contextmanager
+def ko_file_lock(path, timeout = 10):
+    """INTERNAL FUNCTION
+
+        Holds a lock file between processes, a lock file older than
+            timeout seconds is left over from a crash and taken over."""
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > timeout:
+                    os.remove(path)
+            except OSError:
+                pass
+            time.sleep(0.005)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def ko_string_id(fid):
+    """INTERNAL FUNCTION
+
+        Returns an id the way it comes back from a json meta chunk, ids
+            stored as numbers are kept as their string."""
+    return fid if isinstance(fid, str) else str(fid)
+
+
+def ko_string_keys(ids):
+    """INTERNAL FUNCTION
+
+        Returns the ids keyed the way they come back from a json meta
+            chunk."""
+    if all(isinstance(fid, str) for fid in ids):
+        return ids
+    return {ko_string_id(fid): value for fid, value in ids.items()}
+
+
+# Version 1 uuids count 100ns ticks from 1582-10-15 instead of 1970
+UUID_EPOCH = 0x01b21dd213814000
+# Prefix of the tombstone versions, deleted documents keep the time of the delete
+TOMBSTONE = "~"
+
+
+def ko_time_uid(ticks, clock_seq, node):
+    """INTERNAL FUNCTION
+
+        Returns the version 1 uuid of ticks (100ns since 1970), so a
+            document version carries the time it was stored."""
+    timestamp = ticks + UUID_EPOCH
+    return str(uuid.UUID(fields=(timestamp & 0xffffffff, (timestamp >> 32) & 0xffff, (timestamp >> 48) & 0x0fff,
+                                 (clock_seq >> 8) & 0x3f, clock_seq & 0xff, node), version=1))
+
+
+def ko_version_ticks(version):
+    """INTERNAL FUNCTION
+
+        Returns the ticks a version was stored or deleted at, None for
+            the random uuids and tombstones that predate them."""
+    if version is None:
+        return None
+    if version[0] == TOMBSTONE:
+        version = version[1:]
+    if len(version) != 36 or version[14] != "1":
+        return None
+    return int(version[15:18] + version[9:13] + version[0:8], 16) - UUID_EPOCH
+
+
+def ko_is_tombstone(version):
+    """INTERNAL FUNCTION"""
+    return version is None or version[0] == TOMBSTONE
+
+
+def ko_version_at(versions, ticks):
+    """INTERNAL FUNCTION
+
+        Returns the newest of the versions (newest first) stored at or
+            before ticks. Versions without a time are older than any."""
+    for version in versions:
+        version_ticks = ko_version_ticks(version)
+        if version_ticks is None or version_ticks <= ticks:
+            return version
+    return None
+
+
+def ko_ticks(as_of):
+    """INTERNAL FUNCTION
+
+        Returns the ticks of a unix timestamp, a datetime or a
+            snapshot."""
+    if isinstance(as_of, Ko_Snapshot):
+        return as_of.ticks
+    if hasattr(as_of, "timestamp"):
+        as_of = as_of.timestamp()
+    return int(round(as_of * 10 ** 7))
+
+
+# Ids read per hold of the read lock while scanning the sorted id index
+SCAN_BATCH = 256
+# The layout file of a sharded database folder
+SHARDS_FILE = "KO_SHARDS"
+# Documents copied per store_many by migrate()
+MIGRATE_BATCH = 1000
+# Documents written to the archive at a time by import_jsonl() and backup()
+BULK_BATCH = 1000
+# Smallest table a parallel scan runs on, starting the worker processes
+#   takes about as long as decoding this many yaml documents
+PARALLEL_MIN_DOCUMENTS = 1000
+# Database folders opened in this process, {real path: database}. The values
+#   are weak so a handle that's dropped without close() gives its folder back
+OPEN_FOLDERS = weakref.WeakValueDictionary()
+OPEN_FOLDERS_LOCK = threading.Lock()
+
+
+def ko_shard_number(fid, shards):
+    """INTERNAL FUNCTION
+
+        Returns the hash partition of an id, stable across processes
+            and for an id stored as a number or its string."""
+    if shards == 1:
+        return 0
+    return zlib.crc32(str(fid).encode("utf-8")) % shards
+
+
+def ko_read_jsonl(path, id_field):
+    """INTERNAL FUNCTION
+
+        Yields the (id, document) pairs of a JSON Lines file, an _id
+            id_field is taken out of the documents."""
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            document = json.loads(line)
+            if not isinstance(document, dict) or id_field not in document:
+                raise ValueError("{}:{} has no {} field".format(path, number, id_field))
+            fid = document.pop(id_field) if id_field == "_id" else document[id_field]
+            yield ko_string_id(fid), document
+
+
+def ko_prefix_end(prefix):
+    """INTERNAL FUNCTION
+
+        Returns the first string after every string starting with
+            prefix, None if there is none."""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def ko_read_member(fp, header_offset, compress_size, compress_type):
+    """ko_read_member(File:fp, Int:header_offset, Int:compress_size, Int:compress_type)
+
+        Reads an archive member straight from its local header, without
+            a ZipFile or its central directory."""
+    fp.seek(header_offset)
+    header = LOCAL_HEADER.unpack(fp.read(LOCAL_HEADER.size))
+    fp.seek(header_offset + LOCAL_HEADER.size + header[9] + header[10])
+    raw = fp.read(compress_size)
+    if compress_type == zipfile.ZIP_STORED:
+        return raw
+    return ko_decompress(raw, compress_type)
+
+
+def ko_map_member(mapping, header_offset, compress_size, compress_type):
+    """ko_map_member(mmap:mapping, Int:header_offset, Int:compress_size, Int:compress_type)
+
+        Returns an archive member as a memoryview of the mapped archive,
+            or its decompressed bytes. Returns None if the member ends
+            past the mapping."""
+    header = LOCAL_HEADER.unpack_from(mapping, header_offset)
+    start = header_offset + LOCAL_HEADER.size + header[9] + header[10]
+    if start + compress_size > len(mapping):
+        return None
+    raw = memoryview(mapping)[start:start + compress_size]
+    if compress_type == zipfile.ZIP_STORED:
+        return raw
+    return ko_decompress(raw, compress_type)
+
+
+def ko_decompress(raw, compress_type):
+    """INTERNAL FUNCTION
+
+        Decompresses a member's data by its zip compression method."""
+    if compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(raw)
+    if compress_type == zipfile.ZIP_BZIP2:
+        if bz2 is None:
+            raise RuntimeError("Reading bzip2 members requires the bz2 module.")
+        return bz2.BZ2Decompressor().decompress(raw)
+    if compress_type == zipfile.ZIP_LZMA:
+        if lzma is None:
+            raise RuntimeError("Reading lzma members requires the lzma module.")
+        # The data starts with the lzma version and the size of the raw
+        #   LZMA1 properties that follow, a packed lc/lp/pb byte and the
+        #   dictionary size
+        size = struct.unpack_from("<H", raw, 2)[0]
+        packed, dict_size = struct.unpack_from("<BI", raw, 4)
+        lzma1 = {"id": lzma.FILTER_LZMA1, "dict_size": dict_size,
+                 "lc": packed % 9, "lp": packed // 9 % 5, "pb": packed // 45}
+        return lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[lzma1]).decompress(raw[4 + size:])
+    raise NotImplementedError("Unsupported compression method {}".format(compress_type))
+
+
+def ko_member_tag(comment):
+    """INTERNAL FUNCTION
+
+        Returns the (codec, compression dictionary) an archive member
+            is tagged with."""
+    codec, _, zdict = comment.decode("utf-8").partition("|")
+    return codec or "yaml", zdict or None
+
+
+def ko_inflate(raw, zdict):
+    """INTERNAL FUNCTION"""
+    return zlib.decompressobj(-zlib.MAX_WBITS, zdict=zdict).decompress(raw)
+
+
+def ko_decode_batch(path, load_type, batch, search_func, dicts):
+    """INTERNAL FUNCTION
+
+        Process pool worker, decodes a batch of (id, header_offset,
+            compress_size, compress_type, comment) members and returns
+            the (id, document) pairs that match search_func."""
+    result = []
+    with open(path, "rb") as fp:
+        for fid, header_offset, compress_size, compress_type, comment in batch:
+            codec, zdict = ko_member_tag(comment)
+            raw = ko_read_member(fp, header_offset, compress_size, compress_type)
+            if zdict is not None:
+                raw = ko_inflate(raw, dicts[zdict])
+            data = CODECS[codec].loads(raw, load_type)
+            if search_func is None or search_func(Ko_Document(data, fid)):
+                result.append((fid, data))
+    return result
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+METRICS_BUCKETS = [m * 10 ** e for e in range(-6, 2) for m in (1, 2.5, 5)]
+
+# (operation, method, bytes counter, bytes of (args, result))
+METRICS_OPERATIONS = [
+    ("store", "store", None, None),
+    ("store_many", "store_many", None, None),
+    ("get", "get", None, None),
+    ("get_many", "get_many", None, None),
+    ("exists", "exists", None, None),
+    ("delete", "delete", None, None),
+    ("delete_many", "delete_many", None, None),
+    ("find", "find", None, None),
+    ("select", "select", None, None),
+    ("aggregate", "count", None, None),
+    ("aggregate", "sum", None, None),
+    ("aggregate", "min", None, None),
+    ("aggregate", "max", None, None),
+    ("aggregate", "group_by", None, None),
+    ("import", "import_jsonl", None, None),
+    ("export", "export_jsonl", None, None),
+    ("backup", "backup", None, None),
+    ("commit", "commit", None, None),
+    ("init_meta", "init_meta", None, None),
+    ("init_manifest", "init_manifest", None, None),
+    ("get_meta", "get_meta", None, None),
+    ("read", "ko_read_raw", "bytes_read", lambda args, result: len(result[1])),
+    ("decode", "ko_decode", None, None),
+    ("write", "ko_write_document", "bytes_written", lambda args, result: len(args[3])),
+    ("write_file", "ko_write_file", "bytes_written", lambda args, result: len(args[1])),
+]
+
+
+class Ko_Metrics(object):
+    """KoDB's Metrics
+
+        Per operation counts and latency histograms, recorded by
+            wrapping the methods of a database instance so that a
+            database without metrics runs the plain methods."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.counters = {"bytes_read": 0, "bytes_written": 0}
+        self.hooks = []
+
+
+    def instrument(self, database):
+        for operation, method, counter, measure in METRICS_OPERATIONS:
+            setattr(database, method, self.wrap(operation, getattr(database, method), counter, measure))
+
+
+    def wrap(self, operation, method, counter, measure):
+        """Returns method timed as operation."""
+        record = self.record
+
+        def KO_timed(*args, **kwargs):
+            then = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                record(operation, time.perf_counter() - then, error=True)
+                raise
+            record(operation, time.perf_counter() - then,
+                   counter, measure(args, result) if measure is not None else 0)
+            return result
+
+        return KO_timed
+
+
+    def timed_iter(self, operation, iterator):
+        """Yields from iterator, timed as operation once it's exhausted."""
+        then = time.perf_counter()
+        yield from iterator
+        self.record(operation, time.perf_counter() - then)
+
+
+    def record(self, operation, seconds, counter = None, size = 0, error = False):
+        with self.lock:
+            entry = self.operations.get(operation)
+            if entry is None:
+                entry = self.operations[operation] = {"count": 0, "errors": 0, "seconds": 0.0,
+                                                      "min": seconds, "max": seconds,
+                                                      "histogram": [0] * (len(METRICS_BUCKETS) + 1)}
+            entry["count"] += 1
+            entry["errors"] += error
+            entry["seconds"] += seconds
+            entry["min"] = min(entry["min"], seconds)
+            entry["max"] = max(entry["max"], seconds)
+            entry["histogram"][bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+            if counter is not None:
+                self.counters[counter] += size
+
+        for hook in self.hooks:
+            hook(operation, seconds, size)
+
+
+    def snapshot(self):
+        """Returns a copy of the metrics, the histograms as
+            [[upper bound in seconds (None is unbounded), count], ...]
+            of the non-empty buckets."""
+        with self.lock:
+            operations = {}
+            for operation, entry in self.operations.items():
+                entry = dict(entry)
+                entry["mean"] = entry["seconds"] / entry["count"]
+                entry["histogram"] = [[(METRICS_BUCKETS + [None])[bucket], count]
+                                      for bucket, count in enumerate(entry["histogram"]) if count]
+                operations[operation] = entry
+            return {"operations": operations, "counters": dict(self.counters)}
+
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+            self.counters = {name: 0 for name in self.counters}
+
+
+class Ko_RWLock(object):
+    """KoDB's Readers-Writer Lock
+
+        `with lock:` takes the exclusive write side and `with lock.read:`
+            the shared read side. Waiting writers go first, but a
+            writer that lets go waits for the others, readers or
+            writers, to get a turn. Both sides are re-entrant and a
+            writer may read, but a reader can't upgrade to a writer."""
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = None
+        self.writes = 0
+        self.waiting = 0
+        self.waiting_readers = 0
+        # The last writer while others were waiting, it can't cut in
+        self.handoff = None
+        self.local = threading.local()
+        self.read = Ko_ReadLock(self)
+
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.writes += 1
+                return
+            if getattr(self.local, "reads", None):
+                raise RuntimeError("A read lock can't be upgraded to a write lock.")
+
+            self.waiting += 1
+            try:
+                while self.writer is not None or self.readers or \
+                        (self.handoff == me and (self.waiting > 1 or self.waiting_readers)):
+                    self.condition.wait()
+            finally:
+                self.waiting -= 1
+            self.writer = me
+            self.handoff = None
+            self.writes = 1
+
+
+    def release(self):
+        with self.condition:
+            self.writes -= 1
+            if not self.writes:
+                self.writer = None
+                self.handoff = threading.get_ident() if self.waiting or self.waiting_readers else None
+                self.condition.notify_all()
+
+
+    def acquire_read(self):
+        reads = getattr(self.local, "reads", None)
+        if reads is None:
+            reads = self.local.reads = []
+
+        # Nested reads and reads under our own write don't wait
+        if reads or self.writer == threading.get_ident():
+            reads.append(False)
+            return
+
+        with self.condition:
+            self.waiting_readers += 1
+            try:
+                while self.writer is not None or (self.waiting and self.handoff is None):
+                    self.condition.wait()
+            finally:
+                self.waiting_readers -= 1
+            self.readers += 1
+            self.handoff = None
+        reads.append(True)
+
+
+    def release_read(self):
+        if self.local.reads.pop():
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+
+    def __enter__(self):
+        self.acquire()
+
+
+    def __exit__(self, *args):
+        self.release()
+
+
+
+class Ko_ReadLock(object):
+    """INTERNAL CLASS, the read side of a Ko_RWLock"""
+    def __init__(self, lock):
+        self.lock = lock
+
+
+    def __enter__(self):
+        self.lock.acquire_read()
+
+
+    def __exit__(self, *args):
+        self.lock.release_read()
+
+
+
+class Ko_Writer(object):
+    """KoDB's Dedicated Writer
+
+        Runs the writes queued by any thread on a single thread, every
+            batch of queued writes shares one commit."""
+    def __init__(self, database):
+        self.database = database
+        self.queue = queue.Queue()
+        # Set with the closing None queued, nothing is queued after it
+        self.closed = False
+        self.closed_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        with self.closed_lock:
+            if self.closed:
+                future.set_exception(ValueError("The database {} is closed".format(self.database.KO_FOLDER)))
+            else:
+                self.queue.put((future, function, args))
+        return future
+
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            with self.database.KO_LOCK:
+                for item in batch:
+                    if item is None:
+                        continue
+                    future, function, args = item
+                    try:
+                        results.append((future, function(*args), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+
+                try:
+                    self.database.ko_flush_writes()
+                except Exception as e:
+                    results = [(future, None, e) for future, _, _ in results]
+
+            # Only resolved once the batch is committed
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+            if None in batch:
+                self.ko_fail_pending()
+                return
+
+
+    def ko_fail_pending(self):
+        """INTERNAL FUNCTION
+
+            Fails the writes still queued once the writer has stopped."""
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[0].set_exception(ValueError("The database {} is closed".format(self.database.KO_FOLDER)))
+
+
+    def close(self):
+        with self.closed_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
+
+
+
+MISSING = object()
+
+def ko_field(data, field):
+    """ko_field(Dict:data, String:field)
+
+        Returns the value of a dotted field path (ex.: price.value),
+            or MISSING if the document doesn't have it."""
+    for part in field.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return MISSING
+        data = data[part]
+    return data
+
+
+def ko_hashable(value):
+    """INTERNAL FUNCTION"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, ko_hashable(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(ko_hashable(v) for v in value)
+    return value
+
+
+def ko_sort_key(value):
+    """INTERNAL FUNCTION
+
+        Orders values of mixed types, numbers before strings before
+            dates before datetimes before everything else."""
+    if isinstance(value, (int, float)):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    if isinstance(value, datetime.datetime):
+        return (3, value.isoformat())
+    if isinstance(value, datetime.date):
+        return (2, value.isoformat())
+    return (4, repr(value))
+
+
+QUERY_OPERATORS = {
+    "$eq": lambda x, y: x == y,
+    "$ne": lambda x, y: x != y,
+    "$gt": lambda x, y: x > y,
+    "$gte": lambda x, y: x >= y,
+    "$lt": lambda x, y: x < y,
+    "$lte": lambda x, y: x <= y,
+    "$in": lambda x, y: x in y,
+}
+
+def ko_match(data, field, condition):
+    """INTERNAL FUNCTION
+
+        Checks a find() criterion against a document."""
+    value = ko_field(data, field)
+    if value is MISSING:
+        return False
+    return ko_match_value(value, condition)
+
+
+def ko_match_value(value, condition):
+    """INTERNAL FUNCTION"""
+    if not isinstance(condition, dict) or not condition or \
+            not all(op in QUERY_OPERATORS for op in condition):
+        condition = {"$eq": condition}
+
+    try:
+        return all(QUERY_OPERATORS[op](value, operand) for op, operand in condition.items())
+    except TypeError:
+        return False
+
+
+def ko_is_number(value):
+    """INTERNAL FUNCTION"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def ko_is_json(value):
+    """INTERNAL FUNCTION
+
+        Whether json brings a value back as it was."""
+    if type(value) is list:
+        return all(ko_is_json(x) for x in value)
+    if type(value) is dict:
+        return all(type(key) is str and ko_is_json(x) for key, x in value.items())
+    return value is None or type(value) in (str, int, float, bool)
+
+
+def ko_sum(values):
+    """INTERNAL FUNCTION
+
+        Sums the numbers among values, other values are skipped."""
+    return sum(value for value in values if ko_is_number(value))
+
+
+def ko_min(values):
+    """INTERNAL FUNCTION
+
+        Returns the smallest of values in ko_sort_key order, None if
+            there aren't any."""
+    values = [value for value in values if value is not MISSING and value is not None]
+    return min(values, key=ko_sort_key) if values else None
+
+
+def ko_max(values):
+    """INTERNAL FUNCTION"""
+    values = [value for value in values if value is not MISSING and value is not None]
+    return max(values, key=ko_sort_key) if values else None
+
+
+# group_by aggregates, (aggregate of a group's values, merge of two partial results)
+AGGREGATES = {
+    "count": (len, lambda x, y: x + y),
+    "sum": (ko_sum, lambda x, y: x + y),
+    "min": (ko_min, lambda x, y: ko_min([x, y])),
+    "max": (ko_max, lambda x, y: ko_max([x, y])),
+}
+
+
+
+class Ko_Index(object):
+    """KoDB's Secondary Field Index
+
+        Maps the values of a (dotted) field to document ids. Sorted
+            indexes also answer range conditions. The index is persisted
+            as an append-only journal of [id, value] lines, values json
+            can't carry (dates, tuples...) are written with the table's
+            codec as [id, null, codec, base64 payload]."""
+    def __new__(cls, field, kind, *args, **kwargs):
+        if cls is Ko_Index and kind == "column":
+            return super().__new__(Ko_Column)
+        return super().__new__(cls)
+
+
+    def __init__(self, field, kind, path, codec, load_type = "safe_load"):
+        self.field = field
+        self.kind = kind
+        self.path = path
+        self.codec = codec
+        self.load_type = load_type
+        self.values = {}
+        self.reverse = {}
+        self.keys = []
+        self.pending = []
+        self.journal_size = 0
+
+
+    def update(self, fid, value, journal=True):
+        if fid in self.reverse:
+            self.remove(fid, journal=False)
+
+        if value is not MISSING:
+            key = ko_hashable(value)
+            ids = self.values.get(key)
+            if ids is None:
+                ids = self.values[key] = set()
+                if self.kind == "sorted":
+                    bisect.insort(self.keys, (ko_sort_key(key), key))
+            ids.add(fid)
+            self.reverse[fid] = value
+
+        if journal:
+            self.pending.append([fid] if value is MISSING else [fid, value])
+
+
+    def remove(self, fid, journal=True):
+        if fid not in self.reverse:
+            return
+
+        key = ko_hashable(self.reverse.pop(fid))
+        ids = self.values[key]
+        ids.discard(fid)
+        if not ids:
+            del self.values[key]
+            if self.kind == "sorted":
+                del self.keys[bisect.bisect_left(self.keys, (ko_sort_key(key), key))]
+
+        if journal:
+            self.pending.append([fid])
+
+
+    def lookup(self, condition):
+        """Returns the ids matching a condition, or None if the index
+            can't answer it."""
+        if not isinstance(condition, dict) or not condition or \
+                not all(op in QUERY_OPERATORS for op in condition):
+            condition = {"$eq": condition}
+
+        if "$eq" in condition:
+            return set(self.values.get(ko_hashable(condition["$eq"]), ()))
+        if "$in" in condition:
+            ids = set()
+            for value in condition["$in"]:
+                ids.update(self.values.get(ko_hashable(value), ()))
+            return ids
+        if self.kind != "sorted" or "$ne" in condition:
+            return None
+
+        # Range conditions only cover values of the bound's type
+        order = ko_sort_key(next(iter(condition.values())))[0]
+        low = bisect.bisect_left(self.keys, ((order,),))
+        high = bisect.bisect_left(self.keys, ((order + 1,),))
+        for op, operand in condition.items():
+            bound = (ko_sort_key(operand),)
+            if op == "$gt":
+                low = max(low, bisect.bisect_right(self.keys, (bound[0], ko_hashable(operand))))
+            elif op == "$gte":
+                low = max(low, bisect.bisect_left(self.keys, bound))
+            elif op == "$lt":
+                high = min(high, bisect.bisect_left(self.keys, bound))
+            elif op == "$lte":
+                high = min(high, bisect.bisect_right(self.keys, (bound[0], ko_hashable(operand))))
+
+        ids = set()
+        for sort_key, key in self.keys[low:high]:
+            ids.update(self.values[key])
+        return ids
+
+
+    def match(self, condition):
+        """Returns the ids matching a condition, checking every indexed
+            value."""
+        return {fid for fid, value in self.reverse.items() if ko_match_value(value, condition)}
+
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if len(entry) == 1:
+                    value = MISSING
+                elif len(entry) == 4:
+                    value = CODECS[entry[2]].loads(base64.b64decode(entry[3]), self.load_type)["value"]
+                else:
+                    value = entry[1]
+                # Ids come back as strings from the meta chunks
+                self.update(str(entry[0]), value, journal=False)
+                self.journal_size += 1
+
+
+    def ko_journal_line(self, entry):
+        """INTERNAL FUNCTION"""
+        if len(entry) == 1 or ko_is_json(entry[1]):
+            return json.dumps(entry) + "\n"
+        payload = base64.b64encode(self.codec.dumps({"value": entry[1]})).decode("ascii")
+        return json.dumps([entry[0], None, self.codec.name, payload]) + "\n"
+
+
+    def flush(self):
+        """Appends the pending journal lines, rewrites the journal once
+            it's mostly superseded entries."""
+        if not self.pending:
+            return
+
+        self.journal_size += len(self.pending)
+        if self.journal_size > 2 * len(self.reverse) + 1000:
+            self.snapshot()
+            return
+
+        with open(self.path, "a") as f:
+            f.write("".join(self.ko_journal_line(entry) for entry in self.pending))
+        self.pending = []
+
+
+    def snapshot(self):
+        with open("{}.tmp".format(self.path), "w") as f:
+            for fid, value in self.reverse.items():
+                f.write(self.ko_journal_line([fid, value]))
+        os.replace("{}.tmp".format(self.path), self.path)
+        self.journal_size = len(self.reverse)
+        self.pending = []
+
+
+class Ko_Column(Ko_Index):
+    """KoDB's Column
+
+        An index of kind column, keeps a field's values by document id
+            for select() and the aggregates without the value to ids
+            maps. Conditions on a numeric column run vectorized over a
+            numpy array when numpy is installed."""
+    def __init__(self, field, kind, path, codec, load_type = "safe_load"):
+        super().__init__(field, kind, path, codec, load_type)
+        # (ids, values) numpy arrays, built by the first vectorized match
+        self.arrays = None
+
+
+    def update(self, fid, value, journal=True):
+        if value is MISSING:
+            self.reverse.pop(fid, None)
+        else:
+            self.reverse[fid] = value
+        self.arrays = None
+
+        if journal:
+            self.pending.append([fid] if value is MISSING else [fid, value])
+
+
+    def remove(self, fid, journal=True):
+        if fid not in self.reverse:
+            return
+
+        del self.reverse[fid]
+        self.arrays = None
+        if journal:
+            self.pending.append([fid])
+
+
+    def lookup(self, condition):
+        return self.match(condition)
+
+
+    def match(self, condition):
+        if not isinstance(condition, dict) or not condition or \
+                not all(op in QUERY_OPERATORS for op in condition):
+            condition = {"$eq": condition}
+
+        operands = [y for op, x in condition.items() for y in (x if op == "$in" else [x])]
+        arrays = self.ko_arrays() if all(ko_is_number(x) for x in operands) else None
+        if arrays is None:
+            return super().match(condition)
+
+        ids, values = arrays
+        mask = numpy.ones(len(values), dtype=bool)
+        for op, operand in condition.items():
+            if op == "$in":
+                mask &= numpy.isin(values, list(operand))
+            else:
+                mask &= QUERY_OPERATORS[op](values, operand)
+        return set(ids[mask].tolist())
+
+
+    def ko_arrays(self):
+        """INTERNAL FUNCTION
+
+            Returns the (ids, values) arrays of a column of numbers, None
+                without numpy or for other values."""
+        if numpy is None:
+            return None
+        if self.arrays is None:
+            # False until the column changes, it isn't all numbers
+            self.arrays = False
+            if all(ko_is_number(value) for value in self.reverse.values()):
+                values = numpy.array(list(self.reverse.values()))
+                if values.dtype.kind in "iuf":
+                    self.arrays = (numpy.array(list(self.reverse), dtype=object), values)
+        return self.arrays or None
+
+
+class KoDB():
+
+    def __init__(self, file, **OPTIONS):
+        """KoDB(String:database_file, **options)
+
+            Creates a new database object, 3 files will be geenrated
+                upon creation. A folder can only be opened once at a
+                time in a process, a second KoDB of it raises
+                ValueError until the first one is closed.
+            Options:
+                load_to_memory=Bool:False
+                    > Loads the tables into memory
+                        (up to the cache budget)
+                no_commit=Bool:False
+                    > Prevents commit upon storing data
+                        (useful for large insert ops)
+                        (the flush options below still commit)
+                flush_documents=Int:None
+                flush_bytes=Int:None
+                flush_age=Float:None
+                    > Buffers the writes instead of committing every
+                        one, the buffer is committed once it holds N
+                        documents, about N bytes of them or its oldest
+                        write is N seconds old, and on close().
+                        (Ignored with the write-ahead log, which has
+                            its own checkpoints)
+                flush_thread=Bool:False
+                    > Commits a buffer older than flush_age from a
+                        background thread, without waiting for the
+                        next write.
+                load_type=String:safe_load
+                    > Specifies what load function yaml uses.
+                        (use 'load' for object serialization 
+                            support)
+                data_suffix=String:default
+                    > Specifies the default data suffix.
+                        (this is the table seperator)
+                codec=String:yaml
+                    > The document serializer, one of yaml, json,
+                        msgpack, pickle or a registered codec.
+                        (existing documents stay readable when changed)
+                compression=String:stored
+                    > How documents are compressed in the archive, one
+                        of stored, deflate, bzip2 or lzma.
+                        (existing documents stay readable when changed)
+                compression_level=Int:None
+                    > The deflate/bzip2 compression level.
+                compression_dict=Bool:False
+                    > Deflates the documents of a table against a
+                        dictionary built from its first documents,
+                        small documents share its redundancy instead
+                        of being compressed on their own.
+                cache_size=Int:None
+                    > The maximum number of cached documents per table.
+                        (Unbounded if unspecified)
+                cache_bytes=Int:None
+                    > The approximate maximum memory of the cached
+                        documents per table.
+                        (Unbounded if unspecified)
+                cache_pin=List:[]
+                    > Tables that are cached without eviction.
+                writer_thread=Bool:False
+                    > Runs the stores of every thread on a dedicated
+                        writer thread, stores queued at the same time
+                        share a commit.
+                wal=Bool:False
+                    > Records every store in an append-only write-ahead
+                        log instead of committing, the log is
+                        checkpointed into the database in the background
+                        and replayed on open after a crash.
+                        (A log left by a crash is replayed and removed
+                            on an open without it as well)
+                wal_sync_ops=Int:100
+                    > Group commit, fsyncs the log every N stores.
+                wal_sync_ms=Int:50
+                    > Group commit, fsyncs the log every N milliseconds.
+                wal_checkpoint=Int:10000
+                    > Checkpoints the log after N stores.
+                metrics=Bool:False
+                    > Records per operation counts, latency histograms
+                        and bytes read and written, see stats().
+                        (Without it nothing is recorded or wrapped)
+                metrics_hook=Function:None
+                    > Called with (operation, seconds, bytes) after
+                        every recorded operation, implies metrics.
+                mmap=Bool:True
+                    > Reads the documents from a memory map of the
+                        archive instead of seeking and reading a file
+                        handle per thread.
+                (sharded databases are opened with Ko_ShardedDB)
+                """
+        
+        if "shards" in OPTIONS or os.path.exists(os.path.join(file, SHARDS_FILE)):
+            raise ValueError("{} is a sharded database, open it with kodb.Ko_ShardedDB()".format(file))
+        self.KO_FOLDER = file
+        # The archive's central directory is only written on close, a
+        #   second handle wouldn't see what this one writes
+        self.KO_FOLDER_KEY = os.path.realpath(file)
+        with OPEN_FOLDERS_LOCK:
+            other = OPEN_FOLDERS.get(self.KO_FOLDER_KEY)
+            if other is not None and not other.KO_CLOSED:
+                # A dropped handle caught in a reference cycle is only freed
+                #   by the collector
+                other = None
+                gc.collect()
+                other = OPEN_FOLDERS.get(self.KO_FOLDER_KEY)
+            if other is not None and not other.KO_CLOSED:
+                raise ValueError("{} is already open, close it before opening it again".format(file))
+            # Claimed in the same lock hold as the check, an __init__ that
+            #   fails halfway is released when the object is collected
+            self.KO_CLOSED = False
+            OPEN_FOLDERS[self.KO_FOLDER_KEY] = self
+        # The files inside the folder are named after the folder itself
+        self.KO_FILENAME = "{}.db".format(os.path.basename(os.path.normpath(file)))
+        self.KO_DB_FILEPATH = os.path.join(self.KO_FOLDER, self.KO_FILENAME)
+        # Uncommitted documents, {member_name: (uid, table, data, codec, payload)}
+        self.KO_COMMIT_CACHE = {}
+        self.KO_META_COMMIT_CACHE = {}
+        self.KO_NO_COMMIT = OPTIONS["no_commit"] if "no_commit" in OPTIONS else False
+        # Write buffer thresholds, see ko_flush_writes
+        self.KO_FLUSH_DOCUMENTS = OPTIONS["flush_documents"] if "flush_documents" in OPTIONS else None
+        self.KO_FLUSH_BYTES = OPTIONS["flush_bytes"] if "flush_bytes" in OPTIONS else None
+        self.KO_FLUSH_AGE = OPTIONS["flush_age"] if "flush_age" in OPTIONS else None
+        self.KO_BUFFERED = self.KO_FLUSH_DOCUMENTS is not None or self.KO_FLUSH_BYTES is not None or \
+            self.KO_FLUSH_AGE is not None
+        # Approximate size of the uncommitted documents, and when the
+        #   oldest uncommitted write was made (time.monotonic)
+        self.KO_PENDING_BYTES = 0
+        self.KO_PENDING_SINCE = None
+        # Depth of the open batch() blocks
+        self.KO_BATCHES = 0
+        self.KO_FLUSHES = {"count": 0, "documents": 0, "bytes": 0, "seconds": 0.0,
+                           "max_documents": 0, "max_seconds": 0.0, "reasons": {}}
+        self.KO_FLUSH_THREAD = None
+        self.KO_LOADTYPE = OPTIONS["load_type"] if "load_type" in OPTIONS else "safe_load"
+        self.KO_DATA_SUFFIX = OPTIONS["data_suffix"] if "data_suffix" in OPTIONS else "default"
+        self.KO_LAST_CHUNK_SIZE = 0
+        # Global document index, {table: {id: meta_chunk}}
+        self.KO_ID_INDEX = {}
+        # Ids whose latest version is a tombstone, {table: set(id)}
+        self.KO_DELETED = {}
+        # Sorted id index, {table: sorted list(id)}, built on first use,
+        #   extended in place by ids past its end and replaced when ids
+        #   land before it, readers never see an id move
+        self.KO_SORTED_IDS = {}
+        # Ids added since, {table: list(id)}
+        self.KO_NEW_IDS = {}
+        # Sorted ids without the deleted ones, {table: (sorted ids, length, list(id))},
+        #   dropped when an id is deleted or undeleted
+        self.KO_LIVE_IDS = {}
+        self.KO_SORTED_LOCK = threading.Lock()
+        # Lookups answered from the id index alone
+        self.KO_LOOKUP_LOCK = threading.Lock()
+        self.KO_LOOKUPS = {"lookups": 0, "short_circuits": 0}
+        # Pending members superseded before they were committed,
+        #   {member_name: bytes counted until the member is written}
+        self.KO_SUPERSEDED = {}
+        # Versions are time ordered uuids, KO_CLOCK is the last tick handed out,
+        #   seeded from the newest stored version so a wall clock stepped back
+        #   never orders a new version before an old one
+        self.KO_CLOCK = 0
+        self.KO_CLOCK_SEQ = uuid.uuid4().int & 0x3fff
+        # A random node with the multicast bit set instead of the MAC address
+        self.KO_NODE = (uuid.uuid4().int & 0xffffffffffff) | 0x010000000000
+        # Ticks of the open snapshots, compaction keeps what they read
+        self.KO_SNAPSHOTS = []
+        self.KO_METRICS = None
+        if OPTIONS.get("metrics") or OPTIONS.get("metrics_hook"):
+            self.KO_METRICS = Ko_Metrics()
+            self.KO_METRICS.instrument(self)
+            if OPTIONS.get("metrics_hook"):
+                self.KO_METRICS.hooks.append(OPTIONS["metrics_hook"])
+        self.KO_LOCK = Ko_RWLock()
+        self.KO_READERS = threading.local()
+        self.KO_ARCHIVE_GENERATION = 0
+        self.KO_WRITER = None
+        # Read only map of the archive, remapped once it grows past it or
+        #   the archive is swapped
+        self.KO_MMAP = OPTIONS["mmap"] if "mmap" in OPTIONS else True
+        self.KO_MAP = None
+        self.KO_MAP_GENERATION = None
+        self.KO_MAP_LOCK = threading.Lock()
+        # The archive is opened lazily when loaded from the manifest
+        self.KO_ZIP_FILE = None
+        # Set by close(), the archive isn't reopened after it
+        self.KO_CLOSED = False
+        self.KO_MEMBERS = None
+        self.KO_MANIFEST_DIRTY = True
+        self.KO_WAL = None
+
+        # Check if the database exists
+        # Create if not
+        # TODO: PUT ALL OF THE NEW_DB CODE HERE
+        self.KO_META = []
+        if not os.path.exists(self.KO_FOLDER):
+            # NEW DB 
+            os.mkdir(self.KO_FOLDER)
+            os.mkdir(os.path.join(self.KO_FOLDER, "meta"))
+            self.KO_META.append({self.KO_DATA_SUFFIX: {}})
+            self.KO_CONFIG = {}
+            self.ko_set_config("tables", [self.KO_DATA_SUFFIX])
+            metasize = 1028 if "meta_size" not in OPTIONS else (OPTIONS["meta_size"])
+            self.ko_set_config("metasize", metasize)
+
+        else:
+            # LOAD DB
+            if not self.init_manifest():
+                self.init_meta()
+            with open(self.ko_path("KO_CONFIG")) as f:
+                self.KO_CONFIG = yaml.safe_load(f.read())
+
+        if "codec" in OPTIONS:
+            self.ko_set_config("codec", CODECS[OPTIONS["codec"]].name)
+        self.ko_set_compression(None, OPTIONS)
+        # Bytes held by superseded and deleted documents, {table: bytes},
+        #   None until measured for databases that predate it
+        self.KO_DEAD_SPACE = self.ko_get_config("dead_space")
+        if self.KO_DEAD_SPACE is None and not self.KO_ID_INDEX:
+            self.KO_DEAD_SPACE = {}
+        self.KO_DEAD_SPACE_DIRTY = False
+        # Loaded compression dictionaries, {member_name: bytes}
+        self.KO_DICTS = {}
+        # Committed documents of the tables still waiting for a dictionary
+        self.KO_DICT_SAMPLES = {}
+
+        # Open Database File
+        if self.KO_MEMBERS is None:
+            try:
+                self.KO_ZIP = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="a", allowZip64=True)
+            except:
+                self.KO_ZIP = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="x", allowZip64=True)
+
+        self.KO_CACHE = Ko_Cache(
+            OPTIONS["cache_size"] if "cache_size" in OPTIONS else None,
+            OPTIONS["cache_bytes"] if "cache_bytes" in OPTIONS else None,
+            OPTIONS["cache_pin"] if "cache_pin" in OPTIONS else ())
+
+        self.KO_INDEXES = {}
+        self.init_indexes()
+
+        if "wal" in OPTIONS and OPTIONS["wal"]:
+            sync_ops = OPTIONS["wal_sync_ops"] if "wal_sync_ops" in OPTIONS else 100
+            sync_ms = OPTIONS["wal_sync_ms"] if "wal_sync_ms" in OPTIONS else 50
+            self.KO_WAL_CHECKPOINT = OPTIONS["wal_checkpoint"] if "wal_checkpoint" in OPTIONS else 10000
+            self.KO_WAL = Ko_WAL(self.ko_path("KO_WAL"), sync_ops, sync_ms)
+            self.wal_replay()
+            self.KO_WAL_STOP = threading.Event()
+            self.KO_WAL_THREAD = threading.Thread(target=self.wal_worker, daemon=True)
+            self.KO_WAL_THREAD.start()
+        elif os.path.exists(self.ko_path("KO_WAL")) and os.path.getsize(self.ko_path("KO_WAL")):
+            # Otherwise its records would be missing until a later open
+            #   with the log replays them over the newer stores
+            self.KO_WAL = Ko_WAL(self.ko_path("KO_WAL"), 0, 0)
+            self.wal_replay()
+            self.KO_WAL.close()
+            self.KO_WAL = None
+            os.remove(self.ko_path("KO_WAL"))
+
+        if "flush_thread" in OPTIONS and OPTIONS["flush_thread"]:
+            if self.KO_FLUSH_AGE is None:
+                raise ValueError("The flush_thread option needs flush_age")
+            self.KO_FLUSH_STOP = threading.Event()
+            self.KO_FLUSH_THREAD = threading.Thread(target=self.flush_worker, daemon=True)
+            self.KO_FLUSH_THREAD.start()
+
+        if "writer_thread" in OPTIONS and OPTIONS["writer_thread"]:
+            self.KO_WRITER = Ko_Writer(self)
+
+        if "load_to_memory" in OPTIONS:
+            if OPTIONS["load_to_memory"]:
+                self.load_all_to_memory()
+
+        # data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        # sets the function to the default table if none is specified
+
+
+    def close(self):
+        """close()
+
+            Closes the database.
+            NOTE: THIS DOES NOT COMMIT THE DATABASE
+                (unless the write-ahead log is enabled, in which case
+                    the log is checkpointed, or the writes are
+                    buffered, in which case the buffer is committed)
+            Every read or write afterwards raises ValueError, closing
+                it again does nothing."""
+        if self.KO_CLOSED:
+            return
+        if self.KO_WRITER is not None:
+            self.KO_WRITER.close()
+        if self.KO_FLUSH_THREAD is not None:
+            self.KO_FLUSH_STOP.set()
+            self.KO_FLUSH_THREAD.join()
+        if self.KO_BUFFERED and self.KO_WAL is None and (self.KO_COMMIT_CACHE or self.KO_META_COMMIT_CACHE):
+            self.ko_flush("close")
+        if self.KO_WAL is not None:
+            self.KO_WAL_STOP.set()
+            self.KO_WAL_THREAD.join()
+            self.commit()
+            self.KO_WAL.close()
+        if self.KO_MANIFEST_DIRTY and not self.KO_COMMIT_CACHE and not self.KO_META_COMMIT_CACHE:
+            self.ko_write_manifest()
+
+        if self.KO_ZIP_FILE is not None:
+            self.KO_ZIP_FILE.close()
+        if self.KO_MEMBERS is not None:
+            self.KO_MEMBERS.close()
+        # Views handed out still hold the map, it's closed with the last one
+        self.KO_MAP = None
+        self.KO_CLOSED = True
+        with OPEN_FOLDERS_LOCK:
+            if OPEN_FOLDERS.get(self.KO_FOLDER_KEY) is self:
+                del OPEN_FOLDERS[self.KO_FOLDER_KEY]
+
+
+    def ko_check_open(self):
+        """INTERNAL FUNCTION
+
+            Raises ValueError once the database is closed."""
+        if self.KO_CLOSED:
+            raise ValueError("The database {} is closed".format(self.KO_FOLDER))
+
+
+    @property
+    def KO_ZIP(self):
+        """The database archive, opened on first use when the database
+            was loaded from its manifest."""
+        self.ko_check_open()
+        if self.KO_ZIP_FILE is None:
+            self.KO_ZIP_FILE = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="a", allowZip64=True)
+            if self.KO_MEMBERS is not None:
+                self.KO_MEMBERS.close()
+                self.KO_MEMBERS = None
+        return self.KO_ZIP_FILE
+
+
+    @KO_ZIP.setter
+    def KO_ZIP(self, archive):
+        self.KO_ZIP_FILE = archive
+
+
+    def ko_member(self, name):
+        """INTERNAL FUNCTION
+
+            Returns the offsets of an archive member, from the manifest
+                until the archive is opened, raises KeyError if the
+                member doesn't exist."""
+        self.ko_check_open()
+        if self.KO_ZIP_FILE is None:
+            return self.KO_MEMBERS[name]
+
+        info = self.KO_ZIP_FILE.getinfo(name)
+        return Ko_Member(info.header_offset, info.compress_size, info.compress_type, info.comment)
+
+
+    def ko_chunk_path(self, meta_chunk):
+        """INTERNAL FUNCTION"""
+        return os.path.join(self.KO_FOLDER, "meta", "{:08d}.meta".format(meta_chunk))
+
+
+    def init_manifest(self):
+        """INTERNAL FUNCTION
+
+            Loads the document index from the manifest, the member
+                offsets are looked up in the mapped manifest and the
+                meta chunks are read as they're needed. Returns False
+                if it's missing or older than the archive or any meta
+                chunk."""
+        try:
+            with open(self.ko_path("KO_MANIFEST"), "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        try:
+            magic, version, major, minor, zip_size, zip_mtime, chunk_count, index_size, member_count = \
+                MANIFEST_HEADER.unpack_from(data)
+            if magic != b"KOMF" or version != MANIFEST_VERSION or (major, minor) != sys.version_info[:2]:
+                raise ValueError("Stale manifest")
+
+            stat = os.stat(self.KO_DB_FILEPATH)
+            if (stat.st_size, stat.st_mtime_ns) != (zip_size, zip_mtime) or \
+                    os.path.exists(self.ko_chunk_path(chunk_count)):
+                raise ValueError("Stale manifest")
+
+            members_offset = MANIFEST_HEADER.size + index_size
+            if len(data) != members_offset + member_count * MANIFEST_MEMBER.size:
+                raise ValueError("Truncated manifest")
+
+            # Nothing in the index can form a cycle, the collector would only
+            #   slow the load down
+            with ko_gc_paused(), memoryview(data) as view:
+                chunk_stamps, index, deleted, comments, sorted_ids, clock = \
+                    marshal.loads(view[MANIFEST_HEADER.size:members_offset])
+
+            for meta_chunk, stamp in enumerate(chunk_stamps):
+                stat = os.stat(self.ko_chunk_path(meta_chunk))
+                if (stat.st_size, stat.st_mtime_ns) != tuple(stamp):
+                    raise ValueError("Stale manifest")
+
+        except (OSError, ValueError, EOFError, TypeError, struct.error):
+            data.close()
+            return False
+
+        self.KO_META = Ko_MetaChunks(self.ko_load_chunk, chunk_count)
+        self.KO_ID_INDEX = index
+        self.KO_DELETED = deleted
+        self.KO_SORTED_IDS = sorted_ids
+        self.KO_CLOCK = max(self.KO_CLOCK, clock)
+        self.KO_MEMBERS = Ko_Members(data, members_offset, member_count, comments)
+        self.KO_LAST_CHUNK_SIZE = sum(len(x) for x in self.KO_META[-1].values())
+        self.KO_MANIFEST_DIRTY = False
+        return True
+
+
+    def ko_load_chunk(self, meta_chunk):
+        """INTERNAL FUNCTION"""
+        try:
+            with open(self.ko_chunk_path(meta_chunk)) as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            # The first chunk of an empty database
+            return {}
+
+
+    def ko_write_manifest(self):
+        """INTERNAL FUNCTION
+
+            Snapshots the committed document index and member offsets
+                into the manifest."""
+        try:
+            chunk_stamps = []
+            for meta_chunk in range(0, len(self.KO_META)):
+                stat = os.stat(self.ko_chunk_path(meta_chunk))
+                chunk_stamps.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            # Never committed
+            return
+
+        archive = self.KO_ZIP
+        comments = []
+        comment_ids = {}
+        records = []
+        for info in archive.infolist():
+            if info.comment not in comment_ids:
+                comment_ids[info.comment] = len(comments)
+                comments.append(info.comment)
+            records.append(MANIFEST_MEMBER.pack(ko_member_key(info.filename), info.header_offset,
+                                                info.compress_size, info.compress_type,
+                                                comment_ids[info.comment]))
+        records.sort()
+        archive.close()
+        self.KO_ZIP = None
+        stat = os.stat(self.KO_DB_FILEPATH)
+
+        index = marshal.dumps((chunk_stamps,
+                               {data_suffix: ko_string_keys(ids) for data_suffix, ids in self.KO_ID_INDEX.items()},
+                               {data_suffix: {str(fid) for fid in ids} for data_suffix, ids in self.KO_DELETED.items()},
+                               comments,
+                               # Only the sorted ids that were built, the others are built on first use
+                               {data_suffix: self.ko_sorted_ids(data_suffix) for data_suffix in list(self.KO_SORTED_IDS)},
+                               self.KO_CLOCK))
+        header = MANIFEST_HEADER.pack(b"KOMF", MANIFEST_VERSION, sys.version_info[0], sys.version_info[1],
+                                      stat.st_size, stat.st_mtime_ns, len(self.KO_META), len(index), len(records))
+        path = self.ko_path("KO_MANIFEST")
+        with open("{}.tmp".format(path), "wb") as f:
+            f.write(header)
+            f.write(index)
+            f.write(b"".join(records))
+        os.replace("{}.tmp".format(path), path)
+        self.KO_MANIFEST_DIRTY = False
+
+
+    def table(self, table_name, **OPTIONS):
+        """table(String:table_name, **options)
+
+            Returns a KO_Table Object. Documents Stored in this context
+                is not visible in the database object as it is it's 
+                own table.
+            Options:
+                codec=String:None
+                    > The document serializer of the table.
+                        (Uses the database's codec if unspecified)
+                compression=String:None
+                compression_level=Int:None
+                compression_dict=Bool:None
+                    > The compression of the table's documents.
+                        (Uses the database's if unspecified)"""
+        # Appends a table in the table list
+        tables = self.ko_get_config("tables")
+        if table_name not in tables:
+            tables.append(table_name)
+            self.ko_set_config("tables", tables)
+
+        if "codec" in OPTIONS:
+            self.ko_set_table_config(table_name, "codec", CODECS[OPTIONS["codec"]].name)
+        self.ko_set_compression(table_name, OPTIONS)
+
+        return Ko_Table(table_name, self)
+
+
+    def ko_set_compression(self, data_suffix, OPTIONS):
+        """INTERNAL FUNCTION
+
+            Records the compression options of a table, or of the
+                database if data_suffix is None."""
+        for name in ("compression", "compression_level", "compression_dict"):
+            if name not in OPTIONS:
+                continue
+            value = OPTIONS[name]
+            if name == "compression" and value not in COMPRESSION:
+                raise ValueError("Unknown compression: {}".format(value))
+            if data_suffix is None:
+                self.ko_set_config(name, value)
+            else:
+                self.ko_set_table_config(data_suffix, name, value)
+
+
+    def ko_path(self, extension):
+        """INTERNAL FUNCTION
+
+            Returns the path of a database file with the extension."""
+        return os.path.join(self.KO_FOLDER, "{}.{}".format(os.path.basename(os.path.normpath(self.KO_FOLDER)),
+                                                           extension))
+
+
+    def ko_write_file(self, path, data, sync=False):
+        """INTERNAL FUNCTION
+
+            Atomically replaces a file, fsyncing it if sync is set."""
+        with open("{}.tmp".format(path), "w") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace("{}.tmp".format(path), path)
+
+
+    def ko_sync_archive(self):
+        """INTERNAL FUNCTION
+
+            Writes the zip's central directory and fsyncs the archive."""
+        self.KO_ZIP.close()
+        fd = os.open(self.KO_DB_FILEPATH, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.KO_ZIP = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="a", allowZip64=True)
+
+
+    def ko_set_config(self, config_name, value):
+        self.KO_CONFIG[config_name] = value
+        # The zipfile will throw a bloody warning.
+        with open(self.ko_path("KO_CONFIG"), "w") as f:
+            f.write(yaml.dump(self.KO_CONFIG))
+
+
+    def ko_get_config(self, config_name):
+        tmp = self.KO_CONFIG
+        if config_name in tmp:
+            return tmp[config_name]
+
+        return None 
+
+
+    def ko_set_table_config(self, data_suffix, config_name, value):
+        table_config = self.ko_get_config("table_config") or {}
+        table_config.setdefault(data_suffix, {})[config_name] = value
+        self.ko_set_config("table_config", table_config)
+
+
+    def ko_get_table_config(self, data_suffix, config_name):
+        """INTERNAL FUNCTION
+
+            Returns a table setting, falling back to the database's."""
+        table_config = self.ko_get_config("table_config") or {}
+        if config_name in table_config.get(data_suffix, {}):
+            return table_config[data_suffix][config_name]
+
+        return self.ko_get_config(config_name)
+
+
+    def ko_codec(self, data_suffix):
+        """INTERNAL FUNCTION"""
+        return CODECS[self.ko_get_table_config(data_suffix, "codec") or "yaml"]
+
+
+    def ko_read_document(self, uid, data_suffix):
+        """INTERNAL FUNCTION
+
+            Reads and decodes an archive member with the codec it was
+                tagged with, untagged members are yaml."""
+        pending = self.KO_COMMIT_CACHE.get("{}.{}".format(uid, data_suffix))
+        if pending is not None and pending[2] is not None:
+            return pending[2]
+
+        codec, raw = self.ko_read_raw(uid, data_suffix)
+        return self.ko_decode(codec, raw)
+
+
+    def ko_decode(self, codec, raw):
+        """INTERNAL FUNCTION"""
+        codec = CODECS[codec]
+        if not codec.buffers and isinstance(raw, memoryview):
+            raw = raw.tobytes()
+        return codec.loads(raw, self.KO_LOADTYPE)
+
+
+    def ko_read_raw(self, uid, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns the codec and the serialized document of an archive
+                member, without decoding it."""
+        name = "{}.{}".format(uid, data_suffix)
+        pending = self.KO_COMMIT_CACHE.get(name)
+        if pending is not None:
+            if pending[4] is not None:
+                return pending[3], pending[4]
+            return pending[3], CODECS[pending[3]].dumps(pending[2])
+
+        info = self.ko_member(name)
+        codec, zdict = ko_member_tag(info.comment)
+        raw = None
+        if self.KO_MMAP:
+            raw = self.ko_read_mapped(info)
+        if raw is None:
+            raw = ko_read_member(self.ko_reader(), info.header_offset, info.compress_size, info.compress_type)
+        if zdict is not None:
+            raw = ko_inflate(raw, self.ko_compression_dict(zdict))
+        return codec, raw
+
+
+    def ko_read_mapped(self, info):
+        """INTERNAL FUNCTION
+
+            Returns a member from the mapped archive, see ko_map_member.
+                None for an empty archive."""
+        end = info.header_offset + LOCAL_HEADER.size + info.compress_size
+        mapping = self.ko_mapping(end)
+        if mapping is None:
+            return None
+        raw = ko_map_member(mapping, info.header_offset, info.compress_size, info.compress_type)
+        if raw is None:
+            # The name and extra fields pushed it past the mapping
+            header = LOCAL_HEADER.unpack_from(mapping, info.header_offset)
+            mapping = self.ko_mapping(end + header[9] + header[10])
+            raw = ko_map_member(mapping, info.header_offset, info.compress_size, info.compress_type)
+        return raw
+
+
+    def ko_mapping(self, end):
+        """INTERNAL FUNCTION
+
+            Returns the archive mapped up to at least end. Commits only
+                append to the archive, so it's remapped when a member
+                ends past the mapping or after compaction swapped the
+                archive. Views of an old map keep it alive."""
+        mapping = self.KO_MAP
+        if mapping is not None and len(mapping) >= end and self.KO_MAP_GENERATION == self.KO_ARCHIVE_GENERATION:
+            return mapping
+
+        with self.KO_MAP_LOCK:
+            mapping = self.KO_MAP
+            if mapping is None or len(mapping) < end or self.KO_MAP_GENERATION != self.KO_ARCHIVE_GENERATION:
+                generation = self.KO_ARCHIVE_GENERATION
+                with open(self.KO_DB_FILEPATH, "rb") as f:
+                    try:
+                        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except ValueError:
+                        # Empty archive
+                        return None
+                self.KO_MAP = mapping
+                self.KO_MAP_GENERATION = generation
+            return mapping
+
+
+    def ko_compression_dict(self, name):
+        """INTERNAL FUNCTION
+
+            Returns a compression dictionary stored in the archive."""
+        if name not in self.KO_DICTS:
+            info = self.ko_member(name)
+            self.KO_DICTS[name] = ko_read_member(self.ko_reader(), info.header_offset,
+                                                 info.compress_size, info.compress_type)
+        return self.KO_DICTS[name]
+
+
+    def ko_train_dicts(self):
+        """INTERNAL FUNCTION
+
+            Builds the compression dictionaries of the tables that
+                have committed enough documents for one."""
+        samples = self.KO_DICT_SAMPLES
+        waiting = {}
+        for item in self.KO_COMMIT_CACHE.values():
+            if item[1] not in waiting:
+                waiting[item[1]] = self.ko_get_table_config(item[1], "compression_dict") and \
+                    self.ko_get_table_config(item[1], "compression") == "deflate" and \
+                    not self.ko_get_table_config(item[1], "compression_dict_member")
+            if waiting[item[1]]:
+                payload = item[4] if item[4] is not None else CODECS[item[3]].dumps(item[2])
+                samples.setdefault(item[1], []).append(payload)
+
+        for data_suffix, payloads in list(samples.items()):
+            if len(payloads) < COMPRESSION_DICT_SAMPLES:
+                continue
+            name = "{}.{}.KO_DICT".format(uuid.uuid4().hex, data_suffix)
+            zdict = ko_build_dict(payloads)
+            info = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+            info.external_attr = 0o600 << 16
+            self.KO_ZIP.writestr(info, zdict)
+            self.KO_DICTS[name] = zdict
+            self.ko_set_table_config(data_suffix, "compression_dict_member", name)
+            del samples[data_suffix]
+
+
+    def ko_reader(self):
+        """INTERNAL FUNCTION
+
+            Returns this thread's read handle on the archive, reopened
+                after the archive file is swapped."""
+        local = self.KO_READERS
+        if getattr(local, "generation", None) != self.KO_ARCHIVE_GENERATION:
+            if getattr(local, "fp", None) is not None:
+                local.fp.close()
+            local.fp = open(self.KO_DB_FILEPATH, "rb")
+            local.generation = self.KO_ARCHIVE_GENERATION
+        return local.fp
+
+
+    def ko_write_document(self, uid, data_suffix, codec, payload):
+        """INTERNAL FUNCTION
+
+            Writes a document with its table's compression, members
+                deflated against a dictionary are stored raw and tagged
+                with the dictionary."""
+        info = zipfile.ZipInfo("{}.{}".format(uid, data_suffix), time.localtime(time.time())[:6])
+        info.external_attr = 0o600 << 16
+        compress_type = COMPRESSION[self.ko_get_table_config(data_suffix, "compression") or "stored"]
+        level = self.ko_get_table_config(data_suffix, "compression_level")
+        zdict = self.ko_get_table_config(data_suffix, "compression_dict_member")
+        if zdict is not None and compress_type == zipfile.ZIP_DEFLATED and \
+                self.ko_get_table_config(data_suffix, "compression_dict"):
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+                                          zlib.DEFLATED, -zlib.MAX_WBITS, zdict=self.ko_compression_dict(zdict))
+            payload = compressor.compress(payload) + compressor.flush()
+            compress_type = zipfile.ZIP_STORED
+            codec = "{}|{}".format(codec, zdict)
+        info.comment = codec.encode("utf-8")
+        self.KO_ZIP.writestr(info, payload, compress_type=compress_type, compresslevel=level)
+
+
+    def load_to_memory(self, data_suffix = None):
+        """load_to_memory(String:data_suffix = None)
+
+            Loads the database entries into memory until the
+                cache budget of the table is reached.
+            Options:
+                data_suffix = String:None
+                    > The data suffix (table) of the database to load
+                        (Loads the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        cached = self.KO_CACHE.tables.get(data_suffix, {})
+        evictions = self.KO_CACHE.evictions
+        for index in self.ko_ids(data_suffix):
+            if self.KO_CACHE.full(data_suffix) or self.KO_CACHE.evictions != evictions:
+                break
+            if index not in cached:
+                self.get(index, data_suffix)
+
+
+    def load_all_to_memory(self):
+        """load_all_to_memory()
+
+            Loads every table into memory until the cache budget of
+                each table is reached."""
+        for table in self.tables():
+            self.load_to_memory(table)
+
+
+    def cache_stats(self):
+        """cache_stats()
+
+            Returns the hit, miss and eviction counters of the document
+                cache with the entries and bytes held per table."""
+        return self.KO_CACHE.stats()
+
+
+    def lookup_stats(self):
+        """lookup_stats()
+
+            Returns how many get()/exists() lookups were made and how
+                many of them were answered as missing from the id index
+                without taking the database lock."""
+        with self.KO_LOOKUP_LOCK:
+            return dict(self.KO_LOOKUPS)
+
+
+    def stats(self):
+        """stats()
+
+            Returns the operation metrics (with the metrics option),
+                the cache and lookup counters, the meta chunk counts,
+                the commits that wrote documents (with why the write
+                buffer was flushed) and the uncommitted writes.
+                (the pending bytes are only counted with flush_bytes)"""
+        if self.KO_METRICS is not None:
+            stats = self.KO_METRICS.snapshot()
+        else:
+            stats = {"operations": {}, "counters": {}}
+        stats["cache"] = self.cache_stats()
+        cache = stats["cache"]
+        stats["cache"]["hit_rate"] = cache["hits"] / (cache["hits"] + cache["misses"]) \
+            if cache["hits"] + cache["misses"] else None
+        stats["lookups"] = self.lookup_stats()
+        stats["meta_chunks"] = len(self.KO_META)
+        stats["meta_chunks_dirty"] = len(self.KO_META_COMMIT_CACHE)
+        with self.KO_LOCK:
+            stats["flushes"] = dict(self.KO_FLUSHES, reasons=dict(self.KO_FLUSHES["reasons"]))
+            stats["pending"] = {"documents": len(self.KO_COMMIT_CACHE), "bytes": self.KO_PENDING_BYTES}
+        return stats
+
+
+    def add_metrics_hook(self, hook):
+        """add_metrics_hook(Function:hook)
+
+            Calls hook with (operation, seconds, bytes) after every
+                recorded operation, to forward the metrics elsewhere.
+                Needs the metrics option."""
+        if self.KO_METRICS is None:
+            raise RuntimeError("The database was opened without metrics=True")
+        self.KO_METRICS.hooks.append(hook)
+
+
+    def ko_absent(self, fid, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns True if the document definitely doesn't exist. The
+                id index and tombstones are read without the database
+                lock, a concurrent store lands either before or after."""
+        self.ko_check_open()
+        index = self.KO_ID_INDEX.get(data_suffix)
+        absent = index is None or fid not in index or fid in self.KO_DELETED.get(data_suffix, ())
+        with self.KO_LOOKUP_LOCK:
+            self.KO_LOOKUPS["lookups"] += 1
+            if absent:
+                self.KO_LOOKUPS["short_circuits"] += 1
+        return absent
+
+
+    def get_all(self, data_suffix = None, parallel = None, ordered = True, batch_size = 500, output = "view"):
+        """get_all(String:data_suffix = None, Int:parallel = None, ...)
+
+            Returns a generator iterating through all of the table's
+                database entries, without adding them to the cache.
+            Options:
+                data_suffix = String:None
+                    > The data suffix (table) of the database to retrieve
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)
+                parallel = Int:None
+                    > Decodes the documents across N worker processes.
+                        (Decodes in this process if unspecified)
+                        (Also on a single core or for tables under
+                            PARALLEL_MIN_DOCUMENTS documents)
+                ordered = Bool:True
+                    > With parallel, yields the documents in table order
+                        instead of as soon as a batch is decoded.
+                batch_size = Int:500
+                    > With parallel, the number of documents per batch.
+                output = String:view
+                    > view yields read-only Ko_Document views, dict
+                        yields plain dicts and raw the serialized
+                        documents without decoding them.
+                        (raw ignores parallel)"""
+        ko_check_output(output)
+        parallel = self.ko_parallel_workers(parallel, data_suffix)
+        if parallel and output != "raw":
+            return self.ko_parallel_scan(data_suffix, parallel, None, ordered, batch_size, output)
+
+        return self.ko_scan(data_suffix, output)
+
+
+    def exists(self, fid, data_suffix = None):
+        """exists(String:fid, String:data_suffix = None)
+
+            Returns True if a database entry exists.
+            Options:
+                fid = String:Required
+                    > The id of the document to check
+                data_suffix = String:None
+                    > The data suffix (table) on where to check.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        try:
+            data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+            fid = ko_string_id(fid)
+            # if fid in self.KO_META[data_suffix]:
+            if not self.ko_absent(fid, data_suffix) and self.get_meta(fid, data_suffix) is not None:
+                return True
+            else:
+                return False
+            # info = self.KO_ZIP.getinfo("{}.{}".format(fid, data_suffix))
+            # return True
+        except KeyError:
+            return False
+            
+
+    def query(self, search_func, data_suffix = None, parallel = None, ordered = True, batch_size = 500,
+              limit = None, offset = 0, order_by = None, output = "view"):
+        """query(Function:search_function, String:data_suffix = None, Int:parallel = None, ...)
+
+            Returns a lazy Ko_Cursor of the items that matches the
+                search_function, documents are only read as the cursor
+                is iterated.
+            ex.: db.query(lambda x: x.views > 100, limit=20, order_by="-views")
+                > Returns the 20 most viewed items that has views
+                    greater than 100
+            Options:
+                search_func = Lambda/Function:required
+                    > The statement that filters the correct data.
+                        (with parallel, a picklable function is run in
+                            the workers, lambdas are run here)
+                data_suffix = String:None
+                    > The table to be queried.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)
+                parallel = Int:None
+                    > Decodes and filters across N worker processes.
+                        (Not on a single core or for tables under
+                            PARALLEL_MIN_DOCUMENTS documents, see get_all)
+                ordered = Bool:True
+                    > With parallel, keeps the results in table order.
+                limit = Int:None
+                    > The maximum number of items, the table stops
+                        being read once it's reached.
+                offset = Int:0
+                    > The number of items skipped.
+                order_by = String:None
+                    > The (dotted) field the items are sorted by, -field
+                        sorts descending. With a limit only the top
+                        offset + limit items are kept in memory.
+                output = String:view
+                    > The items as views, dicts or raw, see get_all.
+                        (search_func always gets a view)"""
+        ko_check_output(output)
+        return Ko_Cursor(self, search_func, data_suffix, limit, offset, order_by, parallel, ordered, batch_size,
+                         output)
+
+
+    def ko_scan(self, data_suffix = None, output = "view"):
+        """INTERNAL FUNCTION
+
+            Yields the table's documents one at a time, without adding
+                them to the cache."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        for fid in self.ko_ids(data_suffix):
+            data = self.ko_read_output(fid, data_suffix, output)
+            if data is not None:
+                yield data
+
+
+    def ko_read_output(self, fid, data_suffix, output):
+        """INTERNAL FUNCTION
+
+            Returns a document in the output form without adding it to
+                the cache, None if it's gone."""
+        with self.KO_LOCK.read:
+            versions = self.get_meta(fid, data_suffix)
+            if versions is None:
+                return None
+            if output == "raw":
+                return bytes(self.ko_read_raw(versions[0], data_suffix)[1])
+            data = self.KO_CACHE.get(data_suffix, fid, count_miss=False)
+            if data is None:
+                data = self.ko_read_document(versions[0], data_suffix)
+        return ko_output(fid, data, output)
+
+
+    def ko_parallel_workers(self, parallel, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns the number of worker processes a parallel scan uses,
+                None when it wouldn't pay off: a single core or a small
+                table."""
+        workers = min(parallel or 0, os.cpu_count() or 1)
+        if workers <= 1:
+            return None
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK.read:
+            size = len(self.KO_ID_INDEX.get(data_suffix, ())) - len(self.KO_DELETED.get(data_suffix, ()))
+        return workers if size >= PARALLEL_MIN_DOCUMENTS else None
+
+
+    def ko_parallel_scan(self, data_suffix, workers, search_func, ordered, batch_size, output = "view"):
+        """INTERNAL FUNCTION
+
+            Splits the table into batches of member offsets and decodes
+                them in a process pool, the workers read the archive
+                file directly."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK:
+            # Workers can only see what is written to the archive
+            self.commit()
+            members = []
+            for fid in self.ko_ids(data_suffix):
+                info = self.ko_member("{}.{}".format(self.get_meta(fid, data_suffix)[0], data_suffix))
+                members.append((fid, info.header_offset, info.compress_size, info.compress_type, info.comment))
+            dicts = {name: self.ko_compression_dict(name) for name in self.ko_dict_members()}
+
+        batches = [members[x:x + batch_size] for x in range(0, len(members), batch_size)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(ko_decode_batch, self.KO_DB_FILEPATH, self.KO_LOADTYPE, batch, search_func,
+                                       dicts)
+                       for batch in batches]
+            try:
+                for future in futures if ordered else concurrent.futures.as_completed(futures):
+                    for fid, data in future.result():
+                        yield ko_output(fid, data, output)
+            finally:
+                # Stopped early, don't decode the rest
+                for future in futures:
+                    future.cancel()
+
+
+    def create_index(self, field, data_suffix = None, kind = "hash"):
+        """create_index(String:field, String:data_suffix = None, String:kind = hash)
+
+            Creates a secondary index on a document field that find()
+                uses instead of scanning the table.
+            ex.: db.table("posts").create_index("userId")
+            Options:
+                field = String:required
+                    > The field to index, dotted paths (ex.: price.value)
+                        index nested fields.
+                        (values json can't carry, like dates, are
+                            persisted with the table's codec)
+                data_suffix = String:None
+                    > The table to index.
+                        (Indexes the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)
+                kind = String:hash
+                    > hash only answers equality, sorted also answers
+                        range conditions and column only keeps the values
+                        for select() and the aggregates, checking them
+                        all for a condition.
+                        (every kind is read by select() and the aggregates)"""
+        if kind not in ("hash", "sorted", "column"):
+            raise ValueError("Unknown index kind: {}".format(kind))
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK:
+            indexes = dict(self.ko_get_table_config(data_suffix, "indexes") or {})
+            indexes[field] = kind
+            self.ko_set_table_config(data_suffix, "indexes", indexes)
+            self.rebuild_index(field, data_suffix)
+
+
+    def drop_index(self, field, data_suffix = None):
+        """drop_index(String:field, String:data_suffix = None)
+
+            Removes a secondary index."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK:
+            indexes = dict(self.ko_get_table_config(data_suffix, "indexes") or {})
+            indexes.pop(field, None)
+            self.ko_set_table_config(data_suffix, "indexes", indexes)
+            index = self.KO_INDEXES.get(data_suffix, {}).pop(field, None)
+            if index is not None and os.path.exists(index.path):
+                os.remove(index.path)
+
+
+    def rebuild_index(self, field, data_suffix = None):
+        """rebuild_index(String:field, String:data_suffix = None)
+
+            Rebuilds a secondary index from the table's documents."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK:
+            kind = (self.ko_get_table_config(data_suffix, "indexes") or {})[field]
+            index = Ko_Index(field, kind, self.ko_index_path(data_suffix, field),
+                             self.ko_codec(data_suffix), self.KO_LOADTYPE)
+            for document in self.ko_scan(data_suffix):
+                index.update(document.ko_id, ko_field(document, field), journal=False)
+            index.snapshot()
+            self.KO_INDEXES.setdefault(data_suffix, {})[field] = index
+
+
+    def indexes(self, data_suffix = None):
+        """indexes(String:data_suffix = None)
+
+            Returns the indexed fields of a table and their kind."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        return dict(self.ko_get_table_config(data_suffix, "indexes") or {})
+
+
+    def find(self, where = None, data_suffix = None, **criteria):
+        """find(Dict:where = None, String:data_suffix = None, **criteria)
+
+            Returns the documents matching every criterion sorted by
+                id, only the documents selected by the indexed fields
+                are read.
+            ex.: db.table("posts").find(userId=7)
+                 db.table("shop").find({"price.value": {"$gte": 100, "$lt": 500}})
+            Options:
+                where = Dict:None
+                    > Criteria keyed by (dotted) field, a value is
+                        either matched for equality or a dict of
+                        $eq, $ne, $gt, $gte, $lt, $lte and $in conditions.
+                data_suffix = String:None
+                    > The table to be queried.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)
+                **criteria
+                    > Same as where, a double underscore stands for a
+                        dot (ex.: price__value=150)."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        where = dict(where or {})
+        where.update((field.replace("__", "."), condition) for field, condition in criteria.items())
+
+        candidates = None
+        indexes = self.KO_INDEXES.get(data_suffix, {})
+        for field, condition in where.items():
+            if field in indexes:
+                ids = indexes[field].lookup(condition)
+                if ids is not None:
+                    candidates = ids if candidates is None else candidates & ids
+
+        if candidates is None:
+            candidates = self.ko_ids(data_suffix)
+
+        result = []
+        for fid in sorted(candidates):
+            data = self.get(fid, data_suffix)
+            if data is not None and all(ko_match(data, f, c) for f, c in where.items()):
+                result.append(data)
+        return result
+
+
+    def select(self, fields, where = None, data_suffix = None, limit = None):
+        """select(List:fields, Dict:where = None, String:data_suffix = None, Int:limit = None)
+
+            Returns the fields of the matching documents as dicts with
+                their id in _id, a field a document doesn't have is left
+                out. When the table has an index (of any kind) on every
+                field the values are read from the indexes and no
+                document is decoded, see create_index(kind="column").
+            ex.: db.table("posts").select(["userId", "title"], where={"userId": {"$lt": 5}})
+            Options:
+                fields = List:required
+                    > The (dotted) fields to return.
+                where = Dict:None
+                    > Criteria keyed by (dotted) field, see find(), or a
+                        function of the document like query()'s.
+                        (Every document if unspecified)
+                data_suffix = String:None
+                    > The table to be queried.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled
+                                by the KO_Table Object.***)
+                limit = Int:None
+                    > Returns at most limit rows."""
+        fields = [fields] if isinstance(fields, str) else list(fields)
+        rows = []
+        for fid, values in itertools.islice(self.ko_rows(fields, where, data_suffix), limit):
+            row = {field: value for field, value in zip(fields, values) if value is not MISSING}
+            row["_id"] = fid
+            rows.append(row)
+        return rows
+
+
+    def count(self, where = None, data_suffix = None):
+        """count(Dict:where = None, String:data_suffix = None)
+
+            Returns the number of matching documents, see select()."""
+        if where is None:
+            return len(self.items(data_suffix))
+        return sum(1 for _ in self.ko_rows([], where, data_suffix))
+
+
+    def sum(self, field, where = None, data_suffix = None):
+        """sum(String:field, Dict:where = None, String:data_suffix = None)
+
+            Returns the sum of a field's numbers in the matching
+                documents, see select()."""
+        return ko_sum(values[0] for _, values in self.ko_rows([field], where, data_suffix))
+
+
+    def min(self, field, where = None, data_suffix = None):
+        """min(String:field, Dict:where = None, String:data_suffix = None)
+
+            Returns the smallest value of a field in the matching
+                documents, numbers before strings, None if none has it.
+                See select()."""
+        return ko_min(values[0] for _, values in self.ko_rows([field], where, data_suffix))
+
+
+    def max(self, field, where = None, data_suffix = None):
+        """max(String:field, Dict:where = None, String:data_suffix = None)
+
+            Returns the largest value of a field in the matching
+                documents, see min()."""
+        return ko_max(values[0] for _, values in self.ko_rows([field], where, data_suffix))
+
+
+    def group_by(self, field, aggregate = "count", of = None, where = None, data_suffix = None):
+        """group_by(String:field, String:aggregate = "count", String:of = None, Dict:where = None, ...)
+
+            Returns {value: aggregate} of the matching documents grouped
+                by a field's value, documents without it are grouped
+                under None. See select().
+            ex.: db.table("posts").group_by("userId")
+                 db.table("shop").group_by("type", "sum", of="price.value")
+            Options:
+                field = String:required
+                    > The (dotted) field to group by, lists and dicts
+                        are grouped as tuples.
+                aggregate = String:count
+                    > count, sum, min or max.
+                of = String:None
+                    > The field sum, min and max aggregate."""
+        if aggregate not in AGGREGATES:
+            raise ValueError("Unknown aggregate: {}".format(aggregate))
+        if of is None and aggregate != "count":
+            raise ValueError("The {} aggregate needs the of field".format(aggregate))
+
+        groups = {}
+        for _, values in self.ko_rows([field] if of is None else [field, of], where, data_suffix):
+            key = None if values[0] is MISSING else ko_hashable(values[0])
+            groups.setdefault(key, []).append(values[-1])
+        return {key: AGGREGATES[aggregate][0](values) for key, values in groups.items()}
+
+
+    def ko_rows(self, fields, where, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns an iterator of (id, [values]) of the documents
+                matching where, MISSING stands for an absent field. Read
+                from the indexes when they cover the fields and where,
+                the documents are decoded otherwise."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        indexes = self.KO_INDEXES.get(data_suffix, {})
+        if not callable(where) and all(field in indexes for field in itertools.chain(fields, where or ())):
+            with self.KO_LOCK.read:
+                matches = None
+                for field, condition in (where or {}).items():
+                    ids = indexes[field].lookup(condition)
+                    if ids is None:
+                        ids = indexes[field].match(condition)
+                    matches = ids if matches is None else matches & ids
+                columns = [indexes[field].reverse for field in fields]
+                return iter([(fid, [column.get(fid, MISSING) for column in columns])
+                             for fid in self.ko_ids(data_suffix) if matches is None or fid in matches])
+
+        return self.ko_scan_rows(fields, where, data_suffix)
+
+
+    def ko_scan_rows(self, fields, where, data_suffix):
+        """INTERNAL FUNCTION
+
+            ko_rows over the decoded documents."""
+        for document in self.ko_scan(data_suffix):
+            if callable(where):
+                if not where(document):
+                    continue
+            elif where and not all(ko_match(document, f, c) for f, c in where.items()):
+                continue
+            yield document.ko_id, [ko_field(document, field) for field in fields]
+
+
+    def init_indexes(self):
+        """INTERNAL FUNCTION
+
+            Loads the secondary index journals, rebuilding missing ones."""
+        for data_suffix, table_config in (self.ko_get_config("table_config") or {}).items():
+            for field, kind in (table_config.get("indexes") or {}).items():
+                index = Ko_Index(field, kind, self.ko_index_path(data_suffix, field),
+                                 self.ko_codec(data_suffix), self.KO_LOADTYPE)
+                try:
+                    index.load()
+                except FileNotFoundError:
+                    self.rebuild_index(field, data_suffix)
+                except Exception:
+                    # A torn last line or a value the load_type can't
+                    #   bring back, the documents have it all
+                    warnings.warn("Rebuilding the unreadable index {} of {}".format(field, data_suffix))
+                    self.rebuild_index(field, data_suffix)
+                else:
+                    self.KO_INDEXES.setdefault(data_suffix, {})[field] = index
+
+
+    def ko_index_path(self, data_suffix, field):
+        """INTERNAL FUNCTION"""
+        folder = os.path.join(self.KO_FOLDER, "indexes")
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+        return os.path.join(folder, "{}.{}.KO_INDEX".format(data_suffix, field))
+
+
+    def ko_index_document(self, data_suffix, fid, data):
+        """INTERNAL FUNCTION"""
+        for field, index in self.KO_INDEXES.get(data_suffix, {}).items():
+            index.update(fid, ko_field(data, field))
+
+
+    def store(self, pid, data, data_suffix = None):
+        """store(String:pid, Dict:data, String:data_suffix = None)
+
+            Stores a document in the database
+            Options:
+                pid = String:required
+                    > The document ID 
+                        (A number is stored as its string, get(1) and
+                            get("1") read the same document)
+                data = Dictionary:required
+                    > The dictionary to be converted into yaml and stored in 
+                        the database.
+                data_suffix = String:None
+                    > The table where the document should be stored.
+                        (Stores on the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        # try:
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        # if data_suffix not in self.KO_META:
+        #     self.KO_META[data_suffix] = {}
+
+        self.ko_write(self.ko_store_documents, [(pid, data)], data_suffix)
+        return True
+
+        # except Exception as e:
+        #     print(e)
+        #     print("Data save failed.({})".format(pid))
+        #     return False
+
+
+    def store_many(self, documents, data_suffix = None):
+        """store_many(Iterable:documents, String:data_suffix = None)
+
+            Stores (id, document) pairs with a single commit at the end,
+                returns the number of documents stored.
+            ex.: db.store_many((post["id"], post) for post in posts)
+            Options:
+                documents = Iterable:required
+                    > The (id, dictionary) pairs to store.
+                data_suffix = String:None
+                    > The table where the documents should be stored.
+                        (Stores on the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        return self.ko_write(self.ko_store_documents, documents, data_suffix, True)
+
+
+    def ko_write(self, function, *args):
+        """INTERNAL FUNCTION
+
+            Runs a write on the writer thread, or under the write lock
+                followed by the commit."""
+        self.ko_check_open()
+        if self.KO_WRITER is not None and threading.current_thread() is not self.KO_WRITER.thread:
+            return self.KO_WRITER.submit(function, *args).result()
+
+        with self.KO_LOCK:
+            result = function(*args)
+            self.ko_flush_writes()
+        return result
+
+
+    def ko_flush_writes(self):
+        """INTERNAL FUNCTION
+
+            Commits after a write, unless the writes are buffered or
+                batched and the buffer isn't full or old enough yet."""
+        # Write Metadata and push the uncommited changes to the Meta file
+        if self.KO_WAL is None:
+            reason = self.ko_flush_reason()
+            if reason is not None:
+                self.ko_flush(reason)
+
+
+    def ko_flush_reason(self):
+        """INTERNAL FUNCTION
+
+            Returns why the pending writes should be committed now, None
+                if they can wait."""
+        if self.KO_FLUSH_DOCUMENTS is not None and len(self.KO_COMMIT_CACHE) >= self.KO_FLUSH_DOCUMENTS:
+            return "documents"
+        if self.KO_FLUSH_BYTES is not None and self.KO_PENDING_BYTES >= self.KO_FLUSH_BYTES:
+            return "bytes"
+        if self.KO_FLUSH_AGE is not None and self.KO_PENDING_SINCE is not None and \
+                time.monotonic() - self.KO_PENDING_SINCE >= self.KO_FLUSH_AGE:
+            return "age"
+        if self.KO_BUFFERED or self.KO_NO_COMMIT or self.KO_BATCHES:
+            return None
+        return "write"
+
+
+    def ko_flush(self, reason):
+        """INTERNAL FUNCTION
+
+            Commits the pending writes, counting why."""
+        with self.KO_LOCK:
+            self.commit()
+            reasons = self.KO_FLUSHES["reasons"]
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+
+    def ko_count_flush(self, documents, size, seconds):
+        """INTERNAL FUNCTION
+
+            Records a commit that wrote documents, see stats."""
+        flushes = self.KO_FLUSHES
+        flushes["count"] += 1
+        flushes["documents"] += documents
+        flushes["bytes"] += size
+        flushes["seconds"] += seconds
+        flushes["max_documents"] = max(flushes["max_documents"], documents)
+        flushes["max_seconds"] = max(flushes["max_seconds"], seconds)
+
+
+    def flush_worker(self):
+        """INTERNAL FUNCTION
+
+            Background flusher, commits the write buffer once it's older
+                than flush_age even if nothing else is written."""
+        while not self.KO_FLUSH_STOP.wait(self.KO_FLUSH_AGE / 2):
+            with self.KO_LOCK:
+                reason = None if self.KO_WAL is not None else self.ko_flush_reason()
+                if reason not in (None, "write"):
+                    self.ko_flush(reason)
+
+
+    def batch(self):
+        """batch()
+
+            Returns a context manager that holds the commits back until
+                the end of the with block, the writes in it (from any
+                thread) are committed together. The write buffer's
+                thresholds still commit a batch that outgrows them and
+                batches can be nested.
+            ex.: with db.batch():
+                     for post in posts:
+                         db.store(post["id"], post)"""
+        return Ko_Batch(self)
+
+
+    def ko_begin_batch(self):
+        """INTERNAL FUNCTION"""
+        with self.KO_LOCK:
+            self.KO_BATCHES += 1
+
+
+    def ko_end_batch(self):
+        """INTERNAL FUNCTION"""
+        with self.KO_LOCK:
+            self.KO_BATCHES -= 1
+            if not self.KO_BATCHES and self.KO_WAL is None and \
+                    (self.KO_COMMIT_CACHE or self.KO_META_COMMIT_CACHE):
+                self.ko_flush("batch")
+
+
+    def ko_store_documents(self, documents, data_suffix, sync = False):
+        """INTERNAL FUNCTION"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        codec = self.ko_codec(data_suffix)
+        count = 0
+        for pid, data in documents:
+            self.ko_stage(pid, data, data_suffix, codec)
+            count += 1
+
+        if sync and self.KO_WAL is not None:
+            self.KO_WAL.sync()
+        return count
+
+
+    def ko_stage(self, pid, data, data_suffix, codec, cache = True):
+        """INTERNAL FUNCTION
+
+            Records a store in the meta, the indexes, the write-ahead log
+                or commit cache and the document cache, bulk loads drop
+                the document from the cache instead."""
+        if isinstance(data, Ko_Document):
+            data = data.ko_data
+        elif isinstance(data, Map):
+            data = dict(data)
+        pid = ko_string_id(pid)
+        uid = self.ko_new_uid()
+        versions = self.get_meta(pid, data_suffix)
+        if versions is not None:
+            self.ko_account_dead(versions[0], data_suffix)
+        self.store_meta(pid, uid, data_suffix)
+        self.ko_index_document(data_suffix, pid, data)
+
+        if self.KO_WAL is not None:
+            # The log record is the only write on the store path
+            payload = codec.dumps(data)
+            self.KO_WAL.append({"t": data_suffix, "i": pid, "u": uid, "c": codec.name}, payload)
+        else:
+            payload = None
+
+        # Store Data to the commit cache
+        self.KO_COMMIT_CACHE["{}.{}".format(uid, data_suffix)] = (uid, data_suffix, data, codec.name, payload)
+        if self.KO_FLUSH_BYTES is not None:
+            self.KO_PENDING_BYTES += len(payload) if payload is not None else ko_sizeof(data)
+
+        # Stores cache entry
+        if cache:
+            self.KO_CACHE.put(data_suffix, pid, data)
+        else:
+            self.KO_CACHE.discard(data_suffix, pid)
+
+
+    def get_many(self, fids, data_suffix = None):
+        """get_many(List:fids, String:data_suffix = None)
+
+            Returns the documents of the ids in the same order, None for
+                the missing ones. Uncached documents are read in archive
+                order.
+            Options:
+                fids = List:required
+                    > The ids of the documents to retrieve
+                data_suffix = String:None
+                    > The data suffix (table) on where to retrieve the documents.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        fids = [ko_string_id(fid) for fid in fids]
+        with self.KO_LOCK.read:
+            return self.ko_get_many(fids, data_suffix)
+
+
+    def ko_get_many(self, fids, data_suffix):
+        """INTERNAL FUNCTION"""
+        result = [None] * len(fids)
+        unread = []
+        for position, fid in enumerate(fids):
+            versions = self.get_meta(fid, data_suffix)
+            if versions is None:
+                continue
+
+            cached = self.KO_CACHE.get(data_suffix, fid)
+            if cached is not None:
+                result[position] = Ko_Document(cached, fid)
+                continue
+
+            name = "{}.{}".format(versions[0], data_suffix)
+            if name in self.KO_COMMIT_CACHE:
+                offset = -1
+            else:
+                offset = self.ko_member(name).header_offset
+            unread.append((offset, position, fid, versions[0]))
+
+        # Sequential disk access
+        unread.sort(key=lambda x: x[:2])
+        for offset, position, fid, uid in unread:
+            data = self.ko_read_document(uid, data_suffix)
+            self.KO_CACHE.put(data_suffix, fid, data)
+            result[position] = Ko_Document(data, fid)
+        return result
+
+
+    def exists_many(self, fids, data_suffix = None):
+        """exists_many(List:fids, String:data_suffix = None)
+
+            Returns a list of booleans, True where the document exists.
+            Options:
+                fids = List:required
+                    > The ids of the documents to check
+                data_suffix = String:None
+                    > The data suffix (table) on where to check.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        with self.KO_LOCK.read:
+            return [self.get_meta(ko_string_id(fid), data_suffix) is not None for fid in fids]
+
+
+    def get(self, fid, data_suffix = None, version = None, as_of = None):
+        """get(String:fid, String:data_suffix = None, Int:version = None, Float:as_of = None)
+
+            Returns a database document as a read-only dict, see
+                Ko_Document.
+            Options:
+                fid = String:Required
+                    > The id of the document to retrieve
+                data_suffix = String:None
+                    > The data suffix (table) on where to retrieve the document.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)
+                version = Int:None
+                    > Returns that version of the document instead, 1
+                        is the oldest one kept, see history().
+                as_of = Float:None
+                    > Returns the document as it was at a unix
+                        timestamp, datetime or snapshot instead.
+                (None if the document didn't exist or was deleted)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        fid = ko_string_id(fid)
+        if version is not None or as_of is not None:
+            with self.KO_LOCK.read:
+                return self.ko_get_version(fid, data_suffix, version, None if as_of is None else ko_ticks(as_of))
+
+        # Misses don't wait for the lock
+        if self.ko_absent(fid, data_suffix):
+            return None
+        return self.ko_get(fid, data_suffix)
+
+
+    def ko_get(self, fid, data_suffix):
+        """INTERNAL FUNCTION"""
+        with self.KO_LOCK.read:
+            if self.get_meta(fid, data_suffix) is not None:
+                cached = self.KO_CACHE.get(data_suffix, fid)
+                if cached is not None:
+                    return Ko_Document(cached, fid)
+
+                # uid = self.KO_META[data_suffix][fid][0]
+                uid = self.get_meta(fid, data_suffix)[0]
+                # print("UID: {}".format(uid))
+
+                data = self.ko_read_document(uid, data_suffix)
+                self.KO_CACHE.put(data_suffix, fid, data) # Add it to the memory
+                return Ko_Document(data, fid) # Attaches the ID on the view
+           
+        return None
+
+
+    def ko_get_version(self, fid, data_suffix, version, ticks):
+        """INTERNAL FUNCTION
+
+            Reads a past version of a document, by number or as of
+                ticks. Past versions aren't cached."""
+        versions = self.ko_versions(fid, data_suffix)
+        if versions is None:
+            return None
+
+        if version is not None:
+            if version < 1:
+                raise ValueError("Versions start at 1, got {}".format(version))
+            uid = versions[len(versions) - version] if version <= len(versions) else None
+        else:
+            uid = ko_version_at(versions, ticks)
+        if ko_is_tombstone(uid):
+            return None
+        return Ko_Document(self.ko_read_document(uid, data_suffix), fid)
+
+
+    def history(self, fid, data_suffix = None):
+        """history(String:fid, String:data_suffix = None)
+
+            Returns the versions of a document kept in the database,
+                newest first, as {"version": Int, "time": Float,
+                "deleted": Bool}. The time is a unix timestamp, None
+                for versions stored before times were recorded.
+            Options:
+                fid = String:Required
+                    > The id of the document
+                data_suffix = String:None
+                    > The data suffix (table) of the document.
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK.read:
+            versions = list(self.ko_versions(ko_string_id(fid), data_suffix) or ())
+
+        history = []
+        for position, uid in enumerate(versions):
+            ticks = ko_version_ticks(uid)
+            history.append({"version": len(versions) - position,
+                            "time": None if ticks is None else ticks / 10 ** 7,
+                            "deleted": ko_is_tombstone(uid)})
+        return history
+
+
+    def snapshot(self, data_suffix = None):
+        """snapshot()
+
+            Returns a Ko_Snapshot, a read-only view of every table as it
+                is now that later stores and deletes don't change.
+                (A table's snapshot covers the other tables too)
+                Close it (or use it as a context manager) so compaction
+                can reclaim the versions it reads.
+            ex.: with db.snapshot() as snapshot:
+                     snapshot.table("posts").get("1")"""
+        self.ko_check_open()
+        with self.KO_LOCK:
+            # Later versions get later ticks than the snapshot
+            self.KO_CLOCK = max(time.time_ns() // 100, self.KO_CLOCK)
+            self.KO_SNAPSHOTS.append(self.KO_CLOCK)
+            return Ko_Snapshot(self, self.KO_CLOCK)
+
+
+    def ko_advance_clock(self, version):
+        """INTERNAL FUNCTION
+
+            Moves the clock up to a stored version's ticks."""
+        ticks = ko_version_ticks(version)
+        if ticks is not None and ticks > self.KO_CLOCK:
+            self.KO_CLOCK = ticks
+
+
+    def ko_new_uid(self):
+        """INTERNAL FUNCTION
+
+            Returns the uid of a new version, ordered after every version
+                and snapshot before it."""
+        self.KO_CLOCK = max(time.time_ns() // 100, self.KO_CLOCK + 1)
+        return ko_time_uid(self.KO_CLOCK, self.KO_CLOCK_SEQ, self.KO_NODE)
+
+
+    def uid_generator(self):
+        def generate():
+            global KEYS
+            return "".join(random.choice(KEYS) for x in range(0, 8))
+
+    def commit(self):
+        """commit()
+
+            Commits the database to the file.
+            Note: Doesn't need to be called if the no_commit option 
+                    is set to True.
+                  With the write-ahead log enabled this checkpoints
+                    the log into the database."""
+        self.ko_check_open()
+        with self.KO_LOCK:
+            then = time.perf_counter()
+            pending_bytes = self.KO_PENDING_BYTES
+            written = self.ko_write_members()
+
+            if self.KO_DEAD_SPACE_DIRTY:
+                self.ko_set_config("dead_space", self.KO_DEAD_SPACE)
+                self.KO_DEAD_SPACE_DIRTY = False
+
+            # The archive has to be durable before the meta chunks point to it
+            durable = self.KO_WAL is not None
+            if durable and written:
+                self.ko_sync_archive()
+
+            for meta_chunk in range(0, len(self.KO_META)):
+                if meta_chunk in self.KO_META_COMMIT_CACHE:
+                    self.ko_write_file(self.ko_chunk_path(meta_chunk),
+                                       json.dumps(self.KO_META[meta_chunk]), sync=durable)
+
+            if self.KO_META_COMMIT_CACHE:
+                self.KO_MANIFEST_DIRTY = True
+
+            for indexes in self.KO_INDEXES.values():
+                for index in indexes.values():
+                    index.flush()
+
+            self.KO_META_COMMIT_CACHE.clear()
+            self.KO_PENDING_SINCE = None
+            if written:
+                self.ko_count_flush(written, pending_bytes, time.perf_counter() - then)
+
+            if durable:
+                self.KO_WAL.reset()
+
+
+    def ko_write_members(self):
+        """INTERNAL FUNCTION
+
+            Writes the staged documents to the archive, returns how many
+                were written. Their meta is left to commit()."""
+        self.ko_train_dicts()
+        for name, item in self.KO_COMMIT_CACHE.items():
+            payload = item[4] if item[4] is not None else CODECS[item[3]].dumps(item[2])
+            self.ko_write_document(item[0], item[1], item[3], payload)
+            if name in self.KO_SUPERSEDED:
+                self.ko_account_dead(item[0], item[1], self.KO_SUPERSEDED.pop(name))
+
+        written = len(self.KO_COMMIT_CACHE)
+        if written:
+            # Readers have their own handles on the archive file
+            self.KO_ZIP.fp.flush()
+            self.KO_MANIFEST_DIRTY = True
+            self.KO_COMMIT_CACHE.clear()
+            self.KO_PENDING_BYTES = 0
+        return written
+
+
+    def wal_replay(self):
+        """INTERNAL FUNCTION
+
+            Re-applies the write-ahead log records that didn't make it
+                into a checkpoint."""
+        for header, payload in self.KO_WAL.replay():
+            fid, uid, data_suffix = str(header["i"]), header["u"], header["t"]
+            codec = header["c"] if "c" in header else "yaml"
+            self.ko_advance_clock(uid)
+            versions = self.get_meta(fid, data_suffix)
+            if ko_is_tombstone(uid):
+                if versions is not None:
+                    self.ko_remove_documents([fid], data_suffix, log=False, tombstone=uid)
+                continue
+            if versions is None or uid not in versions:
+                self.store_meta(fid, uid, data_suffix)
+                if data_suffix in self.KO_INDEXES:
+                    self.ko_index_document(data_suffix, fid, CODECS[codec].loads(payload, self.KO_LOADTYPE))
+
+            try:
+                self.ko_member("{}.{}".format(uid, data_suffix))
+            except KeyError:
+                self.KO_COMMIT_CACHE["{}.{}".format(uid, data_suffix)] = (uid, data_suffix, None, codec, payload)
+
+        self.commit()
+
+
+    def wal_worker(self):
+        """INTERNAL FUNCTION
+
+            Background group commit and checkpointing of the
+                write-ahead log."""
+        interval = (self.KO_WAL.sync_ms or 100) / 1000.0
+        while not self.KO_WAL_STOP.wait(interval):
+            with self.KO_LOCK:
+                if self.KO_WAL.records >= self.KO_WAL_CHECKPOINT:
+                    self.commit()
+                else:
+                    self.KO_WAL.sync()
+
+
+    def init_meta(self):
+        """INTERNAL FUNCTION
+
+            Loads the meta chunks in order and builds the document index."""
+        meta_filemask = os.path.join(self.KO_FOLDER, "meta", "*.meta")
+        chunk_files = sorted(glob.glob(meta_filemask),
+                             key=lambda x: int(os.path.basename(x).split(".")[0]))
+        with ko_gc_paused():
+            for file in chunk_files:
+                with open(file) as f:
+                    self.KO_META.append(json.loads(f.read()))
+
+        if not self.KO_META:
+            self.KO_META.append({})
+
+        # Later chunks take precedence over earlier ones
+        clock = self.KO_CLOCK
+        for meta_chunk in range(0, len(self.KO_META)):
+            for data_suffix, ids in self.KO_META[meta_chunk].items():
+                index = self.KO_ID_INDEX.setdefault(data_suffix, {})
+                deleted = self.KO_DELETED.setdefault(data_suffix, set())
+                for fid, versions in ids.items():
+                    index[fid] = meta_chunk
+                    if ko_is_tombstone(versions[0]):
+                        deleted.add(fid)
+                    else:
+                        deleted.discard(fid)
+                    ticks = ko_version_ticks(versions[0])
+                    if ticks is not None and ticks > clock:
+                        clock = ticks
+        self.KO_CLOCK = clock
+
+        self.KO_LAST_CHUNK_SIZE = sum(len(x) for x in self.KO_META[-1].values())
+
+
+    def store_meta(self, fid, data, data_suffix = None):
+        """INTERNAL FUNCTION
+
+            Adds a version to the head of a document's meta, see
+                ko_is_tombstone."""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        fid = ko_string_id(fid)
+        if self.KO_PENDING_SINCE is None:
+            self.KO_PENDING_SINCE = time.monotonic()
+        index = self.KO_ID_INDEX.setdefault(data_suffix, {})
+        if ko_is_tombstone(data):
+            self.KO_DELETED.setdefault(data_suffix, set()).add(fid)
+            self.KO_LIVE_IDS.pop(data_suffix, None)
+        elif fid in self.KO_DELETED.get(data_suffix, ()):
+            self.KO_DELETED[data_suffix].discard(fid)
+            self.KO_LIVE_IDS.pop(data_suffix, None)
+
+        meta_chunk = index.get(fid)
+        if meta_chunk is not None:
+            self.KO_META[meta_chunk][data_suffix][fid].insert(0, data)
+            # Set this chunk to save on commit
+            self.KO_META_COMMIT_CACHE[meta_chunk] = True
+            return
+
+        # Create a new chunk if the current chunk is full
+        if self.KO_LAST_CHUNK_SIZE >= self.KO_CONFIG["metasize"]:
+            self.KO_META.append({})
+            self.KO_LAST_CHUNK_SIZE = 0
+
+        # IF the data is new, append to the last meta chunk
+        if data_suffix not in self.KO_META[-1]:
+            self.KO_META[-1][data_suffix] = {}
+
+        self.KO_META[-1][data_suffix][fid] = [data]
+        index[fid] = len(self.KO_META) - 1
+        if data_suffix in self.KO_SORTED_IDS:
+            self.KO_NEW_IDS.setdefault(data_suffix, []).append(fid)
+        self.KO_LAST_CHUNK_SIZE += 1
+        self.KO_META_COMMIT_CACHE[len(self.KO_META) - 1] = True
+        return
+
+
+    def get_meta(self, fid, data_suffix = None):
+        """INTERNAL FUNCTION"""
+        versions = self.ko_versions(fid, data_suffix)
+        if versions is None:
+            return None
+
+        # Deleted
+        head = versions[0]
+        if head is None or head[0] == TOMBSTONE:
+            return None
+        return versions
+
+
+    def ko_versions(self, fid, data_suffix = None):
+        """INTERNAL FUNCTION
+
+            Returns every version of a document newest first, tombstones
+                included."""
+        self.ko_check_open()
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        index = self.KO_ID_INDEX.get(data_suffix)
+        if index is None:
+            return None
+
+        meta_chunk = index.get(fid)
+        if meta_chunk is None:
+            return None
+        return self.KO_META[meta_chunk][data_suffix][fid]
+
+
+    def items(self, data_suffix = None):
+        """items(String:data_suffix = None)
+
+            Returns a live view of the table's IDs in sorted order, see
+                Ko_Ids. len() and `in` don't build a list, indexing and
+                slicing work like a list's.
+                (Ids are sorted as strings, a number id is its string)
+            Options:
+                data_suffix = String:None
+                    > The data suffix (table) on where to retrieve the document.
+                        (Retrieves the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        self.ko_check_open()
+        return Ko_Ids(self, self.KO_DATA_SUFFIX if data_suffix is None else data_suffix)
+
+
+    def ko_ids(self, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns a list of the table's IDs in the order they were
+                first stored, which is close to the archive's order."""
+        self.ko_check_open()
+        with self.KO_LOCK.read:
+            deleted = self.KO_DELETED.get(data_suffix)
+            if not deleted:
+                return list(self.KO_ID_INDEX.get(data_suffix, {}))
+            return [fid for fid in self.KO_ID_INDEX.get(data_suffix, {}) if fid not in deleted]
+
+
+    def scan(self, start = None, end = None, prefix = None, reverse = False, limit = None, output = "id",
+             data_suffix = None):
+        """scan(String:start = None, String:end = None, String:prefix = None, ...)
+
+            Returns a generator of the table's IDs (or documents) in id
+                order from the sorted id index, reading only the range.
+                Ids are ordered as strings, zero pad numeric ids to
+                scan them as numbers.
+            ex.: users.scan(prefix="user:2026-10", limit=100)
+            Options:
+                start = String:None
+                    > The first id of the range, inclusive.
+                end = String:None
+                    > The end of the range, exclusive.
+                prefix = String:None
+                    > Only the ids starting with prefix.
+                reverse = Bool:False
+                    > Scans from the end of the range down.
+                limit = Int:None
+                    > Stops after limit ids.
+                output = String:id
+                    > Yields the ids, or the documents as "view",
+                        "dict" or "raw", see get_all.
+                data_suffix = String:None
+                    > The data suffix (table) to scan.
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        if output != "id":
+            ko_check_output(output)
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        if prefix is not None:
+            start = prefix if start is None else max(start, prefix)
+            prefix_end = ko_prefix_end(prefix)
+            if prefix_end is not None:
+                end = prefix_end if end is None else min(end, prefix_end)
+        return self.ko_scan_ids(data_suffix, start, end, reverse, limit, output)
+
+
+    def ko_scan_ids(self, data_suffix, start, end, reverse, limit, output):
+        """INTERNAL FUNCTION
+
+            Walks the sorted ids SCAN_BATCH at a time, each batch resumes
+                after the last id so stores in between don't shift it."""
+        count = 0
+        last = None
+        while limit is None or count < limit:
+            with self.KO_LOCK.read:
+                ids = self.ko_sorted_ids(data_suffix)
+                low = 0 if start is None else bisect.bisect_left(ids, start)
+                high = len(ids) if end is None else bisect.bisect_left(ids, end)
+                if reverse:
+                    if last is not None:
+                        high = min(high, bisect.bisect_left(ids, last))
+                    batch = ids[max(low, high - SCAN_BATCH):high][::-1]
+                else:
+                    if last is not None:
+                        low = max(low, bisect.bisect_right(ids, last))
+                    batch = ids[low:min(high, low + SCAN_BATCH)]
+                if not batch:
+                    return
+                last = batch[-1]
+                deleted = self.KO_DELETED.get(data_suffix)
+                if deleted:
+                    batch = [fid for fid in batch if fid not in deleted]
+
+            for fid in batch[:None if limit is None else limit - count]:
+                if output == "id":
+                    yield fid
+                else:
+                    data = self.ko_read_output(fid, data_suffix, output)
+                    if data is None:
+                        continue
+                    yield data
+                count += 1
+
+
+    def ko_sorted_ids(self, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns the table's sorted ids, merging in the ids added
+                since. Called under the read lock."""
+        self.ko_check_open()
+        with self.KO_SORTED_LOCK:
+            ids = self.KO_SORTED_IDS.get(data_suffix)
+            if ids is None:
+                ids = sorted(self.KO_ID_INDEX.get(data_suffix, {}))
+                self.KO_NEW_IDS.pop(data_suffix, None)
+            elif data_suffix in self.KO_NEW_IDS:
+                added = sorted(self.KO_NEW_IDS.pop(data_suffix))
+                if not ids or ids[-1] < added[0]:
+                    # Ids past the last one (counters, timestamps...) only
+                    #   grow the list, other readers may be bisecting it
+                    ids.extend(added)
+                else:
+                    # A new list, timsort finds the two sorted runs and
+                    #   merges them in one pass
+                    ids = ids + added
+                    ids.sort()
+            else:
+                return ids
+            self.KO_SORTED_IDS[data_suffix] = ids
+            return ids
+
+
+    def ko_live_ids(self, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns the table's sorted ids without the deleted ones, kept
+                until the sorted ids change or an id is deleted. Called
+                under the read lock."""
+        ids = self.ko_sorted_ids(data_suffix)
+        deleted = self.KO_DELETED.get(data_suffix)
+        if not deleted:
+            return ids
+        with self.KO_SORTED_LOCK:
+            live = self.KO_LIVE_IDS.get(data_suffix)
+            if live is None or live[0] is not ids or live[1] != len(ids):
+                live = (ids, len(ids), [fid for fid in ids if fid not in deleted])
+                self.KO_LIVE_IDS[data_suffix] = live
+            return live[2]
+
+
+    def tables(self):
+        """tables()
+
+            Returns a list of the database tables."""
+        return self.KO_CONFIG["tables"]
+
+
+    def delete(self, fid, data_suffix = None):
+        """delete(String:fid, String:data_suffix = None)
+
+            Deletes a document, returns False if it doesn't exist.
+                The document's id is tombstoned, its space is reclaimed
+                by compact().
+            Options:
+                fid = String:required
+                    > The id of the document to delete
+                data_suffix = String:None
+                    > The table of the document.
+                        (Deletes from the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        return self.ko_write(self.ko_remove_documents, [fid], data_suffix) == 1
+
+
+    def delete_many(self, fids, data_suffix = None):
+        """delete_many(List:fids, String:data_suffix = None)
+
+            Deletes documents with a single commit at the end, returns
+                the number of documents deleted.
+            Options:
+                fids = List:required
+                    > The ids of the documents to delete
+                data_suffix = String:None
+                    > The table of the documents.
+                        (Deletes from the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        return self.ko_write(self.ko_remove_documents, fids, data_suffix)
+
+
+    def ko_remove_documents(self, fids, data_suffix, log = True, tombstone = None):
+        """INTERNAL FUNCTION
+
+            Tombstones the documents in the meta, drops them from the
+                indexes and the cache and logs the deletes. A replayed
+                delete passes the tombstone it was logged with."""
+        count = 0
+        for fid in map(ko_string_id, fids):
+            versions = self.get_meta(fid, data_suffix)
+            if versions is None:
+                continue
+
+            self.ko_account_dead(versions[0], data_suffix)
+            mark = tombstone if tombstone is not None else TOMBSTONE + self.ko_new_uid()
+            self.store_meta(fid, mark, data_suffix)
+            for index in self.KO_INDEXES.get(data_suffix, {}).values():
+                index.remove(fid)
+            if log and self.KO_WAL is not None:
+                self.KO_WAL.append({"t": data_suffix, "i": fid, "u": mark}, b"")
+            self.KO_CACHE.discard(data_suffix, fid)
+            count += 1
+        return count
+
+
+    def drop_table(self, table = None, reclaim = True, data_suffix = None):
+        """drop_table(String:table, Bool:reclaim = True)
+
+            Removes a table with all of its documents and indexes.
+            Options:
+                table = String:required
+                    > The table to drop.
+                reclaim = Bool:True
+                    > Rewrites the archive without the table's documents
+                        in one streaming pass, otherwise their space is
+                        dead until the next compact().
+                data_suffix = String:None
+                    > Same as table.
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        table = data_suffix if table is None else table
+        with self.KO_LOCK:
+            self.commit()
+            dead = self.ko_table_space(table)
+            for meta_chunk in range(0, len(self.KO_META)):
+                if table in self.KO_META[meta_chunk]:
+                    del self.KO_META[meta_chunk][table]
+                    self.KO_META_COMMIT_CACHE[meta_chunk] = True
+            self.KO_LAST_CHUNK_SIZE = sum(len(x) for x in self.KO_META[-1].values())
+            self.KO_ID_INDEX.pop(table, None)
+            self.KO_DELETED.pop(table, None)
+            self.KO_SORTED_IDS.pop(table, None)
+            self.KO_NEW_IDS.pop(table, None)
+            self.KO_LIVE_IDS.pop(table, None)
+            self.KO_CACHE.drop(table)
+
+            for index in self.KO_INDEXES.pop(table, {}).values():
+                if os.path.exists(index.path):
+                    os.remove(index.path)
+            table_config = self.ko_get_config("table_config") or {}
+            if table in table_config:
+                del table_config[table]
+                self.ko_set_config("table_config", table_config)
+            self.ko_set_config("tables", [x for x in self.tables() if x != table])
+
+            if self.KO_DEAD_SPACE is not None:
+                self.KO_DEAD_SPACE[table] = dead[0] + dead[1]
+                self.KO_DEAD_SPACE_DIRTY = True
+            self.commit()
+
+        if reclaim:
+            for _ in self.ko_compact_steps([table], 1, None, 1000):
+                pass
+
+
+    def dead_space(self, data_suffix = None):
+        """dead_space(String:data_suffix = None)
+
+            Returns the bytes of the table's archive members that only
+                hold superseded or deleted documents, compact()
+                reclaims them.
+            Options:
+                data_suffix = String:None
+                    > The table to check.
+                        (Checks the default database if unspecified)
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        with self.KO_LOCK:
+            if self.KO_DEAD_SPACE is None:
+                self.KO_DEAD_SPACE = {}
+                self.ko_measure_dead_space(None)
+            return self.KO_DEAD_SPACE.get(data_suffix, 0)
+
+
+    def ko_account_dead(self, uid, data_suffix, counted = None):
+        """INTERNAL FUNCTION
+
+            Counts a member that is no longer a document's latest version
+                as dead space. Pending members are counted by their
+                payload until they're written, counted is what was
+                counted for them then."""
+        if self.KO_DEAD_SPACE is None or ko_is_tombstone(uid):
+            return
+
+        name = "{}.{}".format(uid, data_suffix)
+        pending = self.KO_COMMIT_CACHE.get(name)
+        if pending is not None and counted is None:
+            if name in self.KO_SUPERSEDED:
+                return
+            size = len(pending[4]) if pending[4] is not None else 0
+            self.KO_SUPERSEDED[name] = size
+        else:
+            try:
+                size = self.ko_member(name).compress_size - (counted or 0)
+            except KeyError:
+                return
+        self.KO_DEAD_SPACE[data_suffix] = self.KO_DEAD_SPACE.get(data_suffix, 0) + size
+        self.KO_DEAD_SPACE_DIRTY = True
+
+
+    def ko_table_space(self, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns the (live, dead) bytes of a table's members."""
+        live = dead = 0
+        for fid, meta_chunk in self.KO_ID_INDEX.get(data_suffix, {}).items():
+            for position, uid in enumerate(self.KO_META[meta_chunk][data_suffix][fid]):
+                if ko_is_tombstone(uid):
+                    continue
+                try:
+                    size = self.ko_member("{}.{}".format(uid, data_suffix)).compress_size
+                except KeyError:
+                    continue
+                if position == 0:
+                    live += size
+                else:
+                    dead += size
+        return live, dead
+
+
+    def ko_measure_dead_space(self, tables):
+        """INTERNAL FUNCTION
+
+            Recounts the dead space of the tables, or of every table if
+                tables is None."""
+        if self.KO_DEAD_SPACE is None:
+            return
+
+        if tables is None:
+            self.KO_DEAD_SPACE.clear()
+        for data_suffix in self.KO_ID_INDEX if tables is None else tables:
+            self.KO_DEAD_SPACE[data_suffix] = self.ko_table_space(data_suffix)[1]
+        self.KO_DEAD_SPACE = {table: size for table, size in self.KO_DEAD_SPACE.items()
+                              if table in self.KO_ID_INDEX}
+        self.ko_set_config("dead_space", self.KO_DEAD_SPACE)
+        self.KO_DEAD_SPACE_DIRTY = False
+
+
+    def compact(self, table = None, keep_versions = 1, progress = None,
+                incremental = False, batch_size = 1000, data_suffix = None):
+        """compact(String:table = None, Int:keep_versions = 1, ...)
+
+            Reclaims superseded document versions by streaming the live
+                members into a fresh archive, rewriting the meta chunks
+                and swapping the archive in place.
+            Options:
+                table = String:None
+                    > The table to compact.
+                        (Compacts every table if unspecified)
+                keep_versions = Int:1
+                    > The number of versions to keep per document.
+                progress = Function:None
+                    > Called with (copied, total) after every batch.
+                incremental = Bool:False
+                    > Returns a generator that copies one batch per
+                        iteration so the compaction can be interleaved
+                        with other work, the archive is swapped on the
+                        last iteration.
+                batch_size = Int:1000
+                    > The number of members copied per batch.
+                data_suffix = String:None
+                    > Same as table.
+                        (***NOTE: This option is usually handled 
+                                by the KO_Table Object.***)"""
+        table = data_suffix if table is None else table
+        tables = None if table is None else [table]
+        steps = self.ko_compact_steps(tables, max(keep_versions, 1), progress, batch_size)
+        if incremental:
+            return steps
+
+        for _ in steps:
+            pass
+
+
+    def ko_compact_steps(self, tables, keep_versions, progress, batch_size):
+        """INTERNAL FUNCTION"""
+        with self.KO_LOCK:
+            self.commit()
+            live = self.ko_live_members(tables, keep_versions)
+
+        compact_path = "{}.compact".format(self.KO_DB_FILEPATH)
+        archive = zipfile.ZipFile(compact_path, mode="w", allowZip64=True)
+        copied = set()
+        try:
+            for start in range(0, len(live), batch_size):
+                with self.KO_LOCK:
+                    for name in live[start:start + batch_size]:
+                        self.ko_copy_member(archive, name)
+                        copied.add(name)
+
+                if progress is not None:
+                    progress(len(copied), len(live))
+                yield len(copied), len(live)
+
+            with self.KO_LOCK:
+                # Pick up whatever was stored in between the batches
+                self.commit()
+                for name in self.ko_live_members(tables, keep_versions):
+                    if name not in copied:
+                        self.ko_copy_member(archive, name)
+                        copied.add(name)
+                archive.close()
+
+                # The trimmed meta only references members that exist in
+                # both archives, so it is written before the swap
+                self.ko_trim_meta(tables, keep_versions)
+                self.commit()
+
+                self.KO_ZIP.close()
+                self.KO_MAP = None
+                os.replace(compact_path, self.KO_DB_FILEPATH)
+                self.KO_ZIP = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="a", allowZip64=True)
+                self.KO_ARCHIVE_GENERATION += 1
+                self.KO_MANIFEST_DIRTY = True
+                self.ko_measure_dead_space(tables)
+
+            if progress is not None:
+                progress(len(copied), len(copied))
+            yield len(copied), len(copied)
+
+        finally:
+            if os.path.exists(compact_path):
+                archive.close()
+                os.remove(compact_path)
+
+
+    def ko_live_members(self, tables, keep_versions):
+        """INTERNAL FUNCTION
+
+            Returns the archive members referenced by the document index,
+                keeping keep_versions versions for the listed tables."""
+        members = []
+        for data_suffix, index in self.KO_ID_INDEX.items():
+            keep = keep_versions if tables is None or data_suffix in tables else None
+            for fid, meta_chunk in index.items():
+                for uid in self.ko_kept_versions(self.KO_META[meta_chunk][data_suffix][fid], keep):
+                    if not ko_is_tombstone(uid):
+                        members.append("{}.{}".format(uid, data_suffix))
+        return members + self.ko_dict_members()
+
+
+    def ko_kept_versions(self, versions, keep):
+        """INTERNAL FUNCTION
+
+            Returns the versions compaction keeps, the keep newest ones
+                and the ones the open snapshots read."""
+        if keep is None or len(versions) <= keep:
+            return versions
+        read = set(ko_version_at(versions, ticks) for ticks in self.KO_SNAPSHOTS)
+        return [uid for position, uid in enumerate(versions) if position < keep or uid in read]
+
+
+    def ko_dict_members(self):
+        """INTERNAL FUNCTION
+
+            Returns the compression dictionaries of every table."""
+        table_config = self.ko_get_config("table_config") or {}
+        return [config["compression_dict_member"] for config in table_config.values()
+                if config.get("compression_dict_member")]
+
+
+    def ko_trim_meta(self, tables, keep_versions):
+        """INTERNAL FUNCTION
+
+            Drops superseded versions and stale duplicate ids from the
+                meta chunks."""
+        for meta_chunk in range(0, len(self.KO_META)):
+            for data_suffix, ids in self.KO_META[meta_chunk].items():
+                if tables is not None and data_suffix not in tables:
+                    continue
+
+                index = self.KO_ID_INDEX.get(data_suffix, {})
+                for fid in list(ids):
+                    if index.get(fid) != meta_chunk:
+                        del ids[fid]
+                        self.KO_META_COMMIT_CACHE[meta_chunk] = True
+                        continue
+
+                    kept = self.ko_kept_versions(ids[fid], keep_versions)
+                    if ko_is_tombstone(kept[0]) and len(kept) == 1 and keep_versions == 1:
+                        # Nothing left of a deleted document
+                        del ids[fid]
+                        del index[fid]
+                        self.KO_DELETED[data_suffix].discard(fid)
+                        self.KO_SORTED_IDS.pop(data_suffix, None)
+                    elif len(kept) < len(ids[fid]):
+                        ids[fid][:] = kept
+                    else:
+                        continue
+                    self.KO_META_COMMIT_CACHE[meta_chunk] = True
+
+        self.KO_LAST_CHUNK_SIZE = sum(len(x) for x in self.KO_META[-1].values())
+
+
+    def ko_copy_member(self, archive, name):
+        """INTERNAL FUNCTION
+
+            Streams a member of the database archive into another archive."""
+        info = self.KO_ZIP.getinfo(name)
+        # ZipFile.open resets the sizes of the info it writes, copy it
+        target = zipfile.ZipInfo(info.filename, info.date_time)
+        target.compress_type = info.compress_type
+        target.comment = info.comment
+        target.external_attr = info.external_attr
+        with self.KO_ZIP.open(info) as src, \
+                archive.open(target, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+            shutil.copyfileobj(src, dst)
+
+
+    def import_jsonl(self, path, table = None, id_field = "_id", batch_size = BULK_BATCH, progress = None,
+                     data_suffix = None):
+        """import_jsonl(String:path, String:table = None, String:id_field = "_id", ...)
+
+            Stores the documents of a JSON Lines file (a json object per
+                line) and returns how many were stored. The file is read
+                batch_size documents at a time, each batch is written to
+                the archive and the meta is committed once at the end.
+            ex.: db.import_jsonl("posts.jsonl", "posts", id_field="id")
+            Options:
+                path = String:required
+                    > The file to import.
+                table = String:None
+                    > The table where the documents should be stored.
+                        (Stores on the default database if unspecified)
+                id_field = String:_id
+                    > The field holding the document ids, _id is taken
+                        out of the documents like export_jsonl writes it.
+                batch_size = Int:1000
+                    > Documents written at a time.
+                progress = Function:None
+                    > Called with (imported, None) after every batch.
+                data_suffix = String:None
+                    > Same as table.
+                        (***NOTE: This option is usually handled
+                                by the KO_Table Object.***)"""
+        table = data_suffix if table is None else table
+        table = self.KO_DATA_SUFFIX if table is None else table
+        self.table(table)
+
+        documents = ko_read_jsonl(path, id_field)
+        count = 0
+        try:
+            while True:
+                batch = list(itertools.islice(documents, batch_size))
+                if not batch:
+                    break
+                with self.KO_LOCK:
+                    self.ko_import_batch(batch, table)
+                count += len(batch)
+                if progress is not None:
+                    progress(count, None)
+        finally:
+            self.commit()
+        return count
+
+
+    def ko_import_batch(self, documents, data_suffix):
+        """INTERNAL FUNCTION
+
+            Stages documents without caching them and writes them to the
+                archive, the meta waits for the next commit."""
+        codec = self.ko_codec(data_suffix)
+        for pid, data in documents:
+            self.ko_stage(pid, data, data_suffix, codec, cache=False)
+        self.ko_write_members()
+
+
+    def export_jsonl(self, path, table = None, data_suffix = None):
+        """export_jsonl(String:path, String:table = None)
+
+            Writes a table's documents to a JSON Lines file as they are
+                when it's called, with their id in _id, and returns how
+                many were written. Documents are read one at a time
+                from a snapshot so writers carry on meanwhile.
+            ex.: db.table("posts").export_jsonl("posts.jsonl")
+            Options:
+                path = String:required
+                    > The file to write, replaced if it exists.
+                table = String:None
+                    > The table to export.
+                        (Exports the default database if unspecified)
+                data_suffix = String:None
+                    > Same as table.
+                        (***NOTE: This option is usually handled
+                                by the KO_Table Object.***)"""
+        table = data_suffix if table is None else table
+        count = 0
+        with self.snapshot() as snapshot, open(path, "w") as f:
+            for document in snapshot.get_all(table, output="dict"):
+                f.write(json.dumps(document, default=str) + "\n")
+                count += 1
+        return count
+
+
+    def backup(self, destination, progress = None, batch_size = BULK_BATCH):
+        """backup(String:destination, Function:progress = None, Int:batch_size = 1000)
+
+            Copies the database to a new database folder while it's in
+                use. The copy is consistent as of the call and compacted,
+                it only has the latest version of every document. Writers
+                wait for one batch at a time. Returns the number of
+                documents copied.
+            ex.: db.backup("ko-test.db.bak")
+            Options:
+                destination = String:required
+                    > The folder of the copy, it must not exist.
+                        (It's removed if the backup fails)
+                progress = Function:None
+                    > Called with (copied, total) after every batch.
+                batch_size = Int:1000
+                    > Documents copied per hold of the write lock."""
+        destination = os.path.normpath(destination)
+        if os.path.exists(destination):
+            raise FileExistsError(destination)
+
+        with self.KO_LOCK:
+            self.commit()
+            snapshot = self.snapshot()
+        # The files of a database are named after its folder, so the copy
+        #   can't be moved into place once it's done
+        target = KoDB(destination, meta_size=self.ko_get_config("metasize"), mmap=self.KO_MMAP)
+        try:
+            with snapshot:
+                tables = {table: snapshot.ko_versions(table) for table in self.tables()}
+                total = sum(len(versions) for versions in tables.values())
+                table_config = {table: {name: value for name, value in config.items() if name != "indexes"}
+                                for table, config in (self.ko_get_config("table_config") or {}).items()}
+                for name in ("codec", "compression", "compression_level", "compression_dict"):
+                    if self.ko_get_config(name) is not None:
+                        target.ko_set_config(name, self.ko_get_config(name))
+                target.ko_set_config("table_config", table_config)
+
+                with self.KO_LOCK:
+                    for name in self.ko_dict_members():
+                        self.ko_copy_member(target.KO_ZIP, name)
+
+                copied = 0
+                for table, versions in tables.items():
+                    target.table(table)
+                    for start in range(0, len(versions), batch_size):
+                        with self.KO_LOCK:
+                            for fid, uid in versions[start:start + batch_size]:
+                                self.ko_copy_member(target.KO_ZIP, "{}.{}".format(uid, table))
+                                target.store_meta(fid, uid, table)
+                                target.ko_advance_clock(uid)
+                        copied += len(versions[start:start + batch_size])
+                        if progress is not None:
+                            progress(copied, total)
+            target.commit()
+
+            for table, config in (self.ko_get_config("table_config") or {}).items():
+                for field, kind in (config.get("indexes") or {}).items():
+                    target.create_index(field, table, kind)
+        except BaseException:
+            target.close()
+            shutil.rmtree(destination, ignore_errors=True)
+            raise
+
+        target.close()
+        return total
+
+
+class Ko_WAL(object):
+    """KoDB's Write-Ahead Log
+
+        Records are framed as (header length, payload length, crc32)
+            followed by a json header and the serialized document."""
+    RECORD = struct.Struct("<III")
+
+    def __init__(self, path, sync_ops, sync_ms):
+        self.path = path
+        self.sync_ops = sync_ops
+        self.sync_ms = sync_ms
+        self.records = 0
+        self.pending = 0
+        self.last_sync = time.time()
+        self.file = open(path, "ab")
+
+
+    def append(self, header, payload):
+        header = json.dumps(header).encode("utf-8")
+        crc = zlib.crc32(payload, zlib.crc32(header))
+        self.file.write(self.RECORD.pack(len(header), len(payload), crc) + header + payload)
+        self.records += 1
+        self.pending += 1
+
+        if self.pending >= self.sync_ops or \
+                (self.sync_ms and (time.time() - self.last_sync) * 1000 >= self.sync_ms):
+            self.sync()
+
+
+    def sync(self):
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.last_sync = time.time()
+
+
+    def replay(self):
+        """Yields every intact (header, payload) record, stops at the
+            first torn or corrupted one."""
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + self.RECORD.size <= len(data):
+            header_size, payload_size, crc = self.RECORD.unpack_from(data, offset)
+            start = offset + self.RECORD.size
+            end = start + header_size + payload_size
+            if end > len(data):
+                break
+
+            header = data[start:start + header_size]
+            payload = data[start + header_size:end]
+            if zlib.crc32(payload, zlib.crc32(header)) != crc:
+                break
+
+            yield json.loads(header.decode("utf-8")), payload
+            offset = end
+
+
+    def reset(self):
+        self.file.flush()
+        self.file.truncate(0)
+        os.fsync(self.file.fileno())
+        self.records = 0
+        self.pending = 0
+        self.last_sync = time.time()
+
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+
+class Ko_Table(object):
+    """KoDB's Table Object"""
+    def __init__(self, table_name, database):
+        self.table_name = table_name
+        self.database = database
+
+
+    def __getattr__(self, attr):
+        # Bound per call, a shared attribute would race between threads
+        method = getattr(self.database, attr)
+        table_name = self.table_name
+
+        def KO_attr_processor(*args, **kwargs):
+            kwargs["data_suffix"] = table_name
+            return method(*args, **kwargs)
+
+        return KO_attr_processor
+
+
+
+class Ko_Cursor(object):
+    """KoDB's Query Cursor
+
+        The lazy result of a query, iterating it reads the table until
+            offset + limit items have matched. len() and indexing read
+            it again like the list it yields."""
+    def __init__(self, database, search_func, data_suffix, limit, offset, order_by, parallel, ordered, batch_size,
+                 output):
+        self.database = database
+        self.search_func = search_func
+        self.data_suffix = data_suffix
+        self.limit = limit
+        self.offset = offset
+        self.order_by = order_by
+        self.parallel = parallel
+        self.ordered = ordered
+        self.batch_size = batch_size
+        self.output = output
+
+
+    def ko_matches(self):
+        """INTERNAL FUNCTION
+
+            Yields every matching document in table order."""
+        parallel = self.database.ko_parallel_workers(self.parallel, self.data_suffix)
+        if not parallel:
+            documents = self.database.ko_scan(self.data_suffix)
+        else:
+            try:
+                pickle.dumps(self.search_func)
+            except Exception:
+                documents = self.database.ko_parallel_scan(self.data_suffix, parallel, None,
+                                                           self.ordered, self.batch_size)
+            else:
+                return self.database.ko_parallel_scan(self.data_suffix, parallel, self.search_func,
+                                                      self.ordered, self.batch_size)
+
+        if self.search_func is None:
+            return documents
+        return (x for x in documents if self.search_func(x))
+
+
+    def __iter__(self):
+        stop = None if self.limit is None else self.offset + self.limit
+        if self.output == "raw" and self.search_func is None and self.order_by is None:
+            result = itertools.islice(self.database.ko_scan(self.data_suffix, "raw"), self.offset, stop)
+        else:
+            result = map(self.ko_convert, self.ko_page(self.ko_matches(), stop))
+
+        if self.database.KO_METRICS is not None:
+            return self.database.KO_METRICS.timed_iter("query", result)
+        return result
+
+
+    def ko_page(self, matches, stop):
+        """INTERNAL FUNCTION"""
+        if self.order_by is None:
+            return itertools.islice(matches, self.offset, stop)
+
+        field = self.order_by.lstrip("-")
+        key = lambda x: ko_sort_key(ko_field(x, field))
+        descending = self.order_by.startswith("-")
+        if stop is None:
+            matches = sorted(matches, key=key, reverse=descending)
+        elif descending:
+            matches = heapq.nlargest(stop, matches, key=key)
+        else:
+            matches = heapq.nsmallest(stop, matches, key=key)
+        return iter(matches[self.offset:])
+
+
+    def ko_convert(self, document):
+        """INTERNAL FUNCTION
+
+            Converts a matched view to the cursor's output."""
+        if self.output == "view":
+            return document
+        if self.output == "dict":
+            return ko_output(document.ko_id, document.ko_data, "dict")
+
+        data_suffix = self.database.KO_DATA_SUFFIX if self.data_suffix is None else self.data_suffix
+        with self.database.KO_LOCK.read:
+            versions = self.database.get_meta(document.ko_id, data_suffix)
+            return bytes(self.database.ko_read_raw(versions[0], data_suffix)[1])
+
+
+    def count(self):
+        """count()
+
+            Returns the number of matching documents, ignoring the
+                limit and offset, without keeping any of them."""
+        return self.ko_count(None)
+
+
+    def ko_count(self, stop):
+        """INTERNAL FUNCTION
+
+            Counts the matching documents, up to stop."""
+        if self.search_func is None:
+            total = len(self.database.items(self.data_suffix))
+            return total if stop is None else min(total, stop)
+        matches = itertools.islice(self.ko_matches(), stop)
+        if self.database.KO_METRICS is not None:
+            matches = self.database.KO_METRICS.timed_iter("query", matches)
+        return sum(1 for x in matches)
+
+
+    def __len__(self):
+        stop = None if self.limit is None else self.offset + self.limit
+        return max(0, self.ko_count(stop) - self.offset)
+
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            if (position.start or 0) >= 0 and (position.stop is None or position.stop >= 0) and \
+                    (position.step or 1) > 0:
+                return list(itertools.islice(self, position.start, position.stop, position.step))
+            return list(self)[position]
+        if position < 0:
+            return list(self)[position]
+        for document in itertools.islice(self, position, None):
+            return document
+        raise IndexError("cursor index out of range")
+
+
+
+class Ko_Ids(collections.abc.Collection):
+    """KoDB's Id View
+
+        The live ids of a table, len() and `in` are answered from the id
+            index and iterating walks the sorted id index, see
+            KoDB.scan. Indexing and slicing read the sorted ids like a
+            list."""
+    __hash__ = None
+
+    def __init__(self, database, data_suffix):
+        self.database = database
+        self.data_suffix = data_suffix
+
+
+    def __len__(self):
+        self.database.ko_check_open()
+        with self.database.KO_LOCK.read:
+            return len(self.database.KO_ID_INDEX.get(self.data_suffix, ())) - \
+                len(self.database.KO_DELETED.get(self.data_suffix, ()))
+
+
+    def __contains__(self, fid):
+        self.database.ko_check_open()
+        fid = ko_string_id(fid)
+        with self.database.KO_LOCK.read:
+            return fid in self.database.KO_ID_INDEX.get(self.data_suffix, ()) and \
+                fid not in self.database.KO_DELETED.get(self.data_suffix, ())
+
+
+    def __iter__(self):
+        return self.database.scan(data_suffix=self.data_suffix)
+
+
+    def __reversed__(self):
+        return self.database.scan(reverse=True, data_suffix=self.data_suffix)
+
+
+    def __getitem__(self, position):
+        database = self.database
+        database.ko_check_open()
+        with database.KO_LOCK.read:
+            return database.ko_live_ids(self.data_suffix)[position]
+
+
+    def __eq__(self, other):
+        if isinstance(other, (Ko_Ids, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+
+    def __repr__(self):
+        return "Ko_Ids({!r})".format(list(self))
+
+
+
+class Ko_Batch(object):
+    """KoDB's Write Batch, see KoDB.batch"""
+    def __init__(self, database):
+        self.database = database
+
+
+    def __enter__(self):
+        self.database.ko_begin_batch()
+        return self.database
+
+
+    def __exit__(self, *args):
+        self.database.ko_end_batch()
+
+
+
+class Ko_Snapshot(object):
+    """KoDB's Snapshot
+
+        A read-only view of the database at a point in time. Every read
+            picks the newest version stored before the snapshot, so it
+            costs nothing to take and writers carry on meanwhile."""
+    def __init__(self, database, ticks):
+        self.database = database
+        self.ticks = ticks
+        self.closed = False
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    @property
+    def time(self):
+        """The unix timestamp of the snapshot."""
+        return self.ticks / 10 ** 7
+
+
+    def table(self, table_name):
+        """table(String:table_name)
+
+            Returns a KO_Table Object of the snapshot's table."""
+        return Ko_Table(table_name, self)
+
+
+    def get(self, fid, data_suffix = None):
+        """get(String:fid, String:data_suffix = None)
+
+            Returns the document as it was when the snapshot was taken,
+                see KoDB.get."""
+        return self.database.get(fid, data_suffix, as_of=self)
+
+
+    def exists(self, fid, data_suffix = None):
+        """exists(String:fid, String:data_suffix = None)
+
+            Returns True if the document existed when the snapshot was
+                taken."""
+        with self.database.KO_LOCK.read:
+            versions = self.database.ko_versions(fid, data_suffix)
+            return versions is not None and not ko_is_tombstone(ko_version_at(versions, self.ticks))
+
+
+    def items(self, data_suffix = None):
+        """items(String:data_suffix = None)
+
+            Returns a list of the table's IDs when the snapshot was
+                taken."""
+        return [fid for fid, uid in self.ko_versions(data_suffix)]
+
+
+    def get_all(self, data_suffix = None, output = "view"):
+        """get_all(String:data_suffix = None, String:output = "view")
+
+            Returns a generator of the table's documents when the
+                snapshot was taken, see KoDB.get_all."""
+        ko_check_output(output)
+        data_suffix = self.database.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        for fid, uid in self.ko_versions(data_suffix):
+            with self.database.KO_LOCK.read:
+                if output == "raw":
+                    data = bytes(self.database.ko_read_raw(uid, data_suffix)[1])
+                else:
+                    data = self.database.ko_read_document(uid, data_suffix)
+            yield data if output == "raw" else ko_output(fid, data, output)
+
+
+    def query(self, search_func, data_suffix = None):
+        """query(Function:search_function, String:data_suffix = None)
+
+            Returns a generator of the snapshot's documents that match
+                the search_function."""
+        return (document for document in self.get_all(data_suffix) if search_func(document))
+
+
+    def close(self):
+        """close()
+
+            Releases the snapshot, compaction no longer keeps the
+                versions only it reads."""
+        if not self.closed:
+            self.closed = True
+            with self.database.KO_LOCK:
+                self.database.KO_SNAPSHOTS.remove(self.ticks)
+
+
+    def ko_versions(self, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns the (id, uid) of the table's documents at the
+                snapshot."""
+        data_suffix = self.database.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        versions = []
+        with self.database.KO_LOCK.read:
+            for fid, meta_chunk in self.database.KO_ID_INDEX.get(data_suffix, {}).items():
+                uid = ko_version_at(self.database.KO_META[meta_chunk][data_suffix][fid], self.ticks)
+                if not ko_is_tombstone(uid):
+                    versions.append((fid, uid))
+        return versions
+
+
+
+class Ko_ShardedDB(object):
+    """KoDB's Sharded Database
+
+        A database folder where every table, or every hash shard of a
+            table, is a database of its own under tables/<table>/<N>
+            with its own archive, meta and lock. Writes to different
+            shards run in parallel from threads or processes, a shard
+            is only opened once it's used and scans fan out across the
+            shards of a table. It has KoDB's table methods, not
+            snapshot(), load_to_memory(), rebuild_index(), the cache and
+            lookup stats or the metrics hooks, which belong to every
+            shard's KoDB. See migrate() for single file databases.
+            ex.: db = kodb.Ko_ShardedDB("ko-sharded.db", shards=4)"""
+    def __init__(self, file, **OPTIONS):
+        """Ko_ShardedDB(String:database_file, **options)
+
+            Creates or opens a sharded database folder, KoDB refuses to
+                open one.
+            Options:
+                shards=Int:1
+                    > The number of hash shards of new tables.
+                (the other options are passed to every shard's KoDB)"""
+        self.KO_FOLDER = file
+        self.KO_DATA_SUFFIX = OPTIONS["data_suffix"] if "data_suffix" in OPTIONS else "default"
+        shards = int(OPTIONS.pop("shards", None) or 1)
+        OPTIONS.pop("data_suffix", None)
+        self.KO_OPTIONS = OPTIONS
+        # Opened shards, {(table, number): KoDB}
+        self.KO_SHARDS = {}
+        self.KO_SHARD_LOCK = threading.Lock()
+        # Depth of the open batch() blocks, shards opened in one join it
+        self.KO_BATCHES = 0
+        self.KO_CLOSED = False
+
+        if os.path.exists(os.path.join(file, SHARDS_FILE)):
+            self.ko_load_config()
+        elif os.path.exists(file) and os.listdir(file):
+            raise ValueError("{} is a single file database, see kodb.migrate()".format(file))
+        else:
+            os.makedirs(file, exist_ok=True)
+            self.KO_CONFIG = {"shards": shards, "tables": {}}
+            self.ko_write_config()
+        self.table(self.KO_DATA_SUFFIX)
+
+
+    def ko_load_config(self):
+        """INTERNAL FUNCTION"""
+        with open(os.path.join(self.KO_FOLDER, SHARDS_FILE)) as f:
+            self.KO_CONFIG = yaml.safe_load(f.read())
+
+
+    def ko_write_config(self):
+        """INTERNAL FUNCTION"""
+        path = os.path.join(self.KO_FOLDER, SHARDS_FILE)
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp, "w") as f:
+            f.write(yaml.dump(self.KO_CONFIG))
+        os.replace(temp, path)
+
+
+    def ko_config_lock(self):
+        """INTERNAL FUNCTION
+
+            The lock of the layout file between processes, held while
+                it's re-read and changed."""
+        return ko_file_lock(os.path.join(self.KO_FOLDER, "{}.lock".format(SHARDS_FILE)))
+
+
+    def table(self, table_name, shards = None, **OPTIONS):
+        """table(String:table_name, Int:shards = None, **options)
+
+            Returns a KO_Table Object, see KoDB.table.
+            Options:
+                shards=Int:None
+                    > The number of hash shards of a new table.
+                        (The database's shards option if unspecified,
+                            it can't be changed afterwards)"""
+        with self.KO_SHARD_LOCK:
+            if table_name not in self.KO_CONFIG["tables"]:
+                with self.ko_config_lock():
+                    # Another process may have created it
+                    self.ko_load_config()
+                    if table_name not in self.KO_CONFIG["tables"]:
+                        self.KO_CONFIG["tables"][table_name] = int(shards or self.KO_CONFIG["shards"])
+                        self.ko_write_config()
+            tables = self.KO_CONFIG["tables"]
+            if shards is not None and int(shards) != tables[table_name]:
+                raise ValueError("The table {} has {} shards".format(table_name, tables[table_name]))
+
+        if OPTIONS:
+            for shard in self.ko_table_shards(table_name)[0]:
+                shard.table(table_name, **OPTIONS)
+        return Ko_Table(table_name, self)
+
+
+    def tables(self):
+        """tables()
+
+            Returns a list of the database tables."""
+        return list(self.KO_CONFIG["tables"])
+
+
+    def ko_check_open(self):
+        """INTERNAL FUNCTION
+
+            Raises ValueError once the database is closed."""
+        if self.KO_CLOSED:
+            raise ValueError("The database {} is closed".format(self.KO_FOLDER))
+
+
+    def ko_shard(self, table, number):
+        """INTERNAL FUNCTION
+
+            Returns a shard's database, opening it on first use."""
+        with self.KO_SHARD_LOCK:
+            self.ko_check_open()
+            shard = self.KO_SHARDS.get((table, number))
+            if shard is None:
+                folder = os.path.join(self.KO_FOLDER, "tables", table)
+                os.makedirs(folder, exist_ok=True)
+                shard = KoDB(os.path.join(folder, str(number)), data_suffix=table, **self.KO_OPTIONS)
+                shard.KO_BATCHES = self.KO_BATCHES
+                self.KO_SHARDS[(table, number)] = shard
+            return shard
+
+
+    def ko_shard_for(self, fid, data_suffix, create = False):
+        """INTERNAL FUNCTION
+
+            Returns (shard, table) of an id, the shard is None for a
+                table that doesn't exist unless it's created."""
+        table = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        if table not in self.KO_CONFIG["tables"]:
+            if not create:
+                return None, table
+            self.table(table)
+        return self.ko_shard(table, ko_shard_number(fid, self.KO_CONFIG["tables"][table])), table
+
+
+    def ko_table_shards(self, data_suffix):
+        """INTERNAL FUNCTION
+
+            Returns ([shards in number order], table)."""
+        table = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        count = self.KO_CONFIG["tables"].get(table, 0)
+        return [self.ko_shard(table, number) for number in range(0, count)], table
+
+
+    def ko_group(self, fids, data_suffix, create = False):
+        """INTERNAL FUNCTION
+
+            Returns (table, {shard: [(position, id)]})."""
+        groups = {}
+        table = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        for position, fid in enumerate(fids):
+            shard, table = self.ko_shard_for(fid, data_suffix, create)
+            if shard is not None:
+                groups.setdefault(shard, []).append((position, fid))
+        return table, groups
+
+
+    def get(self, fid, data_suffix = None, version = None, as_of = None):
+        """get(String:fid, String:data_suffix = None, ...)
+
+            Returns a document from its shard, see KoDB.get."""
+        shard, table = self.ko_shard_for(fid, data_suffix)
+        return None if shard is None else shard.get(fid, table, version, as_of)
+
+
+    def store(self, pid, data, data_suffix = None):
+        """store(String:pid, Dict:data, String:data_suffix = None)
+
+            Stores a document in its shard, see KoDB.store."""
+        shard, table = self.ko_shard_for(pid, data_suffix, create=True)
+        return shard.store(pid, data, table)
+
+
+    def exists(self, fid, data_suffix = None):
+        """exists(String:fid, String:data_suffix = None)
+
+            Returns True if the document exists, see KoDB.exists."""
+        shard, table = self.ko_shard_for(fid, data_suffix)
+        return shard is not None and shard.exists(fid, table)
+
+
+    def delete(self, fid, data_suffix = None):
+        """delete(String:fid, String:data_suffix = None)
+
+            Deletes a document from its shard, see KoDB.delete."""
+        shard, table = self.ko_shard_for(fid, data_suffix)
+        return shard is not None and shard.delete(fid, table)
+
+
+    def history(self, fid, data_suffix = None):
+        """history(String:fid, String:data_suffix = None)
+
+            Returns the versions of a document, see KoDB.history."""
+        shard, table = self.ko_shard_for(fid, data_suffix)
+        return [] if shard is None else shard.history(fid, table)
+
+
+    def store_many(self, documents, data_suffix = None):
+        """store_many(Iterable:documents, String:data_suffix = None)
+
+            Stores (id, document) pairs with a commit per shard, see
+                KoDB.store_many."""
+        documents = list(documents)
+        table, groups = self.ko_group([pid for pid, data in documents], data_suffix, create=True)
+        return sum(shard.store_many([documents[position] for position, pid in group], table)
+                   for shard, group in groups.items())
+
+
+    def get_many(self, fids, data_suffix = None):
+        """get_many(List:fids, String:data_suffix = None)
+
+            Returns the documents of the ids in the same order, see
+                KoDB.get_many."""
+        result = [None] * len(fids)
+        table, groups = self.ko_group(fids, data_suffix)
+        for shard, group in groups.items():
+            for (position, fid), document in zip(group, shard.get_many([fid for position, fid in group], table)):
+                result[position] = document
+        return result
+
+
+    def exists_many(self, fids, data_suffix = None):
+        """exists_many(List:fids, String:data_suffix = None)
+
+            Returns a list of booleans, see KoDB.exists_many."""
+        result = [False] * len(fids)
+        table, groups = self.ko_group(fids, data_suffix)
+        for shard, group in groups.items():
+            for (position, fid), exists in zip(group, shard.exists_many([fid for position, fid in group], table)):
+                result[position] = exists
+        return result
+
+
+    def delete_many(self, fids, data_suffix = None):
+        """delete_many(List:fids, String:data_suffix = None)
+
+            Deletes documents with a commit per shard, see
+                KoDB.delete_many."""
+        table, groups = self.ko_group(fids, data_suffix)
+        return sum(shard.delete_many([fid for position, fid in group], table) for shard, group in groups.items())
+
+
+    def items(self, data_suffix = None):
+        """items(String:data_suffix = None)
+
+            Returns a live view of the table's IDs across its shards in
+                sorted order, see KoDB.items."""
+        return Ko_ShardedIds(self, self.KO_DATA_SUFFIX if data_suffix is None else data_suffix)
+
+
+    def scan(self, start = None, end = None, prefix = None, reverse = False, limit = None, output = "id",
+             data_suffix = None):
+        """scan(String:start = None, String:end = None, String:prefix = None, ...)
+
+            Merges the sorted id scans of the table's shards, see
+                KoDB.scan."""
+        if output != "id":
+            ko_check_output(output)
+        shards, table = self.ko_table_shards(data_suffix)
+        ids = heapq.merge(*[shard.scan(start, end, prefix, reverse, limit, "id", table) for shard in shards],
+                          reverse=reverse)
+        ids = itertools.islice(ids, limit)
+        if output == "id":
+            return ids
+        return self.ko_read_outputs(ids, table, output)
+
+
+    def ko_read_outputs(self, fids, table, output):
+        """INTERNAL FUNCTION"""
+        for fid in fids:
+            data = self.ko_shard_for(fid, table)[0].ko_read_output(fid, table, output)
+            if data is not None:
+                yield data
+
+
+    def get_all(self, data_suffix = None, parallel = None, ordered = True, batch_size = 500, output = "view"):
+        """get_all(String:data_suffix = None, Int:parallel = None, ...)
+
+            Returns a generator of the table's documents one shard after
+                the other, see KoDB.get_all."""
+        ko_check_output(output)
+        shards, table = self.ko_table_shards(data_suffix)
+        return itertools.chain.from_iterable(shard.get_all(table, parallel, ordered, batch_size, output)
+                                             for shard in shards)
+
+
+    def query(self, search_func, data_suffix = None, parallel = None, ordered = True, batch_size = 500,
+              limit = None, offset = 0, order_by = None, output = "view"):
+        """query(Function:search_function, String:data_suffix = None, ...)
+
+            Returns a lazy cursor over the table's shards, see KoDB.query.
+                With order_by the sorted shard results are merged."""
+        ko_check_output(output)
+        shards, table = self.ko_table_shards(data_suffix)
+        stop = None if limit is None else offset + limit
+        cursors = [shard.query(search_func, table, parallel, ordered, batch_size, stop, 0, order_by, output)
+                   for shard in shards]
+        return Ko_ShardedCursor(cursors, offset, stop, order_by)
+
+
+    def find(self, where = None, data_suffix = None, **criteria):
+        """find(Dict:where = None, String:data_suffix = None, **criteria)
+
+            Returns the matching documents of every shard sorted by id,
+                see KoDB.find."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return list(heapq.merge(*[shard.find(where, table, **criteria) for shard in shards], key=lambda x: x._id))
+
+
+    def select(self, fields, where = None, data_suffix = None, limit = None):
+        """select(List:fields, Dict:where = None, String:data_suffix = None, Int:limit = None)
+
+            Returns the selected rows of every shard, see KoDB.select."""
+        shards, table = self.ko_table_shards(data_suffix)
+        rows = []
+        for shard in shards:
+            rows.extend(shard.select(fields, where, table, None if limit is None else limit - len(rows)))
+            if limit is not None and len(rows) >= limit:
+                break
+        return rows
+
+
+    def count(self, where = None, data_suffix = None):
+        """count(Dict:where = None, String:data_suffix = None)
+
+            Returns the matching documents of every shard, see KoDB.count."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return sum(shard.count(where, table) for shard in shards)
+
+
+    def sum(self, field, where = None, data_suffix = None):
+        """sum(String:field, Dict:where = None, String:data_suffix = None)
+
+            Returns the sum of every shard, see KoDB.sum."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return sum(shard.sum(field, where, table) for shard in shards)
+
+
+    def min(self, field, where = None, data_suffix = None):
+        """min(String:field, Dict:where = None, String:data_suffix = None)
+
+            Returns the smallest value of every shard, see KoDB.min."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return ko_min([shard.min(field, where, table) for shard in shards])
+
+
+    def max(self, field, where = None, data_suffix = None):
+        """max(String:field, Dict:where = None, String:data_suffix = None)
+
+            Returns the largest value of every shard, see KoDB.max."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return ko_max([shard.max(field, where, table) for shard in shards])
+
+
+    def group_by(self, field, aggregate = "count", of = None, where = None, data_suffix = None):
+        """group_by(String:field, String:aggregate = "count", String:of = None, Dict:where = None, ...)
+
+            Merges the groups of every shard, see KoDB.group_by."""
+        shards, table = self.ko_table_shards(data_suffix)
+        groups = {}
+        for shard in shards:
+            for key, value in shard.group_by(field, aggregate, of, where, table).items():
+                groups[key] = AGGREGATES[aggregate][1](groups[key], value) if key in groups else value
+        return groups
+
+
+    def create_index(self, field, data_suffix = None, kind = "hash"):
+        """create_index(String:field, String:data_suffix = None, String:kind = "hash")
+
+            Creates the index in every shard, see KoDB.create_index."""
+        shards, table = self.ko_table_shards(data_suffix)
+        for shard in shards:
+            shard.create_index(field, table, kind)
+
+
+    def drop_index(self, field, data_suffix = None):
+        """drop_index(String:field, String:data_suffix = None)
+
+            Drops the index in every shard, see KoDB.drop_index."""
+        shards, table = self.ko_table_shards(data_suffix)
+        for shard in shards:
+            shard.drop_index(field, table)
+
+
+    def indexes(self, data_suffix = None):
+        """indexes(String:data_suffix = None)
+
+            Returns the table's indexes, see KoDB.indexes."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return shards[0].indexes(table) if shards else {}
+
+
+    def dead_space(self, data_suffix = None):
+        """dead_space(String:data_suffix = None)
+
+            Returns the dead space of the table's shards, see
+                KoDB.dead_space."""
+        shards, table = self.ko_table_shards(data_suffix)
+        return sum(shard.dead_space(table) for shard in shards)
+
+
+    def import_jsonl(self, path, table = None, id_field = "_id", batch_size = BULK_BATCH, progress = None,
+                     data_suffix = None):
+        """import_jsonl(String:path, String:table = None, String:id_field = "_id", ...)
+
+            Stores the documents of a JSON Lines file, every batch is
+                split between the shards and the shards' meta is
+                committed once at the end, see KoDB.import_jsonl."""
+        table = data_suffix if table is None else table
+        table = self.KO_DATA_SUFFIX if table is None else table
+        self.table(table)
+
+        documents = ko_read_jsonl(path, id_field)
+        count = 0
+        written = set()
+        try:
+            while True:
+                batch = list(itertools.islice(documents, batch_size))
+                if not batch:
+                    break
+                table, groups = self.ko_group([pid for pid, data in batch], table, create=True)
+                for shard, group in groups.items():
+                    with shard.KO_LOCK:
+                        shard.ko_import_batch([batch[position] for position, pid in group], table)
+                    written.add(shard)
+                count += len(batch)
+                if progress is not None:
+                    progress(count, None)
+        finally:
+            for shard in written:
+                shard.commit()
+        return count
+
+
+    def export_jsonl(self, path, table = None, data_suffix = None):
+        """export_jsonl(String:path, String:table = None)
 
-    def __init__(self, file, **OPTIONS):
-        """KoDB(String:database_file, **options)
+            Writes the table's documents one shard after the other, every
+                shard as it is when it's reached, see KoDB.export_jsonl."""
+        shards, table = self.ko_table_shards(data_suffix if table is None else table)
+        count = 0
+        with open(path, "w") as f:
+            for shard in shards:
+                with shard.snapshot() as snapshot:
+                    for document in snapshot.get_all(table, output="dict"):
+                        f.write(json.dumps(document, default=str) + "\n")
+                        count += 1
+        return count
 
-            Creates a new database object, 3 files will be geenrated
-                upon creation.
-            Options:
-                load_to_memory=Bool:False
-                    > Loads the default table into memory
-                no_commit=Bool:False
-                    > Prevents commit upon storing data
-                        (useful for large insert ops)
-                load_type=String:safe_load
-                    > Specifies what load function yaml uses.
-                        (use 'load' for object serialization 
-                            support)
-                data_suffix=String:default
-                    > Specifies the default data suffix.
-                        (this is the table seperator)
-                """
-        
-        self.KO_FOLDER = file
-        self.KO_FILENAME = "{}.db".format(file)
-        self.KO_DB_FILEPATH = os.path.join(self.KO_FOLDER, self.KO_FILENAME)
-        self.KO_COMMIT_CACHE = []
-        self.KO_META_COMMIT_CACHE = {}
-        self.KO_NO_COMMIT = OPTIONS["no_commit"] if "no_commit" in OPTIONS else False
-        self.KO_LOADTYPE = OPTIONS["load_type"] if "load_type" in OPTIONS else "safe_load"
-        self.KO_DATA_SUFFIX = OPTIONS["data_suffix"] if "data_suffix" in OPTIONS else "default"
-        self.KO_LAST_CHUNK_SIZE = 0
 
-        # Check if the database exists
-        # Create if not
-        # TODO: PUT ALL OF THE NEW_DB CODE HERE
-        self.KO_META = []
-        if not os.path.exists(self.KO_FOLDER):
-            # NEW DB 
-            os.mkdir(self.KO_FOLDER)
-            os.mkdir(os.path.join(self.KO_FOLDER, "meta"))
-            self.KO_META.append({self.KO_DATA_SUFFIX: {}})
-            self.KO_CONFIG = {}
-            self.ko_set_config("tables", [self.KO_DATA_SUFFIX])
-            metasize = 1028 if "meta_size" not in OPTIONS else (OPTIONS["meta_size"])
-            self.ko_set_config("metasize", metasize)
+    def backup(self, destination, progress = None, batch_size = BULK_BATCH):
+        """backup(String:destination, Function:progress = None, Int:batch_size = 1000)
 
-        else:
-            # LOAD DB
-            self.init_meta()
-            config_path = os.path.join(self.KO_FOLDER, "{}.KO_CONFIG".format(self.KO_FOLDER))
-            with open(config_path) as f:
-                self.KO_CONFIG = yaml.load(f.read())
+            Backs up every shard into a new sharded database folder, each
+                shard is consistent as of when it's reached, see
+                KoDB.backup. progress is called with (copied, None)."""
+        destination = os.path.normpath(destination)
+        if os.path.exists(destination):
+            raise FileExistsError(destination)
+        temp_path = "{}.tmp".format(destination)
+        shutil.rmtree(temp_path, ignore_errors=True)
 
-        # Open Database File
+        copied = 0
         try:
-            self.KO_ZIP = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="a", allowZip64=True)
-        except:
-            self.KO_ZIP = zipfile.ZipFile(self.KO_DB_FILEPATH, mode="x", allowZip64=True)
+            for table, count in list(self.KO_CONFIG["tables"].items()):
+                folder = os.path.join(temp_path, "tables", table)
+                os.makedirs(folder)
+                for number in range(0, count):
+                    report = None if progress is None else \
+                        lambda done, total, before=copied: progress(before + done, None)
+                    copied += self.ko_shard(table, number).backup(os.path.join(folder, str(number)), report,
+                                                                  batch_size)
+            with open(os.path.join(temp_path, SHARDS_FILE), "w") as f:
+                f.write(yaml.dump(self.KO_CONFIG))
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
 
-        self.KO_INDEX = {}
-        if "load_to_memory" in OPTIONS:
-            if OPTIONS["load_to_memory"]:
-                self.load_all_to_memory()
+        os.rename(temp_path, destination)
+        return copied
+
+
+    def compact(self, table = None, keep_versions = 1, progress = None,
+                incremental = False, batch_size = 1000, data_suffix = None):
+        """compact(String:table = None, Int:keep_versions = 1, ...)
+
+            Compacts the shards of a table, or of every table, one
+                after the other, see KoDB.compact."""
+        table = data_suffix if table is None else table
+        steps = itertools.chain.from_iterable(
+            shard.compact(name, keep_versions, progress, True, batch_size)
+            for name in ([table] if table is not None else self.tables())
+            for shard in self.ko_table_shards(name)[0])
+        if incremental:
+            return steps
+
+        for _ in steps:
+            pass
+
+
+    def drop_table(self, table = None, reclaim = True, data_suffix = None):
+        """drop_table(String:table, Bool:reclaim = True)
+
+            Removes a table by deleting its shards."""
+        table = data_suffix if table is None else table
+        with self.KO_SHARD_LOCK:
+            for key in [key for key in self.KO_SHARDS if key[0] == table]:
+                self.KO_SHARDS.pop(key).close()
+            with self.ko_config_lock():
+                self.ko_load_config()
+                self.KO_CONFIG["tables"].pop(table, None)
+                self.ko_write_config()
+        shutil.rmtree(os.path.join(self.KO_FOLDER, "tables", table), ignore_errors=True)
+
+
+    def commit(self):
+        """commit()
+
+            Commits every opened shard, see KoDB.commit."""
+        for shard in list(self.KO_SHARDS.values()):
+            shard.commit()
+
+
+    def batch(self):
+        """batch()
+
+            Returns a context manager that holds back the commits of
+                every shard until the end of the with block, see
+                KoDB.batch."""
+        return Ko_Batch(self)
+
+
+    def ko_begin_batch(self):
+        """INTERNAL FUNCTION"""
+        with self.KO_SHARD_LOCK:
+            self.KO_BATCHES += 1
+            for shard in self.KO_SHARDS.values():
+                shard.ko_begin_batch()
 
-        # data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
-        # sets the function to the default table if none is specified
+
+    def ko_end_batch(self):
+        """INTERNAL FUNCTION"""
+        with self.KO_SHARD_LOCK:
+            self.KO_BATCHES -= 1
+            for shard in self.KO_SHARDS.values():
+                shard.ko_end_batch()
+
+
+    def stats(self):
+        """stats()
+
+            Returns the stats of every opened shard, keyed table/N."""
+        return {"shards": {"{}/{}".format(*key): shard.stats() for key, shard in list(self.KO_SHARDS.items())}}
 
 
     def close(self):
         """close()
 
-            Closes the database.
-            NOTE: THIS DOES NOT COMMIT THE DATABASE"""
-        self.KO_ZIP.close()
+            Closes every opened shard, see KoDB.close."""
+        with self.KO_SHARD_LOCK:
+            for shard in self.KO_SHARDS.values():
+                shard.close()
+            self.KO_SHARDS.clear()
+            self.KO_CLOSED = True
 
 
-    def table(self, table_name):
-        """table(String:table_name)
 
-            Returns a KO_Table Object. Documents Stored in this context
-                is not visible in the database object as it is it's 
-                own table."""
-        # Appends a table in the table list
-        tables = self.ko_get_config("tables")
-        if table_name not in tables:
-            tables.append(table_name)
-            self.ko_set_config("tables", tables)
+class Ko_ShardedIds(Ko_Ids):
+    """KoDB's Sharded Id View, see Ko_Ids"""
 
-        return Ko_Table(table_name, self)
+    def __len__(self):
+        shards, table = self.database.ko_table_shards(self.data_suffix)
+        return sum(len(shard.items(table)) for shard in shards)
 
 
-    def ko_set_config(self, config_name, value):
-        self.KO_CONFIG[config_name] = value
-        # The zipfile will throw a bloody warning.
-        config_path = os.path.join(self.KO_FOLDER, "{}.KO_CONFIG".format(self.KO_FOLDER))
-        with open(config_path, "w") as f:
-            f.write(yaml.dump(self.KO_CONFIG))
+    def __contains__(self, fid):
+        return self.database.exists(fid, self.data_suffix)
 
 
-    def ko_get_config(self, config_name):
-        tmp = self.KO_CONFIG
-        if config_name in tmp:
-            return tmp[config_name]
 
-        return None 
+class Ko_ShardedCursor(object):
+    """KoDB's Sharded Query Cursor
 
+        The shard cursors read up to offset + limit items each, sorted
+            results are merged instead of sorted again."""
+    def __init__(self, cursors, offset, stop, order_by):
+        self.cursors = cursors
+        self.offset = offset
+        self.stop = stop
+        self.order_by = order_by
 
-    def load_to_memory(self, data_suffix = None):
-        """load_to_memory(String:data_suffix = None)
 
-            Loads all of the database entries into memory.
-            Options:
-                data_suffix = String:None
-                    > The data suffix (table) of the database to load
-                        (Loads the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
-        for index in self.items(data_suffix):
-            if index in self.KO_INDEX[data_suffix]:
-                self.KO_INDEX[data_suffix][index] = self.get(index, data_suffix)
+    def __iter__(self):
+        pages = [self.ko_page(cursor) for cursor in self.cursors]
+        if self.order_by is None:
+            matches = itertools.chain.from_iterable(pages)
+        else:
+            field = self.order_by.lstrip("-")
+            matches = heapq.merge(*pages, key=lambda x: ko_sort_key(ko_field(x[1], field)),
+                                  reverse=self.order_by.startswith("-"))
+        return (cursor.ko_convert(document) for cursor, document in itertools.islice(matches, self.offset, self.stop))
 
 
-    def get_all(self, data_suffix = None):
-        """get_all(String:data_suffix = None)
+    def ko_page(self, cursor):
+        """INTERNAL FUNCTION
 
-            Returns a generator iterating through all of the table's
-                database entries.
-            Options:
-                data_suffix = String:None
-                    > The data suffix (table) of the database to retrieve
-                        (Retrieves the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        for index in self.items(data_suffix):
-            yield self.get(index, data_suffix)
+            Yields (cursor, view) of a shard's page."""
+        for document in cursor.ko_page(cursor.ko_matches(), self.stop):
+            yield cursor, document
 
 
-    def exists(self, fid, data_suffix = None):
-        """exists(String:fid, String:data_suffix = None)
+    def count(self):
+        """count()
 
-            Returns True if a database entry exists.
-            Options:
-                fid = String:Required
-                    > The id of the document to check
-                data_suffix = String:None
-                    > The data suffix (table) on where to check.
-                        (Retrieves the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        try:
-            data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
-            # if fid in self.KO_META[data_suffix]:
-            if self.get_meta(fid, data_suffix) is not None:
-                return True
-            else:
-                return False
-            # info = self.KO_ZIP.getinfo("{}.{}".format(fid, data_suffix))
-            # return True
-        except KeyError:
-            return False
-            
+            Returns the number of matching documents, see Ko_Cursor.count."""
+        return sum(cursor.count() for cursor in self.cursors)
 
-    def query(self, search_func, data_suffix = None):
-        """query(Function:search_function, String:data_suffix = None)
 
-            Returns items that matches the search_function.
-            ex.: db.query(lambda x: x.views > 100)
-                > Returns items that has views greater than 100
-            Options:
-                search_func = Lambda/Function:required
-                    > The statement that filters the correct data.
-                data_suffix = String:None
-                    > The table to be queried.
-                        (Retrieves the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        return [x for x in self.get_all(data_suffix) if search_func(x)]
 
+def migrate(file, shards = 1, table_shards = None, backup = True, **OPTIONS):
+    """migrate(String:database_file, Int:shards = 1, Dict:table_shards = None, Bool:backup = True, **options)
 
-    def store(self, pid, data, data_suffix = None):
-        """store(String:pid, Dict:data, String:data_suffix = None)
+        Converts a single file database to the sharded layout in place,
+            copying the latest version of every document along with the
+            tables' codec, compression and indexes. Returns the path of
+            the backup of the single file database.
+        Options:
+            shards = Int:1
+                > The number of hash shards per table.
+            table_shards = Dict:None
+                > The number of hash shards of specific tables,
+                    {table: shards}.
+            backup = Bool:True
+                > Keeps the single file database renamed to
+                    <database_file>.single, otherwise it's deleted.
+                    (rename it back to open it)
+            (the other options are passed to both databases)"""
+    folder = os.path.normpath(file)
+    if os.path.exists(os.path.join(folder, SHARDS_FILE)):
+        raise ValueError("{} is already sharded".format(file))
+    target_path = "{}.sharded".format(folder)
+    backup_path = "{}.single".format(folder)
+    for path in (target_path, backup_path):
+        if os.path.exists(path):
+            raise FileExistsError(path)
 
-            Stores a document in the database
-            Options:
-                pid = String:required
-                    > The document ID 
-                data = Dictionary:required
-                    > The dictionary to be converted into yaml and stored in 
-                        the database.
-                data_suffix = String:None
-                    > The table where the document should be stored.
-                        (Stores on the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        # try:
-        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
-        # if data_suffix not in self.KO_META:
-        #     self.KO_META[data_suffix] = {}
+    source = KoDB(folder, **OPTIONS)
+    target = Ko_ShardedDB(target_path, shards=shards, **OPTIONS)
+    try:
+        for table in source.tables():
+            options = {name: source.ko_get_table_config(table, name)
+                       for name in ("codec", "compression", "compression_level", "compression_dict")
+                       if source.ko_get_table_config(table, name) is not None}
+            target.table(table, (table_shards or {}).get(table), **options)
 
-        uid = str(uuid.uuid4())
-        # if pid in self.KO_META[data_suffix]:
-        #     self.KO_META[data_suffix][pid].insert(0, uid)
-        # else:
-        #     self.KO_META[data_suffix][pid] = [uid]
+            documents = ((document.ko_id, document) for document in source.get_all(table))
+            while True:
+                batch = list(itertools.islice(documents, MIGRATE_BATCH))
+                if not batch:
+                    break
+                target.store_many(batch, table)
 
-        self.store_meta(pid, uid, data_suffix)
+            for field, kind in (source.ko_get_table_config(table, "indexes") or {}).items():
+                target.create_index(field, table, kind)
+    except BaseException:
+        target.close()
+        source.close()
+        shutil.rmtree(target_path, ignore_errors=True)
+        raise
 
-        # Store Data to the commit cache
-        self.KO_COMMIT_CACHE.insert(0, (uid, data_suffix, data))
-        
-        # Write Metadata and push the uncommited changes to the Meta file
-        if not self.KO_NO_COMMIT:
-            self.commit()
+    target.close()
+    source.close()
+    os.rename(folder, backup_path)
+    os.rename(target_path, folder)
+    if not backup:
+        shutil.rmtree(backup_path)
+        return None
+    return backup_path
 
-        # Initalizes table index if it's empty
-        if data_suffix not in self.KO_INDEX:
-            self.KO_INDEX[data_suffix] = {}
 
-        # Stores index entry
-        self.KO_INDEX[data_suffix][pid] = data
-        return True
 
-        # except Exception as e:
-        #     print(e)
-        #     print("Data save failed.({})".format(pid))
-        #     return False
+class AsyncKoDB(object):
+    """KoDB's Asyncio Wrapper"""
+    def __init__(self, file, executor_workers = None, **OPTIONS):
+        """AsyncKoDB(String:database_file, **options)
 
+            Wraps a KoDB database for use from an event loop. Stores go
+                through the writer thread so the stores awaited at the
+                same time share a commit, the other blocking calls run
+                on a thread pool and cached documents are returned
+                without leaving the loop.
+            ex.: post = await db.table("posts").get("1")
+            Options:
+                executor_workers=Int:None
+                    > The number of threads running the blocking calls.
+                        (ThreadPoolExecutor's default if unspecified)
+                (the other options are passed to KoDB, or to
+                    Ko_ShardedDB with shards or for a sharded folder)"""
+        OPTIONS["writer_thread"] = True
+        if "shards" in OPTIONS or os.path.exists(os.path.join(file, SHARDS_FILE)):
+            self.database = Ko_ShardedDB(file, **OPTIONS)
+        else:
+            self.database = KoDB(file, **OPTIONS)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=executor_workers,
+                                                              thread_name_prefix="kodb")
 
-    def get(self, fid, data_suffix = None):
-        """get(String:fid, String:data_suffix = None)
 
-            Returns a database document.
-            Options:
-                fid = String:Required
-                    > The id of the document to retrieve
-                data_suffix = String:None
-                    > The data suffix (table) on where to retrieve the document.
-                        (Retrieves the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
-        if self.exists(fid, data_suffix):
-            if data_suffix not in self.KO_INDEX:
-                self.KO_INDEX[data_suffix] = {}
-
-            if fid in self.KO_INDEX[data_suffix]:
-                r = Map(self.KO_INDEX[data_suffix][fid])
-                r["_id"] = fid
-                return r
-
-            # uid = self.KO_META[data_suffix][fid][0]
-            uid = self.get_meta(fid, data_suffix)[0]
-            # print("UID: {}".format(uid))
-
-            data = getattr(yaml, self.KO_LOADTYPE)(self.KO_ZIP.read("{}.{}".format(uid, data_suffix)).decode("utf-8"))
-            self.KO_INDEX[data_suffix][fid] = data # Add it to the memory
-            data["_id"] = fid # Attach ID on the object
-            return Map(data)
-           
-        return None
+    def __getattr__(self, attr):
+        if attr in ("database", "executor"):
+            raise AttributeError(attr)
 
+        method = getattr(self.database, attr)
+        if not callable(method):
+            return method
 
-    def uid_generator(self):
-        def generate():
-            global KEYS
-            return "".join(random.choice(KEYS) for x in range(0, 8))
+        async def KO_async_processor(*args, **kwargs):
+            self.database.ko_check_open()
+            return await self.ko_run(functools.partial(method, *args, **kwargs))
 
-    def commit(self):
-        """commit()
+        return KO_async_processor
 
-            Commits the database to the file.
-            Note: Doesn't need to be called if the no_commit option 
-                    is set to True."""
-        for item in self.KO_COMMIT_CACHE:
-            self.KO_ZIP.writestr("{}.{}".format(item[0], item[1]), yaml.dump(dict(item[2])))
 
-        # with open("{}.KO_META".format(self.KO_FILENAME), "w") as f:
-        #     f.write(json.dumps(self.KO_META))
+    def ko_run(self, function, *args):
+        """INTERNAL FUNCTION"""
+        return asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
 
-        for meta_chunk in range(0, len(self.KO_META)):
-            if meta_chunk in self.KO_META_COMMIT_CACHE:
-                chunk_filename = "{:08d}.meta".format(meta_chunk)
-                with open(os.path.join(self.KO_FOLDER, "meta", chunk_filename), "w") as f:
-                    f.write(json.dumps(self.KO_META[meta_chunk]))
 
-        self.KO_COMMIT_CACHE.clear()
-        self.KO_META_COMMIT_CACHE.clear()
+    def table(self, table_name, **OPTIONS):
+        """table(String:table_name, **options)
 
+            Returns a KO_Table Object of awaitable methods, see
+                KoDB.table."""
+        self.database.table(table_name, **OPTIONS)
+        return Ko_Table(table_name, self)
 
-    def init_meta(self):
-        meta_filemask = os.path.join(self.KO_FOLDER, "meta", "*.meta")
-        for file in glob.glob(meta_filemask):
-            with open(file) as f:
-                self.KO_META.append(json.loads(f.read()))
 
-        chunk_size = 0
-        for x in self.KO_META[-1]:
-            for y in self.KO_META[-1][x]:
-                try:
-                    chunk_size += len(y)
-                except:
-                    pass
+    async def get(self, fid, data_suffix = None, version = None, as_of = None):
+        """get(String:fid, String:data_suffix = None, Int:version = None, Float:as_of = None)
 
-        self.KO_LAST_CHUNK_SIZE = chunk_size
+            Returns a database document, see KoDB.get."""
+        self.database.ko_check_open()
+        data_suffix = self.database.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        fid = ko_string_id(fid)
+        if version is not None or as_of is not None or isinstance(self.database, Ko_ShardedDB):
+            return await self.ko_run(self.database.get, fid, data_suffix, version, as_of)
+        # The cache has its own lock, a hit doesn't need the thread pool
+        cached = self.database.KO_CACHE.get(data_suffix, fid, count_miss=False)
+        if cached is not None:
+            return Ko_Document(cached, fid)
+        if self.database.ko_absent(fid, data_suffix):
+            return None
 
+        return await self.ko_run(self.database.ko_get, fid, data_suffix)
 
-    def store_meta(self, fid, data, data_suffix = None):
-        """INTERNAL FUNCTION"""
-        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
 
-        for meta_chunk in range(0, len(self.KO_META)):
-            if data_suffix in self.KO_META:
-                if fid in self.KO_META[meta_chunk][data_suffix]:
-                    self.KO_META[meta_chunk][data_suffix][fid].insert(0, data)
-                    # Set this chunk to save on commit
-                    self.KO_META_COMMIT_CACHE[meta_chunk] = True
-                    return
+    async def store(self, pid, data, data_suffix = None):
+        """store(String:pid, Dict:data, String:data_suffix = None)
 
-        # Create a new chunk if the current chunk is full
-        # print(self.KO_META)
-        
-        #print(chunk_size)
-        #print(self.KO_META[-1].keys())
-        if self.KO_LAST_CHUNK_SIZE >= self.KO_CONFIG["metasize"]:
-            #print("NEW META ADDED")
-            self.KO_META.append({})
-            self.KO_LAST_CHUNK_SIZE = 0
+            Stores a document in the database, see KoDB.store."""
+        self.database.ko_check_open()
+        data_suffix = self.database.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        if isinstance(self.database, Ko_ShardedDB):
+            return await self.ko_run(self.database.store, pid, data, data_suffix)
+        await asyncio.wrap_future(self.database.KO_WRITER.submit(
+            self.database.ko_store_documents, [(pid, data)], data_suffix))
+        return True
 
-        # IF the data is new, append to the last meta chunk
-        if data_suffix not in self.KO_META[-1]:
-            self.KO_META[-1][data_suffix] = {}
 
-        if fid not in self.KO_META[-1][data_suffix]:
-            self.KO_META[-1][data_suffix][fid] = []
+    async def store_many(self, documents, data_suffix = None):
+        """store_many(Iterable:documents, String:data_suffix = None)
 
-        self.KO_META[-1][data_suffix][fid].insert(0, data)
-        self.KO_LAST_CHUNK_SIZE += 1
-        self.KO_META_COMMIT_CACHE[len(self.KO_META) - 1] = True
-        return
+            Stores (id, document) pairs with a single commit, see
+                KoDB.store_many."""
+        self.database.ko_check_open()
+        data_suffix = self.database.KO_DATA_SUFFIX if data_suffix is None else data_suffix
+        if isinstance(self.database, Ko_ShardedDB):
+            return await self.ko_run(self.database.store_many, list(documents), data_suffix)
+        return await asyncio.wrap_future(self.database.KO_WRITER.submit(
+            self.database.ko_store_documents, documents, data_suffix, True))
 
 
-    def get_meta(self, fid, data_suffix = None):
-        """INTERNAL FUNCTION"""
-        data_suffix = self.KO_DATA_SUFFIX if data_suffix is None else data_suffix
-        for meta_chunk in range(len(self.KO_META) - 1, -1, -1):
-            # print(meta_chunk)
-            if data_suffix in self.KO_META[meta_chunk]:
-                if fid in self.KO_META[meta_chunk][data_suffix]:
-                    return self.KO_META[meta_chunk][data_suffix][fid]
+    async def get_all(self, data_suffix = None, parallel = None, ordered = True, batch_size = 500, output = "view"):
+        """get_all(String:data_suffix = None, Int:parallel = None, ...)
 
-        return None
+            Iterates through all of the table's database entries with
+                `async for`, the documents are read batch_size at a
+                time on the thread pool, see KoDB.get_all."""
+        self.database.ko_check_open()
+        documents = await self.ko_run(self.database.get_all, data_suffix, parallel, ordered, batch_size, output)
+        while True:
+            batch = await self.ko_run(list, itertools.islice(documents, batch_size))
+            if not batch:
+                return
+            for document in batch:
+                yield document
 
 
-    def items(self, data_suffix = None):
-        """items(String:fid, String:data_suffix = None)
+    async def query(self, search_func, data_suffix = None, parallel = None, ordered = True, batch_size = 500,
+                    limit = None, offset = 0, order_by = None, output = "view"):
+        """query(Function:search_function, String:data_suffix = None, ...)
 
-            Returns a list of the table's IDs
-            Options:
-                data_suffix = String:None
-                    > The data suffix (table) on where to retrieve the document.
-                        (Retrieves the default database if unspecified)
-                        (***NOTE: This option is usually handled 
-                                by the KO_Table Object.***)"""
-        data_filter = data_suffix if data_suffix is not None else self.KO_DATA_SUFFIX
-        meta = []
-        for meta_chunk in self.KO_META:
-            meta.extend(meta_chunk[data_filter].keys())
-        return meta
+            Returns a list of the items that matches the search_function,
+                see KoDB.query."""
+        self.database.ko_check_open()
+        cursor = self.database.query(search_func, data_suffix, parallel, ordered, batch_size, limit, offset, order_by,
+                                     output)
+        return await self.ko_run(list, cursor)
 
 
-    def tables(self):
-        """tables()
+    async def close(self):
+        """close()
 
-            Returns a list of the database tables."""
-        return self.KO_CONFIG["tables"]
+            Closes the database and its thread pool, see KoDB.close."""
+        if self.database.KO_CLOSED:
+            return
+        await self.ko_run(self.database.close)
+        self.executor.shutdown()
 
 
-class Ko_Table(object):
-    """KoDB's Table Object"""
-    def __init__(self, table_name, database):
-        self.table_name = table_name
-        self.database = database
-        self.attr = None
 
+class Ko_Document(dict):
+    """KoDB's Document View
 
-    def KO_attr_processor(self, *args):
-        args = list(args)
-        args.append(self.table_name)
-        args = tuple(args)
+        A read-only dict of a document with its id as _id, so it still
+            passes isinstance(doc, dict) and json.dumps(). Fields are also
+            attributes, missing ones are None. copy() returns a mutable Map."""
+    __slots__ = ("ko_data", "ko_id")
 
-        return getattr(self.database, self.attr)(*args)
+    def __init__(self, data, fid):
+        dict.__init__(self, data)
+        dict.__setitem__(self, "_id", fid)
+        # The decoded document shared with the cache, stored back as is
+        object.__setattr__(self, "ko_data", data)
+        object.__setattr__(self, "ko_id", fid)
 
+    def ko_read_only(self, *args, **kwargs):
+        """INTERNAL FUNCTION"""
+        raise TypeError("Documents are read-only, use copy() for a mutable copy")
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = ko_read_only
+    clear = pop = popitem = setdefault = update = __ior__ = ko_read_only
 
     def __getattr__(self, attr):
-        self.attr = attr
-        return self.KO_attr_processor
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return self.get(attr)
 
+    def __reduce__(self):
+        return Ko_Document, (self.ko_data, self.ko_id)
 
+    def __copy__(self):
+        return self.copy()
 
-class Map(dict):
-    def __init__(self, *args, **kwargs):
-        super(Map, self).__init__(*args, **kwargs)
-        for arg in args:
-            if isinstance(arg, dict):
-                for k, v in arg.items():
-                    self[k] = v
+    def copy(self):
+        """Returns a mutable (shallow) copy of the document."""
+        return Map(self)
+
+
+OUTPUTS = ("view", "dict", "raw")
+
+def ko_check_output(output):
+    """INTERNAL FUNCTION"""
+    if output not in OUTPUTS:
+        raise ValueError("Unknown output: {}".format(output))
+
+
+def ko_output(fid, data, output):
+    """INTERNAL FUNCTION
 
-        if kwargs:
-            for k, v in kwargs.items():
-                self[k] = v
+        Returns a decoded document as a view or a plain dict."""
+    if output == "view":
+        return Ko_Document(data, fid)
+    data = dict(data)
+    data["_id"] = fid
+    return data
+
+
+
+class Map(dict):
+    """A dict whose keys are also attributes, missing ones are None."""
+    __slots__ = ()
 
     def __getattr__(self, attr):
-        try:
-            return self.get(attr)
-        except:
-            return None
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return self.get(attr)
 
     def __setattr__(self, key, value):
-        self.__setitem__(key, value)
-
-    def __setitem__(self, key, value):
-        super(Map, self).__setitem__(key, value)
-        self.__dict__.update({key: value})
+        self[key] = value
 
     def __delattr__(self, item):
-        self.__delitem__(item)
-
-    def __delitem__(self, key):
-        super(Map, self).__delitem__(key)
-        del self.__dict__[key]
\ No newline at end of file
+        del self[item]
@@ -0,0 +1,80 @@
+"""KoDB's Command Line
+
+    Bulk imports and exports JSON Lines files and backs up databases,
+        printing the throughput when done.
+    ex.: python -m kodb import ko-test.db posts.jsonl --table posts --id-field id
+         python -m kodb export ko-test.db posts.jsonl --table posts
+         python -m kodb backup ko-test.db ko-test.db.bak"""
+import argparse
+import os
+import sys
+import time
+
+import kodb
+
+
+def report(action, count, seconds):
+    """INTERNAL FUNCTION"""
+    rate = count / seconds if seconds else float("inf")
+    print("[KoDB] {} {} documents in {:.2f}s ({:.0f} documents/s)".format(action, count, seconds, rate))
+
+
+def progress(done, total):
+    """INTERNAL FUNCTION"""
+    if total is None:
+        print("\r[KoDB] {} documents".format(done), end="", file=sys.stderr, flush=True)
+    else:
+        print("\r[KoDB] {}/{} documents".format(done, total), end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m kodb", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--quiet", action="store_true", help="doesn't print the progress")
+
+    command = commands.add_parser("import", parents=[common], help="stores the documents of a JSON Lines file")
+    command.add_argument("database")
+    command.add_argument("path", help="the JSON Lines file, a json object per line")
+    command.add_argument("--table", default=None, help="the table to store in (default: the default table)")
+    command.add_argument("--id-field", default="_id", help="the field holding the document ids (default: _id)")
+    command.add_argument("--batch-size", type=int, default=kodb.BULK_BATCH,
+                         help="documents written at a time (default: {})".format(kodb.BULK_BATCH))
+
+    command = commands.add_parser("export", parents=[common], help="writes a table to a JSON Lines file")
+    command.add_argument("database")
+    command.add_argument("path", help="the JSON Lines file, replaced if it exists")
+    command.add_argument("--table", default=None, help="the table to export (default: the default table)")
+
+    command = commands.add_parser("backup", parents=[common],
+                                  help="copies the database to a new, compacted database folder")
+    command.add_argument("database")
+    command.add_argument("destination", help="the folder of the copy, it must not exist")
+    command.add_argument("--batch-size", type=int, default=kodb.BULK_BATCH,
+                         help="documents copied per hold of the write lock (default: {})".format(kodb.BULK_BATCH))
+
+    args = parser.parse_args(argv)
+
+    if os.path.exists(os.path.join(args.database, kodb.SHARDS_FILE)):
+        db = kodb.Ko_ShardedDB(args.database)
+    else:
+        db = kodb.KoDB(args.database)
+    then = time.perf_counter()
+    try:
+        if args.command == "import":
+            count = db.import_jsonl(args.path, args.table, args.id_field, args.batch_size,
+                                    None if args.quiet else progress)
+        elif args.command == "export":
+            count = db.export_jsonl(args.path, args.table)
+        else:
+            count = db.backup(args.destination, None if args.quiet else progress, args.batch_size)
+    finally:
+        db.close()
+    if not args.quiet and args.command != "export":
+        print(file=sys.stderr)
+    report({"import": "imported", "export": "exported", "backup": "backed up"}[args.command], count,
+           time.perf_counter() - then)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""KoDB's Benchmark Suite
+
+    Runs offline against synthetic documents and prints the results as
+        json, so runs of different versions can be compared.
+    ex.: python -m kodb.bench --sizes 1000,10000 --output after.json
+         python -m kodb.bench --compare before.json after.json"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+import kodb
+
+SHAPES = ("flat", "nested", "text")
+WORDS = ["".join(random.Random(x).choice(string.ascii_lowercase) for _ in range(3 + x % 7)) for x in range(0, 512)]
+
+
+def make_document(rng, shape, size, number):
+    """make_document(Random:rng, String:shape, Int:size, Int:number)
+
+        Returns a synthetic document of roughly size bytes.
+        Options:
+            shape = String:required
+                > flat has scalar fields, nested has sub-documents and
+                    lists and text is mostly a long string field."""
+    text = " ".join(rng.choice(WORDS) for _ in range(0, max(size // 6, 1)))
+    if shape == "flat":
+        document = {"number": number, "group": number % 10, "score": rng.random(), "active": number % 2 == 0}
+        for field in range(0, max(size // 24, 1)):
+            document["field{}".format(field)] = rng.choice(WORDS)
+        return document
+    if shape == "nested":
+        return {"number": number, "group": number % 10,
+                "user": {"name": rng.choice(WORDS), "address": {"city": rng.choice(WORDS), "zip": rng.randint(0, 99999)}},
+                "tags": [rng.choice(WORDS) for _ in range(0, 5)],
+                "items": [{"sku": rng.randint(0, 10000), "note": text[:size // 8]} for _ in range(0, 4)]}
+    if shape == "text":
+        return {"number": number, "group": number % 10, "title": rng.choice(WORDS), "body": text}
+    raise ValueError("Unknown shape: {}".format(shape))
+
+
+def folder_size(path):
+    """INTERNAL FUNCTION"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def timed(results, name, function, operations=1):
+    """INTERNAL FUNCTION
+
+        Runs function once and records its time and throughput."""
+    then = time.perf_counter()
+    value = function()
+    seconds = time.perf_counter() - then
+    results[name] = {"seconds": seconds, "operations": operations,
+                     "ops_per_sec": operations / seconds if seconds else None}
+    return value
+
+
+def run_size(directory, size, options):
+    """run_size(String:directory, Int:size, Dict:options)
+
+        Benchmarks a fresh database of size documents, returns the
+            metrics and the on-disk size."""
+    rng = random.Random(options["seed"])
+    documents = [make_document(rng, options["shape"], options["doc_size"], x) for x in range(0, size)]
+    ids = ["{}".format(x) for x in range(0, size)]
+    sample = rng.sample(ids, min(options["sample"], size))
+    missing = ["missing-{}".format(x) for x in range(0, len(sample))]
+    db_options = {key: options[key] for key in ("codec", "compression") if options[key] is not None}
+    db_options["mmap"] = options["read_path"] == "mmap"
+    path = os.path.join(directory, "bench-{}.db".format(size))
+    results = {}
+
+    db = kodb.KoDB(path, **db_options)
+    commit_count = min(options["commit_sample"], size)
+    commit_table = db.table("bench_commit")
+    timed(results, "store_commit",
+          lambda: [commit_table.store(ids[x], documents[x]) for x in range(0, commit_count)], commit_count)
+    db.drop_table("bench_commit")
+    batch_table = db.table("bench_batch")
+
+    def store_batch():
+        with db.batch():
+            for x in range(0, commit_count):
+                batch_table.store(ids[x], documents[x])
+    timed(results, "store_batch", store_batch, commit_count)
+    db.drop_table("bench_batch")
+    db.KO_NO_COMMIT = True
+
+    def store_all():
+        for fid, document in zip(ids, documents):
+            db.store(fid, document)
+        db.commit()
+    timed(results, "store_no_commit", store_all, size)
+    db.close()
+
+    db = timed(results, "open", lambda: kodb.KoDB(path, mmap=db_options["mmap"]), 1)
+    timed(results, "get_cold", lambda: [db.get(fid) for fid in sample], len(sample))
+    timed(results, "get_hot", lambda: [db.get(fid) for fid in sample], len(sample))
+    timed(results, "exists_hit", lambda: [db.exists(fid) for fid in sample], len(sample))
+    timed(results, "exists_miss", lambda: [db.exists(fid) for fid in missing], len(missing))
+    db.close()
+
+    db = kodb.KoDB(path, mmap=db_options["mmap"])
+    timed(results, "get_all", lambda: sum(1 for _ in db.get_all()), size)
+    timed(results, "query", lambda: db.query(lambda x: x.group == 3).count(), size)
+    timed(results, "query_limit", lambda: list(db.query(lambda x: x.group == 3, limit=10)), 10)
+    db.close()
+    disk_bytes = folder_size(path)
+
+    db = kodb.KoDB(path, mmap=db_options["mmap"])
+    timed(results, "group_by", lambda: db.group_by("group"), size)
+    timed(results, "create_column", lambda: db.create_index("number", kind="column"), size)
+    db.create_index("group", kind="column")
+    timed(results, "group_by_column", lambda: db.group_by("group", "sum", of="number"), size)
+    timed(results, "sum_column", lambda: db.sum("number", where={"group": {"$lt": 5}}), size)
+    db.close()
+
+    return {"size": size, "disk_bytes": disk_bytes, "metrics": results}
+
+
+def run(options):
+    """run(Dict:options)
+
+        Runs the suite for every database size, returns the report."""
+    directory = options["directory"] or tempfile.mkdtemp(prefix="kodb-bench-")
+    try:
+        runs = []
+        for size in options["sizes"]:
+            runs.append(run_size(directory, size, options))
+            print("[KoDB bench] {} documents done".format(size), file=sys.stderr)
+    finally:
+        if options["directory"] is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "options": {key: value for key, value in options.items() if key != "directory"},
+            "runs": runs}
+
+
+def compare(before, after):
+    """compare(Dict:before, Dict:after)
+
+        Returns lines of after's time relative to before's for every
+            size and metric both reports have, lower is faster."""
+    lines = []
+    previous = {run["size"]: run for run in before["runs"]}
+    for run in after["runs"]:
+        if run["size"] not in previous:
+            continue
+        old = previous[run["size"]]
+        for name, metric in sorted(run["metrics"].items()):
+            if name in old["metrics"] and old["metrics"][name]["seconds"]:
+                lines.append("{:>10} {:<16} {:>8.3f}x".format(run["size"], name,
+                                                             metric["seconds"] / old["metrics"][name]["seconds"]))
+        if old["disk_bytes"]:
+            lines.append("{:>10} {:<16} {:>8.3f}x".format(run["size"], "disk_bytes",
+                                                         run["disk_bytes"] / old["disk_bytes"]))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m kodb.bench", description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma separated database sizes (default: 1000,10000)")
+    parser.add_argument("--shape", default="flat", choices=SHAPES, help="document shape (default: flat)")
+    parser.add_argument("--doc-size", type=int, default=256, help="approximate document size in bytes")
+    parser.add_argument("--sample", type=int, default=1000, help="ids looked up by the get/exists benchmarks")
+    parser.add_argument("--commit-sample", type=int, default=200,
+                        help="documents stored with a commit each (default: 200)")
+    parser.add_argument("--codec", default=None, help="database codec")
+    parser.add_argument("--compression", default=None, help="database compression")
+    parser.add_argument("--read-path", default="mmap", choices=("mmap", "file"),
+                        help="reads documents from a memory map or a file handle (default: mmap)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=None, help="keeps the databases in this folder")
+    parser.add_argument("--output", default=None, help="writes the json report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compares two json reports instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as f:
+                reports.append(json.load(f))
+        print("\n".join(compare(*reports)))
+        return
+
+    options = {"sizes": [int(x) for x in args.sizes.split(",")], "shape": args.shape, "doc_size": args.doc_size,
+               "sample": args.sample, "commit_sample": args.commit_sample, "codec": args.codec,
+               "compression": args.compression, "read_path": args.read_path, "seed": args.seed,
+               "directory": args.directory}
+    report = json.dumps(run(options), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,9 @@ import requests
 import cProfile
 import glob
 import shutil
+import time
+import json
+import datetime
 
 # remove existing files
 try:
@@ -44,6 +47,23 @@ for post in posts:
 assert len(pdb.items()) > 0
 print("OK - Table Data Population Test")
 
+# the post ids are numbers, they're kept as their string
+assert pdb.get(1).id == 1 and pdb.get("1")._id == "1" and 1 in pdb.items()
+assert all(pdb.get(x) is not None for x in pdb.items()) and pdb.items()[0] == "1"
+assert len(list(pdb.scan(output="view"))) == len(posts)
+print("OK - Number Id Test")
+
+# documents are read-only dicts
+post = pdb.get(1)
+assert isinstance(post, dict) and json.loads(json.dumps(post))["_id"] == "1"
+try:
+	post["title"] = "changed"
+	assert False
+except TypeError:
+	pass
+assert pdb.get(1).title == posts[0]["title"]
+print("OK - Document Dict Test")
+
 class TestClass(object):
 	"""docstring for TestClass"""
 	def __init__(self, arg):
@@ -67,6 +87,7 @@ print(db.items())
 assert len(db.items()) > 0
 print("OK - [Data Check] Recreation Test")
 
+pdb = db.table("posts")
 # print(pdb.items())
 assert len(pdb.items()) > 0
 print("OK - [Table Data Check] Recreation Test")
@@ -90,9 +111,154 @@ print("OK - [Object] Recreation Test")
 result = pdb.query(lambda x: "eius" in x.title)
 assert len(result) > 0
 print("OK -  Search Test")
+
+result = list(pdb.query(lambda x: x.userId < 5, limit=3, offset=1, order_by="-id"))
+assert [x.id for x in result] == [39, 38, 37]
+print("OK - Query Cursor Test")
 # print(result)
 
-import time
+pdb.create_index("userId")
+result = pdb.find(userId=7)
+assert len(result) > 0 and all(x.userId == 7 for x in result)
+print("OK - Index Search Test")
+
+counts = pdb.group_by("userId")
+pdb.create_index("id", kind="column")
+assert pdb.group_by("userId") == counts and pdb.count({"userId": 7}) == counts[7]
+assert pdb.sum("id", where={"userId": 1}) == sum(x.id for x in pdb.find(userId=1))
+assert pdb.max("id") == max(x["id"] for x in pdb.select(["id"]))
+print("OK - Aggregation Test")
+
+# indexed dates are still dates once the journals are reloaded
+try:
+	shutil.rmtree("ko-dates.db")
+except:
+	pass
+dates_db = kodb.KoDB("ko-dates.db")
+events = dates_db.table("events")
+events.create_index("day", kind="sorted")
+events.create_index("at", kind="column")
+for x in range(10):
+	events.store(x, {"day": datetime.date(2020, 1, 1 + x % 5), "at": datetime.date(2021, 1, 1 + x)})
+dates_db.close()
+dates_db = kodb.KoDB("ko-dates.db")
+events = dates_db.table("events")
+assert [x._id for x in events.find(day=datetime.date(2020, 1, 1))] == ["0", "5"]
+assert len(events.find(day={"$gte": datetime.date(2020, 1, 4)})) == 4
+assert events.max("at") == datetime.date(2021, 1, 10)
+assert events.group_by("day")[datetime.date(2020, 1, 2)] == 2
+assert {x["at"] for x in events.select(["at"])} == {datetime.date(2021, 1, 1 + x) for x in range(10)}
+dates_db.close()
+shutil.rmtree("ko-dates.db")
+print("OK - Reopened Index Test")
+
+db.compact()
+assert test_table.get("abc").value == "Wilfred"
+assert len(pdb.items()) > 0
+print("OK - Compaction Test")
+
+shutil.rmtree("ko-backup.db", ignore_errors=True)
+assert pdb.export_jsonl("ko-posts.jsonl") == len(pdb.items())
+assert db.import_jsonl("ko-posts.jsonl", "imported") == len(pdb.items())
+assert dict(db.table("imported").get("1")) == dict(pdb.get("1"))
+db.backup("ko-backup.db")
+backup_db = kodb.KoDB("ko-backup.db")
+assert backup_db.table("posts").get("1") == pdb.get("1") and backup_db.table("posts").indexes() == pdb.indexes()
+backup_db.close()
+os.remove("ko-posts.jsonl")
+print("OK - Import Export Backup Test")
+
+test_table.store("deleted", {"value": "Nelson"})
+assert test_table.delete("deleted") and test_table.get("deleted") is None
+assert "deleted" not in test_table.items() and test_table.dead_space() > 0
+drop_table = db.table("dropped")
+drop_table.store_many(("{}".format(x), {"value": x}) for x in range(0, 100))
+assert drop_table.delete_many(["0", "1", "missing"]) == 2
+db.drop_table("dropped")
+assert "dropped" not in db.tables() and drop_table.items() == []
+print("OK - Delete Test")
+
+history_table = db.table("history")
+history_table.store("1", {"title": "first"})
+snapshot = db.snapshot()
+history_table.store("1", {"title": "second"})
+history_table.delete("1")
+assert [x["version"] for x in history_table.history("1")] == [3, 2, 1]
+assert history_table.get("1") is None and history_table.get("1", version=2).title == "second"
+assert history_table.get("1", as_of=snapshot).title == "first"
+assert snapshot.table("history").get("1").title == "first"
+snapshot.close()
+print("OK - History Test")
+
+scan_table = db.table("scan")
+for x in range(0, 30): scan_table.store("user:{:02d}".format(x), {"value": x})
+assert list(scan_table.scan(prefix="user:1")) == ["user:{}".format(x) for x in range(10, 20)]
+assert list(scan_table.scan(start="user:05", end="user:08", reverse=True)) == ["user:07", "user:06", "user:05"]
+assert [x.value for x in scan_table.scan(prefix="user:2", limit=2, output="view")] == [20, 21]
+assert len(scan_table.items()) == 30 and "user:00" in scan_table.items()
+print("OK - Scan Test")
+
+shutil.rmtree("ko-sharded.db", ignore_errors=True)
+sharded_db = kodb.Ko_ShardedDB("ko-sharded.db", shards=4)
+sharded_posts = sharded_db.table("posts")
+sharded_posts.store_many(("{}".format(post["id"]), post) for post in posts)
+assert len(sharded_posts.items()) == len(posts) and sharded_posts.get("1").id == 1
+assert [x.id for x in sharded_posts.query(lambda x: x.userId < 5, limit=3, offset=1, order_by="-id")] == [39, 38, 37]
+sharded_db.close()
+try:
+	kodb.KoDB("ko-sharded.db")
+	assert False
+except ValueError:
+	pass
+print("OK - Sharded Test")
+
+shutil.rmtree("ko-mapped.db", ignore_errors=True)
+mapped_db = kodb.KoDB("ko-mapped.db")
+mapped_db.store_many(("{}".format(post["id"]), post) for post in posts)
+try:
+	kodb.KoDB("ko-mapped.db", mmap=False)
+	raise AssertionError("opened twice")
+except ValueError:
+	pass
+mapped = [dict(mapped_db.get("{}".format(post["id"]))) for post in posts]
+assert isinstance(next(mapped_db.get_all(output="raw")), bytes)
+mapped_db.close()
+for closed in (lambda: mapped_db.store("closed", {"value": 1}), lambda: mapped_db.get("1")):
+	try:
+		closed()
+		raise AssertionError("used after close")
+	except ValueError:
+		pass
+file_db = kodb.KoDB("ko-mapped.db", mmap=False)
+assert [dict(file_db.get("{}".format(post["id"]))) for post in posts] == mapped
+assert file_db.get("closed") is None
+file_db.close()
+print("OK - Mapped Read Test")
+
+then = time.time()
+for x in range(0, 100000): test_table.get("missing-{}".format(x))
+now = time.time()
+print("[KoDB] 100k missing gets:\t\t {}".format(now-then))
+assert db.lookup_stats()["short_circuits"] >= 100000
+print("OK - Negative Lookup Test")
+
+# the searches above cached some posts, the budget only applies to new entries
+db.KO_CACHE.drop("posts")
+db.KO_CACHE.max_entries = 10
+db.load_to_memory("posts")
+assert db.cache_stats()["tables"]["posts"]["entries"] <= 10
+db.KO_CACHE.max_entries = None
+print("OK - Cache Budget Test")
+
+shutil.rmtree("ko-metrics.db", ignore_errors=True)
+metrics_db = kodb.KoDB("ko-metrics.db", metrics=True)
+metrics_db.store("1", {"value": 1})
+metrics_db.get("1")
+stats = metrics_db.stats()
+assert stats["operations"]["store"]["count"] == 1 and stats["counters"]["bytes_written"] > 0
+metrics_db.close()
+print("OK - Metrics Test")
+
 import matplotlib.pyplot as plt
 
 tarr = []
@@ -116,6 +282,150 @@ now = time.time()
 print("[KoDB] No commit-on-store:\t\t {}".format(now-then))
 db.commit()
 
+db.KO_NO_COMMIT = False
+then = time.time()
+test_table.store_many(("{}".format(x), {"value": "The quick brown fox jumps over the lazy dog."}) for x in range(10000, 15000))
+now = time.time()
+print("[KoDB] Batch store:\t\t\t {}".format(now-then))
+assert all(test_table.exists_many(["10000", "14999"]))
+assert [x.value for x in test_table.get_many(["10000", "missing"])[:1]] == ["The quick brown fox jumps over the lazy dog."]
+print("OK - Batch API Test")
+
+then = time.time()
+with db.batch():
+	for x in range(15000, 20000): test_table.store("{}".format(x), {"value": "The quick brown fox jumps over the lazy dog."})
+now = time.time()
+print("[KoDB] Batched store:\t\t\t {}".format(now-then))
+assert db.stats()["pending"]["documents"] == 0
+
+try:
+	shutil.rmtree("ko-buffer-test.db")
+except:
+	pass
+
+buffer_db = kodb.KoDB("ko-buffer-test.db", flush_documents=10)
+for x in range(0, 25): buffer_db.store("{}".format(x), {"value": x})
+assert buffer_db.stats()["flushes"]["reasons"] == {"documents": 2}
+assert buffer_db.stats()["pending"]["documents"] == 5
+buffer_db.close()
+buffer_db = kodb.KoDB("ko-buffer-test.db")
+assert len(buffer_db.items()) == 25
+buffer_db.close()
+print("OK - Write Buffer Test")
+
+try:
+	shutil.rmtree("ko-wal-test.db")
+except:
+	pass
+
+wal_db = kodb.KoDB("ko-wal-test.db", wal=True)
+then = time.time()
+for x in range(0, 5000): wal_db.store("{}".format(x), {"value": "The quick brown fox jumps over the lazy dog."})
+now = time.time()
+print("[KoDB] Write-ahead log store:\t\t {}".format(now-then))
+wal_db.close()
+
+wal_db = kodb.KoDB("ko-wal-test.db", wal=True)
+assert len(wal_db.items()) == 5000
+print("OK - Write-ahead Log Recovery Test")
+wal_db.close()
+
+import subprocess
+import sys
+
+# a crash leaves the log behind, an open without the log still replays it
+subprocess.check_call([sys.executable, "-c", "import os, kodb\n"
+	"wal_db = kodb.KoDB('ko-wal-test.db', wal=True, wal_sync_ops=1)\n"
+	"wal_db.store('crashed', {'value': 'old'})\n"
+	"os._exit(0)"], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+wal_db = kodb.KoDB("ko-wal-test.db")
+assert wal_db.get("crashed").value == "old"
+wal_db.store("crashed", {"value": "newer"})
+wal_db.close()
+wal_db = kodb.KoDB("ko-wal-test.db", wal=True)
+assert wal_db.get("crashed").value == "newer"
+wal_db.close()
+print("OK - Write-ahead Log Plain Open Test")
+
+import asyncio
+
+try:
+	shutil.rmtree("ko-async-test.db")
+except:
+	pass
+
+async def async_test():
+	async_db = kodb.AsyncKoDB("ko-async-test.db")
+	async_table = async_db.table("async")
+	then = time.time()
+	await asyncio.gather(*(async_table.store("{}".format(x), {"value": "The quick brown fox jumps over the lazy dog."}) for x in range(0, 5000)))
+	now = time.time()
+	print("[KoDB] Async concurrent store:\t\t {}".format(now-then))
+	assert (await async_table.get("42")).value == "The quick brown fox jumps over the lazy dog."
+	assert len([item async for item in async_table.get_all()]) == 5000
+	assert len(await async_table.query(lambda x: x._id == "42")) == 1
+	await async_db.close()
+
+asyncio.run(async_test())
+print("OK - Async API Test")
+
+for codec in sorted(kodb.CODECS):
+	try:
+		shutil.rmtree("ko-codec-test.db")
+	except:
+		pass
+
+	codec_db = kodb.KoDB("ko-codec-test.db", codec=codec, no_commit=True, load_type="load")
+	then = time.time()
+	try:
+		for post in posts * 50: codec_db.store("{}".format(len(codec_db.KO_COMMIT_CACHE)), post)
+		codec_db.commit()
+	except ImportError:
+		print("[KoDB] {} codec:\t\t\t unavailable".format(codec))
+		codec_db.close()
+		continue
+	now = time.time()
+	print("[KoDB] {} codec store:\t\t {}".format(codec, now-then))
+	codec_db.close()
+
+	codec_db = kodb.KoDB("ko-codec-test.db", load_type="load")
+	then = time.time()
+	for x in range(0, 1000): codec_db.get("{}".format(x))
+	now = time.time()
+	print("[KoDB] {} codec get:\t\t {}".format(codec, now-then))
+	then = time.time()
+	x = [item for item in codec_db.get_all()]
+	now = time.time()
+	print("[KoDB] {} codec get_all:\t\t {}".format(codec, now-then))
+	codec_db.close()
+
+logs = [{"level": "INFO", "user": x % 10, "event": "login"} for x in range(0, 100)]
+compressions = [("stored", {}), ("deflate", {}), ("deflate", {"compression_level": 9}),
+				("deflate", {"compression_dict": True}), ("bzip2", {}), ("lzma", {})]
+for shape, documents in (("posts", posts), ("users", users), ("logs", logs)):
+	for compression, options in compressions:
+		try:
+			shutil.rmtree("ko-compression-test.db")
+		except:
+			pass
+
+		name = "+".join([compression] + ["{}={}".format(k.split("_")[-1], v) for k, v in options.items()])
+		compression_db = kodb.KoDB("ko-compression-test.db", no_commit=True)
+		compression_table = compression_db.table(shape, compression=compression, **options)
+		then = time.time()
+		for x in range(0, 5000): compression_table.store(x, documents[x % len(documents)])
+		compression_db.commit()
+		now = time.time()
+		size = sum(info.compress_size for info in compression_db.KO_ZIP.infolist())
+		print("[KoDB] {} {} store:\t {}\t {} bytes".format(shape, name, now-then, size))
+		then = time.time()
+		x = [item for item in compression_table.get_all()]
+		now = time.time()
+		assert len(x) == 5000
+		print("[KoDB] {} {} get_all:\t {}".format(shape, name, now-then))
+		compression_db.close()
+print("OK - Compression Test")
+
 then = time.time()
 db.KO_NO_COMMIT = True
 x = []
@@ -123,8 +433,72 @@ for item in test_table.get_all(): x.append(item)
 now = time.time()
 print("[KoDB] Entire Database traversal:\t {}".format(now-then))
 
+then = time.time()
+x = [item for item in test_table.get_all(parallel=os.cpu_count())]
+now = time.time()
+print("[KoDB] Parallel Database traversal:\t {}".format(now-then))
+
+import itertools
+import tracemalloc
+
+for output in ("view", "dict", "raw"):
+	then = time.time()
+	x = [item for item in test_table.get_all(output=output)]
+	now = time.time()
+	print("[KoDB] {} traversal:\t\t\t {}".format(output, now-then))
+
+	x = None
+	tracemalloc.start()
+	x = [item for item in itertools.islice(test_table.get_all(output=output), 1000)]
+	allocated, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print("[KoDB] {} allocations (1000 docs):\t {} bytes".format(output, allocated))
+
+import threading
+
+def read_documents():
+	for x in range(0, 2000): test_table.get("{}".format(x))
+
+db.KO_CACHE.max_entries = 1
+for threads in (1, 2, 4, 8):
+	workers = [threading.Thread(target=read_documents) for t in range(threads)]
+	then = time.time()
+	for worker in workers: worker.start()
+	for worker in workers: worker.join()
+	now = time.time()
+	print("[KoDB] {} thread reads:\t\t\t {} docs/s".format(threads, int(threads * 2000 / (now-then))))
+db.KO_CACHE.max_entries = None
+
 db.KO_NO_COMMIT = False
 
+try:
+	shutil.rmtree("ko-index-test.db")
+except:
+	pass
+
+idx_db = kodb.KoDB("ko-index-test.db", no_commit=True)
+total = 0
+for size in (10000, 100000, 1000000):
+	for x in range(total, size): idx_db.store_meta("{}".format(x), "uid")
+	total = size
+	then = time.time()
+	for x in range(0, 10000): idx_db.exists("{}".format(x * (size // 10000)))
+	now = time.time()
+	print("[KoDB] exists() @ {} documents:\t {}".format(size, (now-then) / 10000))
+idx_db.store("document", {"value": "The quick brown fox jumps over the lazy dog."})
+idx_db.commit()
+idx_db.close()
+
+for startup in ("meta chunk scan", "manifest"):
+	if startup == "meta chunk scan":
+		os.remove(os.path.join("ko-index-test.db", "ko-index-test.db.KO_MANIFEST"))
+	then = time.time()
+	idx_db = kodb.KoDB("ko-index-test.db")
+	assert idx_db.get("document") is not None
+	now = time.time()
+	print("[KoDB] Time to first get ({}):\t {}".format(startup, now-then))
+	idx_db.close()
+
 def test():
 	for x in range(0, 10000): test_table.store("{}".format(x), {"value": "The quick brown fox jumps over the lazy dog."})
 